@@ -0,0 +1,77 @@
+from typing import Dict, List
+
+# Permissions are permission resources as returned by permissions.list with the fields in
+# ArgParser._permission_fields.  Only 'user' permissions are reconciled; domain, group and anyone permissions are
+# left alone.
+
+# Roles that already let a user upload into a folder, so granting 'writer' would change nothing.
+_upload_roles = ("writer", "fileOrganizer", "organizer", "owner")
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def _inherited(permission: Dict) -> bool:
+    # Shared drive permissions granted on a parent (or the drive) can't be removed from the folder itself.
+    details = permission.get('permissionDetails', [])
+    return len(details) > 0 and all(d.get('inherited') for d in details)
+
+
+class AclPlan:
+    """Permission changes that give the users of a mapping write access to their upload folders."""
+
+    def __init__(self):
+        # (folder ID, user email)
+        self.grants = []
+        # (folder ID, permission)
+        self.revocations = []
+        # Number of (folder, user) pairs of the mapping that already have access.
+        self.unchanged = 0
+
+    def __len__(self) -> int:
+        return len(self.grants) + len(self.revocations)
+
+
+def diff_acls(desired: Dict, current: Dict, keep: set = frozenset()) -> AclPlan:
+    """Plans the grants and revocations that make the users with write access to each folder match desired.
+
+    desired maps folder IDs to the emails that should be able to upload to them, current maps the same folder IDs
+    to their permissions.  Writers in keep (e.g. users with access to the parent of the upload folders) and
+    inherited permissions are never revoked, and only the 'writer' role this tool grants is ever revoked.
+    """
+    keep = {normalize_email(e) for e in keep}
+    plan = AclPlan()
+    for folder_id, users in desired.items():
+        permissions = [p for p in current.get(folder_id, []) if p.get('type') == "user" and 'emailAddress' in p]
+        with_access = {normalize_email(p['emailAddress']) for p in permissions if p.get('role') in _upload_roles}
+        wanted = {normalize_email(u) for u in users}
+        for user in sorted(wanted):
+            if user in with_access:
+                plan.unchanged += 1
+            else:
+                plan.grants.append((folder_id, user))
+        for p in permissions:
+            email = normalize_email(p['emailAddress'])
+            if p.get('role') == "writer" and email not in wanted and email not in keep and not _inherited(p):
+                plan.revocations.append((folder_id, p))
+    return plan
+
+
+def uploaders(permissions: List) -> set:
+    """Emails of the users the permissions let upload, readers and commenters are left out."""
+    return {normalize_email(p['emailAddress']) for p in permissions
+            if p.get('type') == "user" and 'emailAddress' in p and p.get('role') in _upload_roles}
+
+
+def naive_calls(desired: Dict) -> int:
+    """Calls used by sharing every folder of the mapping again without looking at its permissions."""
+    return sum(len(users) for users in desired.values())
+
+
+def describe(plan: AclPlan, names: Dict) -> List:
+    """One line per change, names maps folder IDs to folder names."""
+    lines = [f"grant   {user} on {names.get(folder_id, folder_id)}" for folder_id, user in plan.grants]
+    lines.extend(f"revoke  {p['emailAddress']} on {names.get(folder_id, folder_id)}"
+                 for folder_id, p in plan.revocations)
+    return lines
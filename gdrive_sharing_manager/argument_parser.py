@@ -1,10 +1,18 @@
 from argparse import ArgumentParser
 from abc import ABC, abstractmethod
 from typing import List, Dict
+from collections import Counter, defaultdict
 from pathlib import Path
 from googleapiclient.errors import HttpError
+from gdrive_sharing_manager.throttle import RequestGovernor
+from gdrive_sharing_manager.diff import diff_trees, normalize_name, MergePlan
+from gdrive_sharing_manager.acl import AclPlan
+from gdrive_sharing_manager.filters import FileFilter, FolderFilter
+from gdrive_sharing_manager.tree import FolderNode, FileNode
 import logging
 import json
+import threading
+import time
 
 
 class ArgParser(ABC):
@@ -12,40 +20,162 @@ class ArgParser(ABC):
     # When changing SCOPES, the token needs to be recreated.
     _SCOPES = ['https://www.googleapis.com/auth/drive']
 
-    _token = None
-    _creds = None
-
     _folder_mimetype = "application/vnd.google-apps.folder"
 
+    # Partial response used by the crawlers; only these fields are consumed downstream.
+    _list_fields = "nextPageToken, files(id, name, mimeType, parents, md5Checksum, size, " \
+                   "capabilities/canMoveItemWithinDrive)"
+    _page_size = 1000
+    _permission_fields = "nextPageToken, permissions(id, type, role, emailAddress, permissionDetails)"
+    _change_fields = "nextPageToken, newStartPageToken, " \
+                     "changes(fileId, removed, file(id, name, mimeType, parents, trashed, size, createdTime, " \
+                     "modifiedTime, capabilities/canMoveItemWithinDrive))"
+
+    # Share of the folders of a shared drive that a crawled folder must contain for the 'auto' crawl to list the
+    # whole drive at once instead of folder by folder.
+    _flat_share = 0.5
+
+    # Drive accepts at most 100 calls in a single batch request.
+    _max_batch_size = 100
+    _batch_size = 100
+    _pending_copies = []
+    # Number of copies that failed, so callers can tell whether a merge was complete.
+    _failed_copies = 0
+    _failed_copies_lock = threading.Lock()
+    # With --move, files are reparented instead of copied wherever Drive allows it, set by merge.
+    _move = False
+    _moved_files = 0
+    # Files that could not be moved and were copied instead.
+    _move_fallbacks = 0
+
     _service = None
+    # Builds a new Drive client, for threads that need their own.
+    _service_factory = None
+    # Worker threads keep their own Drive client here, see DriveExecutor.
+    _local = threading.local()
+    _executor = None
+    # Optional MetadataCache used instead of crawling, set by the subcommands.
+    _cache = None
+    # Optional DedupeIndex consulted before every copy, set by merge.
+    _dedupe = None
+    # Optional RequestStats recording every request, set by the subcommands with --stats.
+    _stats = None
+    # Optional MergeJournal recording planned and completed copies, set by merge for each user.
+    _journal = None
+    _api_calls = Counter()
+    # (parent ID, folder name) to the folder found by _get_folder_by_name_under_parent.
+    _folder_memo = {}
+    _folder_memo_lock = threading.Lock()
+    # Folder ID to the ID of the shared drive it is in, or None for My Drive.
+    _drive_ids = {}
+    _api_calls_lock = threading.Lock()
+    # Rate limiting and retries for every request, replaced with the configured one by the subcommands.
+    _governor = RequestGovernor()
     logger = logging.getLogger("gdrive-share.common")
 
+    @staticmethod
+    def _execute(request, endpoint: str, cost: int = 1):
+        # Every Drive request goes through here so that API usage can be counted, rate limited and retried.
+        # cost is the number of quota units used, i.e. the number of calls in a batch request.
+        attempts = []
+
+        def attempt():
+            with ArgParser._api_calls_lock:
+                ArgParser._api_calls[endpoint] += 1
+            started = time.perf_counter()
+            try:
+                return request.execute()
+            finally:
+                attempts.append(time.perf_counter() - started)
+
+        response = None
+        failed = True
+        try:
+            response = ArgParser._governor.call(attempt, endpoint, cost)
+            failed = False
+            return response
+        finally:
+            if ArgParser._stats is not None:
+                ArgParser._stats.record(endpoint, attempts, response, failed, calls=cost)
+
+    @staticmethod
+    def _phase(name: str) -> None:
+        # Marks the start of a phase of the run, requests are attributed to it in the --stats report.
+        if ArgParser._stats is not None:
+            ArgParser._stats.start_phase(name)
+
+    @staticmethod
+    def _get_service():
+        # Worker threads use their own client, everything else shares _service.
+        return getattr(ArgParser._local, 'service', None) or ArgParser._service
+
+    @staticmethod
+    def _api_call_count() -> int:
+        return sum(ArgParser._api_calls.values())
+
+    @staticmethod
+    def _user_summary(results: List) -> str:
+        # results holds (user, API calls, seconds, status) for each user handled by a run.
+        width = max([len("User")] + [len(r[0]) for r in results])
+        lines = [f"{'User':<{width}}  {'API calls':>9}  {'Time (s)':>8}  Status"]
+        for user, calls, elapsed, status in results:
+            lines.append(f"{user:<{width}}  {calls:>9}  {elapsed:>8.1f}  {status}")
+        return "\n".join(lines)
+
     @staticmethod
     def _get_folder_by_id(folder_id: str):
         result = None
         try:
-            result = ArgParser._service.files().get(fileId=folder_id).execute()
+            request = ArgParser._get_service().files().get(fileId=folder_id, fields='id, name, mimeType, driveId',
+                                                           supportsAllDrives=True)
+            result = ArgParser._execute(request, "files.get")
+            ArgParser._drive_ids[result['id']] = result.get('driveId')
         except HttpError:
             pass
         return result
 
     @staticmethod
-    def _get_children_by_query(query: str) -> List:
-        result = []
+    def _get_drive_id(folder_id: str):
+        # The shared drive a folder is in, None for My Drive.  Folders found by name or ID are already known.
+        if folder_id not in ArgParser._drive_ids:
+            request = ArgParser._get_service().files().get(fileId=folder_id, fields='id, driveId',
+                                                           supportsAllDrives=True)
+            ArgParser._drive_ids[folder_id] = ArgParser._execute(request, "files.get").get('driveId')
+        return ArgParser._drive_ids[folder_id]
+
+    @staticmethod
+    def _iter_children_by_query(query: str, fields: str = None, page_size: int = None, drive_id: str = None):
+        # Yields each page of results as soon as it arrives.  Items of shared drives are included, and with
+        # drive_id only the items of that shared drive are searched.
         page_token = None
         while True:
             try:
-                param = {}
+                param = {'supportsAllDrives': True, 'includeItemsFromAllDrives': True}
+                if drive_id:
+                    param['corpora'] = 'drive'
+                    param['driveId'] = drive_id
                 if page_token:
                     param['pageToken'] = page_token
-                files = ArgParser._service.files().list(q=query, spaces='drive', **param).execute()
-                result.extend(files['files'])
-                page_token = files.get('nextPageToken')
-                if not page_token:
-                    break
+                if fields:
+                    param['fields'] = fields
+                if page_size:
+                    param['pageSize'] = page_size
+                request = ArgParser._get_service().files().list(q=query, spaces='drive', **param)
+                files = ArgParser._execute(request, "files.list")
             except HttpError as e:
-                print(f"The following error occurred: {e}")
+                # Retryable errors have already been retried by _execute, so give up on this listing.
+                ArgParser.logger.error(f"Could not list {query}.  Error: {e}")
+                raise
+            yield files['files']
+            page_token = files.get('nextPageToken')
+            if not page_token:
+                break
 
+    @staticmethod
+    def _get_children_by_query(query: str, fields: str = None, page_size: int = None, drive_id: str = None) -> List:
+        result = []
+        for page in ArgParser._iter_children_by_query(query, fields=fields, page_size=page_size, drive_id=drive_id):
+            result.extend(page)
         return result
 
     @staticmethod
@@ -54,9 +184,14 @@ class ArgParser(ABC):
         return ArgParser._get_children_by_query(query)
 
     @staticmethod
-    def _get_children_files_by_folder_id(folder_id: str) -> List:
+    def _get_children_files_by_folder_id(folder_id: str, file_filter: FileFilter = None) -> List:
         query = f"'{folder_id}' in parents and not mimeType='{ArgParser._folder_mimetype}' and trashed=false"
-        return ArgParser._get_children_by_query(query)
+        if file_filter is None:
+            return ArgParser._get_children_by_query(query)
+        if file_filter.query() is not None:
+            query += f" and {file_filter.query()}"
+        # The default fields have no size, which the filter may need.
+        return ArgParser._get_children_by_query(query, fields=ArgParser._list_fields)
 
     @staticmethod
     def _get_files_folders_by_folder_id(folder_id: str) -> List:
@@ -65,17 +200,127 @@ class ArgParser(ABC):
 
     @staticmethod
     def _get_parent_name(folder_id: str) -> str:
-        parent = ArgParser._service.files().get(fileId=folder_id).execute()
+        request = ArgParser._get_service().files().get(fileId=folder_id, supportsAllDrives=True)
+        parent = ArgParser._execute(request, "files.get")
         return parent['name']
 
     @staticmethod
-    def _get_files_folders_dict(queue: List =[], include_files: bool = True) -> Dict:
+    def _get_files_folders_dict(queue: List = [], include_files: bool = True, crawl: str = "level",
+                                crawl_batch: int = 50, file_filter: FileFilter = None,
+                                folder_filter: FolderFilter = None, use_cache: bool = True) -> Dict:
+        # Returns the folder (and optionally file) structure under the first folder in the queue.
+        # parameters data structure:
+        # dict {
+        #       'folder_name'
+        #       'folder_id'
+        #       'parent_name'
+        #       (Optional List) 'child_files'
+        #       (Optional List) 'child_folders'
+        # }
+        # Only the files matching file_filter and the folders kept by folder_filter are included.  The metadata
+        # cache takes the place of the 'auto' crawl, other crawls run as asked.  use_cache=False crawls without it,
+        # for folders where new files must not be missed.
+        root = queue[-1] if len(queue) > 0 else None
+        calls_before = ArgParser._api_call_count()
+        # The cache keeps complete listings, so a filtered crawl asks Drive for the matching files instead.  It
+        # lists every folder of the drive, so a crawl of some folders only lists those.
+        filtered = file_filter is not None and file_filter.query() is not None
+        if crawl == "auto" and use_cache and ArgParser._cache is not None and root is not None and not filtered \
+                and folder_filter is None:
+            current_folder = queue.pop()
+            folder_list = ArgParser._cache.crawl(current_folder, include_files=include_files, batch_size=crawl_batch,
+                                                 drive_id=ArgParser._get_drive_id(current_folder['id']))
+            crawl = "cached"
+        elif crawl in ("auto", "flat"):
+            current_folder = queue.pop()
+            folder_list, crawl = ArgParser._crawl_auto(current_folder, include_files=include_files,
+                                                       batch_size=crawl_batch, force_flat=crawl == "flat",
+                                                       file_filter=file_filter, folder_filter=folder_filter)
+        elif crawl == "legacy":
+            folder_list = ArgParser._crawl_legacy(queue, include_files=include_files, file_filter=file_filter)
+            if folder_filter is not None:
+                # The original crawl lists everything, so its tree is pruned afterwards.
+                ArgParser._prune_folders(folder_list, folder_filter)
+        elif crawl == "single":
+            current_folder = queue.pop()
+            folder_list = ArgParser._crawl_single(current_folder, include_files=include_files,
+                                                  file_filter=file_filter, folder_filter=folder_filter)
+        elif crawl == "level":
+            current_folder = queue.pop()
+            folder_list = ArgParser._crawl_level(current_folder, include_files=include_files,
+                                                 batch_size=crawl_batch, file_filter=file_filter,
+                                                 folder_filter=folder_filter)
+        else:
+            raise ValueError(f"Unknown crawl mode: {crawl}")
+        if file_filter is not None and include_files:
+            ArgParser._filter_files(folder_list, file_filter, listed=filtered)
+        if root is not None:
+            ArgParser.logger.info(f"Crawled {root['name']} ({crawl} crawl) using "
+                                  f"{ArgParser._api_call_count() - calls_before} API calls")
+        return folder_list
+
+    @staticmethod
+    def _filter_files(folder_list: Dict, file_filter: FileFilter, listed: bool = False) -> None:
+        # Drops the files of the tree that don't match file_filter, see FileFilter.matches for listed.
+        level = [folder_list]
+        while len(level) > 0:
+            next_level = []
+            for node in level:
+                if 'child_files' in node.keys():
+                    node['child_files'] = [f for f in node['child_files'] if file_filter.matches(f, listed=listed)]
+                    if len(node['child_files']) == 0:
+                        del node['child_files']
+                next_level.extend(node.get('child_folders', []))
+            level = next_level
+
+    @staticmethod
+    def _prune_folders(folder_list: Dict, folder_filter: FolderFilter) -> None:
+        # Drops the folders of the tree that folder_filter doesn't keep.
+        level = [(folder_list, ())]
+        while len(level) > 0:
+            next_level = []
+            for node, path in level:
+                if 'child_folders' not in node.keys():
+                    continue
+                kept = [(c, path + (c['folder_name'],)) for c in node['child_folders']]
+                kept = [(c, p) for c, p in kept if folder_filter.wanted(p)]
+                if len(kept) > 0:
+                    node['child_folders'] = [c for c, _ in kept]
+                else:
+                    del node['child_folders']
+                next_level.extend(kept)
+            level = next_level
+
+    @staticmethod
+    def _drop_empty_folders(folder_list: Dict, keep_files: bool = False) -> int:
+        # Removes the folders without files in them or below them, along with the files unless keep_files.  Returns
+        # the number of folders removed.
+        order = [folder_list]
+        for node in order:
+            order.extend(node.get('child_folders', []))
+        full = set()
+        for node in reversed(order):
+            if 'child_folders' in node.keys():
+                kept = [c for c in node['child_folders'] if c['folder_id'] in full]
+                if len(kept) > 0:
+                    node['child_folders'] = kept
+                else:
+                    del node['child_folders']
+            if 'child_folders' in node.keys() or 'child_files' in node.keys():
+                full.add(node['folder_id'])
+            if 'child_files' in node.keys() and not keep_files:
+                del node['child_files']
+        return sum(1 for node in order[1:] if node['folder_id'] not in full)
+
+    @staticmethod
+    def _crawl_legacy(queue: List, include_files: bool = True, file_filter: FileFilter = None) -> Dict:
+        # Original crawl: separate folder and file listings plus a lookup of the folder itself.
         folder_list = {}
         while len(queue) > 0:
             current_folder = queue.pop()
             child_folders = ArgParser._get_children_folders_by_folder_id(current_folder['id'])
             if include_files:
-                child_files = ArgParser._get_children_files_by_folder_id(current_folder['id'])
+                child_files = ArgParser._get_children_files_by_folder_id(current_folder['id'], file_filter)
 
             test_files = ArgParser._get_files_folders_by_folder_id(current_folder['id'])
 
@@ -93,10 +338,276 @@ class ArgParser(ABC):
             folder_list['child_folders'] = []
             for child in child_folders:
                 queue.append(child)
-                folder_list['child_folders'].append(ArgParser._get_files_folders_dict(queue))
+                folder_list['child_folders'].append(ArgParser._crawl_legacy(queue, file_filter=file_filter))
 
         return folder_list
 
+    @staticmethod
+    def _children_query(folder_ids, include_files: bool = True, file_filter: FileFilter = None) -> str:
+        if isinstance(folder_ids, str):
+            folder_ids = [folder_ids]
+        query = " or ".join(f"'{folder_id}' in parents" for folder_id in folder_ids)
+        query = f"({query}) and trashed=false"
+        if not include_files:
+            query += f" and mimeType='{ArgParser._folder_mimetype}'"
+        elif file_filter is not None and file_filter.query() is not None:
+            # Folders are always listed so the crawl can go through them.
+            query += f" and (mimeType='{ArgParser._folder_mimetype}' or ({file_filter.query()}))"
+        return query
+
+    @staticmethod
+    def _get_children_listing(folder_ids, include_files: bool = True, file_filter: FileFilter = None) -> List:
+        # One paginated listing of everything under one or more folders, trimmed to the fields we use.
+        query = ArgParser._children_query(folder_ids, include_files=include_files, file_filter=file_filter)
+        return ArgParser._get_children_by_query(query, fields=ArgParser._list_fields, page_size=ArgParser._page_size)
+
+    @staticmethod
+    def _iter_files_by_path(root_folder: Dict, batch_size: int = 50, file_filter: FileFilter = None):
+        # Breadth first crawl like _crawl_level that yields (relative path, file) for every file as soon as the
+        # page listing it arrives, instead of building the whole tree.  Paths are tuples of folder names.
+        paths = {root_folder['id']: ()}
+        level = [root_folder['id']]
+        while len(level) > 0:
+            next_level = []
+            for i in range(0, len(level), batch_size):
+                chunk = set(level[i:i + batch_size])
+                query = ArgParser._children_query(list(chunk), file_filter=file_filter)
+                for page in ArgParser._iter_children_by_query(query, fields=ArgParser._list_fields,
+                                                              page_size=ArgParser._page_size):
+                    for child in page:
+                        for parent in [p for p in child.get('parents', []) if p in chunk]:
+                            path = paths[parent]
+                            if child['mimeType'] == ArgParser._folder_mimetype:
+                                paths[child['id']] = path + (child['name'],)
+                                next_level.append(child['id'])
+                            elif file_filter is None or file_filter.matches(child, listed=True):
+                                yield path, child
+            level = next_level
+
+    @staticmethod
+    def _crawl_single(current_folder: Dict, include_files: bool = True, parent_name: str = None,
+                      file_filter: FileFilter = None, folder_filter: FolderFilter = None, path: tuple = ()) -> Dict:
+        # Depth first crawl issuing a single listing per folder and splitting files from folders locally.  path
+        # holds the names of the folders from the root to current_folder.
+        children = ArgParser._get_children_listing(current_folder['id'], include_files=include_files,
+                                                   file_filter=file_filter)
+        child_folders = [c for c in children if c['mimeType'] == ArgParser._folder_mimetype and
+                         (folder_filter is None or folder_filter.wanted(path + (c['name'],)))]
+        # The root has no parent in hand, so it keeps its own name as before.
+        folder_list = FolderNode(current_folder['name'], current_folder['id'], parent_name)
+        if include_files:
+            child_files = [FileNode(c) for c in children if c['mimeType'] != ArgParser._folder_mimetype]
+            if len(child_files) > 0:
+                folder_list['child_files'] = child_files
+
+        if len(child_folders) > 0:
+            folder_list['child_folders'] = [
+                ArgParser._crawl_single(child, include_files=include_files, parent_name=current_folder['name'],
+                                        file_filter=file_filter, folder_filter=folder_filter,
+                                        path=path + (child['name'],))
+                for child in child_folders]
+        return folder_list
+
+    @staticmethod
+    def _crawl_level(root_folder: Dict, include_files: bool = True, batch_size: int = 50,
+                     file_filter: FileFilter = None, folder_filter: FolderFilter = None) -> Dict:
+        # Breadth first crawl.  The children of up to batch_size folders on the same level are listed with
+        # a single query and routed back to their parent folder using the 'parents' field.  Folders that
+        # folder_filter doesn't keep are left out, so their children are never listed.
+        root = FolderNode(root_folder['name'], root_folder['id'])
+        level = [root]
+        # Folder ID to its path of names from the root, for the folders of the current level.
+        paths = {root['folder_id']: ()}
+        while len(level) > 0:
+            next_level = []
+            next_paths = {}
+            for i in range(0, len(level), batch_size):
+                chunk = {f['folder_id']: f for f in level[i:i + batch_size]}
+                children = ArgParser._get_children_listing(list(chunk.keys()), include_files=include_files,
+                                                           file_filter=file_filter)
+                for child in children:
+                    for parent in [chunk[p] for p in child.get('parents', []) if p in chunk]:
+                        if child['mimeType'] == ArgParser._folder_mimetype:
+                            path = paths[parent['folder_id']] + (child['name'],)
+                            if folder_filter is not None and not folder_filter.wanted(path):
+                                continue
+                            node = FolderNode(child['name'], child['id'], parent['folder_name'])
+                            parent.setdefault('child_folders', []).append(node)
+                            next_level.append(node)
+                            next_paths[node['folder_id']] = path
+                        else:
+                            parent.setdefault('child_files', []).append(FileNode(child))
+            level = next_level
+            paths = next_paths
+        return root
+
+    @staticmethod
+    def _crawl_auto(root_folder: Dict, include_files: bool = True, batch_size: int = 50, force_flat: bool = False,
+                    file_filter: FileFilter = None, folder_filter: FolderFilter = None):
+        # Returns the tree and the crawl used.  My Drive is crawled level by level.  In a shared drive every
+        # folder is listed first, and when root_folder holds at least _flat_share of them (or force_flat) the
+        # files are listed for the whole drive as well; otherwise the folders listing is wasted and the subtree
+        # is crawled level by level.
+        drive_id = ArgParser._get_drive_id(root_folder['id'])
+        if drive_id is None:
+            if force_flat:
+                ArgParser.logger.warning(f"{root_folder['name']} is not in a shared drive, crawling it by level")
+            return ArgParser._crawl_level(root_folder, include_files=include_files, batch_size=batch_size,
+                                          file_filter=file_filter, folder_filter=folder_filter), "level"
+        if root_folder['id'] == drive_id:
+            # The whole drive is wanted, so everything is listed in one go.
+            return ArgParser._crawl_flat(root_folder, drive_id, include_files=include_files,
+                                         file_filter=file_filter, folder_filter=folder_filter), "flat"
+
+        query = f"mimeType='{ArgParser._folder_mimetype}' and trashed=false"
+        folders = ArgParser._get_children_by_query(query, fields=ArgParser._list_fields,
+                                                   page_size=ArgParser._page_size, drive_id=drive_id)
+        children = ArgParser._children_by_parent(folders)
+        subtree = [root_folder['id']]
+        for folder_id in subtree:
+            subtree.extend(c['id'] for c in children[folder_id])
+        share = (len(subtree) - 1) / max(1, len(folders))
+        ArgParser.logger.debug(f"{root_folder['name']} holds {len(subtree) - 1} of the {len(folders)} folders "
+                               f"of its shared drive")
+        if not force_flat and share < ArgParser._flat_share:
+            return ArgParser._crawl_level(root_folder, include_files=include_files, batch_size=batch_size,
+                                          file_filter=file_filter, folder_filter=folder_filter), "level"
+        return ArgParser._crawl_flat(root_folder, drive_id, include_files=include_files, folders=folders,
+                                     file_filter=file_filter, folder_filter=folder_filter), "flat"
+
+    @staticmethod
+    def _children_by_parent(items: List) -> Dict:
+        children = defaultdict(list)
+        for item in items:
+            for p in item.get('parents', []):
+                children[p].append(item)
+        return children
+
+    @staticmethod
+    def _crawl_flat(root_folder: Dict, drive_id: str, include_files: bool = True, folders: List = None,
+                    file_filter: FileFilter = None, folder_filter: FolderFilter = None) -> Dict:
+        # Lists every item of a shared drive with a few large pages and rebuilds the tree under root_folder
+        # from the 'parents' fields.  folders are the drive's folders when they were already listed.
+        folder_query = f"mimeType='{ArgParser._folder_mimetype}' and trashed=false"
+        query = "trashed=false" if include_files else folder_query
+        file_query = f"not {folder_query}"
+        if include_files and file_filter is not None and file_filter.query() is not None:
+            query = f"trashed=false and (mimeType='{ArgParser._folder_mimetype}' or ({file_filter.query()}))"
+            file_query += f" and {file_filter.query()}"
+        if folders is None:
+            items = ArgParser._get_children_by_query(query, fields=ArgParser._list_fields,
+                                                     page_size=ArgParser._page_size, drive_id=drive_id)
+        else:
+            items = list(folders)
+            if include_files:
+                items.extend(ArgParser._get_children_by_query(
+                    file_query, fields=ArgParser._list_fields, page_size=ArgParser._page_size, drive_id=drive_id))
+        children = ArgParser._children_by_parent(items)
+
+        root = FolderNode(root_folder['name'], root_folder['id'])
+        level = [(root, ())]
+        while len(level) > 0:
+            next_level = []
+            for parent, parent_path in level:
+                for child in children[parent['folder_id']]:
+                    if child['mimeType'] == ArgParser._folder_mimetype:
+                        path = parent_path + (child['name'],)
+                        if folder_filter is not None and not folder_filter.wanted(path):
+                            continue
+                        node = FolderNode(child['name'], child['id'], parent['folder_name'])
+                        parent.setdefault('child_folders', []).append(node)
+                        next_level.append((node, path))
+                    elif include_files:
+                        parent.setdefault('child_files', []).append(FileNode(child))
+            level = next_level
+        return root
+
+    @staticmethod
+    def _get_start_page_token(drive_id: str = None) -> str:
+        # The changes of a shared drive have their own feed.
+        param = {'driveId': drive_id} if drive_id else {}
+        request = ArgParser._get_service().changes().getStartPageToken(supportsAllDrives=True, **param)
+        return ArgParser._execute(request, "changes.getStartPageToken")['startPageToken']
+
+    @staticmethod
+    def _list_changes(page_token: str, drive_id: str = None):
+        # Returns every change since page_token and the token to continue from next time.
+        changes = []
+        param = {'driveId': drive_id} if drive_id else {}
+        while True:
+            request = ArgParser._get_service().changes().list(pageToken=page_token, spaces='drive',
+                                                              fields=ArgParser._change_fields,
+                                                              pageSize=ArgParser._page_size,
+                                                              supportsAllDrives=True,
+                                                              includeItemsFromAllDrives=True, **param)
+            response = ArgParser._execute(request, "changes.list")
+            changes.extend(response.get('changes', []))
+            if 'newStartPageToken' in response:
+                return changes, response['newStartPageToken']
+            page_token = response['nextPageToken']
+
+    @staticmethod
+    def _get_changed_files_dict(root_folder: Dict, page_token: str, file_filter: FileFilter = None,
+                                batch_size: int = 50):
+        # Builds the nested dict of the files changed under root_folder since page_token, along with the next
+        # page token.  The changes feed covers the whole drive (including the copies of the last merge), so the
+        # folders of root_folder are crawled (without their files, one listing per batch_size folders) and only the
+        # changes whose parent is one of them are kept.
+        changes, new_token = ArgParser._list_changes(page_token, drive_id=root_folder.get('driveId'))
+        changed_files = {}
+        for change in changes:
+            file = change.get('file')
+            if change.get('removed') or file is None or file.get('trashed'):
+                continue
+            if file['mimeType'] == ArgParser._folder_mimetype:
+                continue
+            if file_filter is not None and not file_filter.matches(file):
+                continue
+            changed_files[file['id']] = file
+
+        root = ArgParser._crawl_level(root_folder, include_files=False, batch_size=batch_size)
+        nodes = {}
+        level = [root]
+        while len(level) > 0:
+            nodes.update((node['folder_id'], node) for node in level)
+            level = [c for node in level for c in node.get('child_folders', [])]
+
+        count = 0
+        for file in changed_files.values():
+            node = next((nodes[p] for p in file.get('parents', []) if p in nodes), None)
+            if node is not None:
+                node.setdefault('child_files', []).append(FileNode(file))
+                count += 1
+        # Only the folders leading to changed files are merged.
+        ArgParser._drop_empty_folders(root, keep_files=True)
+        ArgParser.logger.info(f"{count} of {len(changes)} changes are under {root_folder['name']}")
+        return root, new_token
+
+    @staticmethod
+    def _get_matching_folders_dict(root_folder: Dict, new_: Dict, batch_size: int = 50) -> Dict:
+        # Crawls only the folders under root_folder whose path also exists in new_, level by level, which is all
+        # _copy_all_files needs to find the destination of the files in new_.  Names are compared like diff_trees
+        # does.
+        root = FolderNode(root_folder['name'], root_folder['id'])
+        level = [(root, new_)]
+        while len(level) > 0:
+            level = [(orig, n) for orig, n in level if "child_folders" in n.keys()]
+            next_level = []
+            for i in range(0, len(level), batch_size):
+                chunk = {orig['folder_id']: (orig, n) for orig, n in level[i:i + batch_size]}
+                children = ArgParser._get_children_listing(list(chunk.keys()), include_files=False)
+                for child in children:
+                    name = normalize_name(child['name'])
+                    for orig, n in [chunk[p] for p in child.get('parents', []) if p in chunk]:
+                        matches = [f for f in n['child_folders'] if normalize_name(f['folder_name']) == name]
+                        if len(matches) == 0:
+                            continue
+                        node = FolderNode(child['name'], child['id'], orig['folder_name'])
+                        orig.setdefault('child_folders', []).append(node)
+                        next_level.extend((node, m) for m in matches)
+            level = next_level
+        return root
+
     @staticmethod
     def _create_folder(parent_id: str, folder_name: str) -> str:
         # Create a folder on Drive, returns the newly created folders ID
@@ -104,12 +615,22 @@ class ArgParser(ABC):
             'name': folder_name,
             'mimeType': ArgParser._folder_mimetype,
             'parents': [parent_id]}
-        new_folder = ArgParser._service.files().create(body=file_metadata, fields='id, parents').execute()
+        request = ArgParser._get_service().files().create(body=file_metadata, fields='id, parents',
+                                                          supportsAllDrives=True)
+        new_folder = ArgParser._execute(request, "files.create")
         ArgParser.logger.debug(f"New folder created.  ID: {new_folder.get('id')}.  Parents: {new_folder.get('parents')}")
         return new_folder.get('id')
 
     @staticmethod
     def _duplicate_folder_structure(parent_id: str, folders: List) -> None:
+        if ArgParser._executor is not None:
+            ArgParser._executor.create_tree(parent_id, folders)
+            failures = ArgParser._executor.wait()
+            if len(failures) > 0:
+                # Raised like the failed create of the serial path, the subfolders of the folder were skipped.
+                ArgParser.logger.error(f"Could not create {len(failures)} folders and their subfolders")
+                raise failures[0]
+            return
         if isinstance(folders, list):
             for f in folders:
                 # Create the folder, and then if there are children, recurse.
@@ -118,32 +639,362 @@ class ArgParser(ABC):
                     ArgParser._duplicate_folder_structure(parent_id=new_folder_id, folders=f["child_folders"])
 
     @staticmethod
-    def _get_folder_by_name_under_parent(parent_id: str, folder_name: str):
+    def _generate_ids(count: int) -> List:
+        # Drive hands out at most 1000 IDs per request.
+        ids = []
+        while len(ids) < count:
+            request = ArgParser._get_service().files().generateIds(count=min(count - len(ids), 1000),
+                                                                    space='drive', type='files')
+            ids.extend(ArgParser._execute(request, "files.generateIds")['ids'])
+        return ids
+
+    @staticmethod
+    def _duplicate_folder_structure_by_level(parent_id: str, folders: List) -> int:
+        # Create the skeleton one depth at a time.  IDs are generated up front so every folder on a level
+        # (and the parents its children will need) is known before any of them are created, which lets the
+        # whole level go out in batch requests.  Returns the number of folders that were not created, counting
+        # the subfolders of failed folders.
+        level = [(parent_id, f) for f in folders]
+        depth = 1
+        missing = 0
+        while len(level) > 0:
+            ids = ArgParser._generate_ids(len(level))
+            pending = [(p, f['folder_name'], new_id) for (p, f), new_id in zip(level, ids)]
+            ArgParser.logger.info(f"Creating {len(pending)} folders at depth {depth}")
+            created = ArgParser._create_folder_level(pending)
+
+            next_level = []
+            for (p, f), new_id in zip(level, ids):
+                if new_id not in created:
+                    skipped = [f]
+                    for s in skipped:
+                        skipped.extend(s.get('child_folders', []))
+                    missing += len(skipped)
+                    if len(skipped) > 1:
+                        ArgParser.logger.error(f"Could not create folder {f['folder_name']}, skipping its "
+                                               f"{len(skipped) - 1} subfolders.")
+                    continue
+                next_level.extend((new_id, child) for child in f.get('child_folders', []))
+            level = next_level
+            depth += 1
+        return missing
+
+    @staticmethod
+    def _create_folder_level(pending: List) -> set:
+        # Creates folders of the same depth, (parent ID, folder name, new folder ID) in pending, in batch requests
+        # spread over the worker threads.  Returns the IDs of the folders that were created.
+        created = set()
+        if ArgParser._executor is not None:
+            for i in range(0, len(pending), ArgParser._batch_size):
+                ArgParser._executor.submit(ArgParser._send_folder_creates, pending[i:i + ArgParser._batch_size],
+                                           created)
+            ArgParser._executor.wait()
+        else:
+            ArgParser._send_folder_creates(pending, created)
+        return created
+
+    @staticmethod
+    def _send_folder_creates(pending: List, created: set) -> None:
+        # pending holds (parent ID, folder name, new folder ID).  IDs of successfully created folders are
+        # added to created.
+        def callback_for(folder_name: str, folder_id: str):
+            def callback(request_id, new_folder, exception):
+                if exception is not None:
+                    ArgParser.logger.warning(f"Failed to create folder {folder_name}.  Error: {exception}")
+                else:
+                    ArgParser.logger.debug(f"New folder created.  ID: {new_folder.get('id')}.  "
+                                           f"Parents: {new_folder.get('parents')}")
+                    created.add(folder_id)
+            return callback
+
+        requests = []
+        for p, folder_name, folder_id in pending:
+            file_metadata = {
+                'id': folder_id,
+                'name': folder_name,
+                'mimeType': ArgParser._folder_mimetype,
+                'parents': [p]}
+            request = ArgParser._get_service().files().create(body=file_metadata, fields='id, parents',
+                                                              supportsAllDrives=True)
+            requests.append((request, callback_for(folder_name, folder_id)))
+        ArgParser._execute_batch(requests, "files.create")
+
+    @staticmethod
+    def _quote(value: str) -> str:
+        # A value as a single-quoted string of a files.list query.
+        return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+    @staticmethod
+    def _get_folder_by_name_under_parent(parent_id: str, folder_name: str, check: bool = True):
+        # The name is matched by Drive, so only matching folders are listed.  Results are memoized for the run
+        # and kept in the metadata cache for later runs.  Without check, a cached folder is used as it is and not
+        # memoized, see _get_folder_by_path.
+        key = (parent_id, folder_name)
+        with ArgParser._folder_memo_lock:
+            if key in ArgParser._folder_memo:
+                return ArgParser._folder_memo[key]
         match = None
-        folders_to_search = ArgParser._get_children_folders_by_folder_id(folder_id=parent_id)
-        matches = [f for f in folders_to_search if f['name'] == folder_name]
-        if len(matches) > 0:
-            # For now we'll always just take the first one if there are multiple name matches
-            match = matches[0]
+        if ArgParser._cache is not None:
+            match = ArgParser._cache.get_path(parent_id, folder_name, check=check)
+            if match is not None and not check:
+                ArgParser._drive_ids[match['id']] = match.get('driveId')
+                return match
+        if match is None:
+            query = f"'{parent_id}' in parents and name = {ArgParser._quote(folder_name)} and " \
+                    f"mimeType='{ArgParser._folder_mimetype}' and trashed=false"
+            matches = ArgParser._get_children_by_query(query, page_size=10,
+                                                       fields="nextPageToken, files(id, name, parents, driveId)")
+            if len(matches) > 0:
+                # For now we'll always just take the first one if there are multiple name matches
+                match = matches[0]
+                if ArgParser._cache is not None:
+                    ArgParser._cache.set_path(parent_id, folder_name, match)
+        if match is not None:
+            with ArgParser._folder_memo_lock:
+                ArgParser._folder_memo[key] = match
+            ArgParser._drive_ids[match['id']] = match.get('driveId')
         return match
 
     @staticmethod
-    def _copy_file(file, dest_id: str):
+    def _get_shared_drive_by_name(drive_name: str):
+        # The root folder of the shared drive called drive_name, as a folder resource.
+        key = (None, drive_name)
+        with ArgParser._folder_memo_lock:
+            if key in ArgParser._folder_memo:
+                return ArgParser._folder_memo[key]
+        request = ArgParser._get_service().drives().list(q=f"name = {ArgParser._quote(drive_name)}",
+                                                         fields="drives(id, name)", pageSize=10)
+        drives = ArgParser._execute(request, "drives.list").get('drives', [])
+        if len(drives) == 0:
+            return None
+        match = {'id': drives[0]['id'], 'name': drives[0]['name'], 'driveId': drives[0]['id']}
+        with ArgParser._folder_memo_lock:
+            ArgParser._folder_memo[key] = match
+        ArgParser._drive_ids[match['id']] = match['id']
+        return match
+
+    @staticmethod
+    def _get_folder_by_path(path: str, parent_id: str = 'root'):
+        # Resolves a slash-separated path such as 'Concerts/2026/Uploads' one folder at a time.  A path whose
+        # first folder is not in My Drive may start with the name of a shared drive instead.  With the metadata
+        # cache, only the last folder is checked to still be under its cached parent, and only if that fails is
+        # every folder of the path checked or looked up again.
+        names = [n for n in path.split("/") if n != ""]
+        if ArgParser._cache is not None:
+            folder, _ = ArgParser._walk_path(names, parent_id, trust_cache=True)
+            if folder is not None:
+                return folder
+        folder, missing = ArgParser._walk_path(names, parent_id)
+        if missing is not None:
+            ArgParser.logger.error(f"Could not find folder {missing} of {path}")
+        return folder
+
+    @staticmethod
+    def _walk_path(names: List, parent_id: str, trust_cache: bool = False):
+        # Returns the folder at the end of names, or None and the name of the first folder not found.
+        folder = None
+        for i, name in enumerate(names):
+            check = not trust_cache or i == len(names) - 1
+            folder = ArgParser._get_folder_by_name_under_parent(parent_id, name, check=check)
+            if folder is None and i == 0 and parent_id == 'root':
+                folder = ArgParser._get_shared_drive_by_name(name)
+            if folder is None:
+                return None, name
+            parent_id = folder['id']
+        return folder, None
+
+    @staticmethod
+    def _execute_batch(requests: List, endpoint: str = "batch") -> None:
+        # Send (request, callback) pairs to Drive in batches of at most _batch_size requests.  Calls within a
+        # batch that were throttled are sent again in a later batch after backing off.  endpoint names the calls
+        # in the batch for the statistics.
+        batch_size = max(1, min(ArgParser._batch_size, ArgParser._max_batch_size))
+        governor = ArgParser._governor
+        for i in range(0, len(requests), batch_size):
+            chunk = requests[i:i + batch_size]
+            attempt = 0
+            while len(chunk) > 0:
+                retry = []
+                batch = ArgParser._get_service().new_batch_http_request()
+                for request, callback in chunk:
+                    batch.add(request, callback=ArgParser._retry_callback(request, callback, retry, attempt))
+                if ArgParser._stats is not None:
+                    ArgParser._stats.record_batch_calls(endpoint, len(chunk))
+                try:
+                    ArgParser._execute(batch, "batch", cost=len(chunk))
+                except HttpError as e:
+                    ArgParser.logger.error(f"Batch of {len(chunk)} requests failed.  Error: {e}")
+                    for request, callback in chunk:
+                        callback(None, None, e)
+                    break
+                chunk = retry
+                if len(chunk) > 0:
+                    ArgParser.logger.info(f"Retrying {len(chunk)} throttled calls from batch")
+                    governor.backoff(attempt)
+                    attempt += 1
+
+    @staticmethod
+    def _retry_callback(request, callback, retry: List, attempt: int):
+        # Wraps a batch callback so retryable failures are queued for another attempt instead of reported.
+        governor = ArgParser._governor
+
+        def wrapped(request_id, response, exception):
+            if exception is not None and governor.is_retryable(exception) and attempt < governor.max_retries:
+                governor.record("batch", exception)
+                retry.append((request, callback))
+            else:
+                callback(request_id, response, exception)
+        return wrapped
+
+    @staticmethod
+    def _copy_request(file, dest_id: str):
         new_file_body = {
             'name': file['name'],
             'parents': [dest_id]
         }
+        return ArgParser._get_service().files().copy(fileId=file['id'], body=new_file_body, supportsAllDrives=True)
+
+    @staticmethod
+    def _copy_callback(file):
+        # Per-file callback for batched copies, logs the same way as _copy_file.
+        def callback(request_id, new_file, exception):
+            if exception is not None:
+                ArgParser._copy_failed(file, exception)
+            else:
+                ArgParser.logger.debug(f"Copied file: {file['name']} (id: {new_file.get('id')}, "
+                                       f"parents: {new_file.get('parents')})")
+                ArgParser._journal_done(file, new_file.get('id'))
+        return callback
+
+    @staticmethod
+    def _journal_done(file, new_id: str = None) -> None:
+        if ArgParser._journal is not None:
+            ArgParser._journal.done(file['id'], new_id)
+
+    @staticmethod
+    def _copy_failed(file, error) -> None:
+        with ArgParser._failed_copies_lock:
+            ArgParser._failed_copies += 1
+        ArgParser.logger.warning(f"Failed to copy {file['name']}.  Error: {error}")
+
+    @staticmethod
+    def _can_move(file) -> bool:
+        # Checked up front so files we can't move (e.g. not ours, or crawled without capabilities) are copied
+        # without a failed update first.  Both parents are needed to move rather than add a second parent.
+        return file.get('capabilities', {}).get('canMoveItemWithinDrive', False) and len(file.get('parents', [])) > 0
+
+    @staticmethod
+    def _move_request(file, dest_id: str):
+        return ArgParser._get_service().files().update(fileId=file['id'], addParents=dest_id,
+                                                       removeParents=",".join(file['parents']), fields='id, parents',
+                                                       supportsAllDrives=True)
+
+    @staticmethod
+    def _moved(file) -> None:
+        with ArgParser._failed_copies_lock:
+            ArgParser._moved_files += 1
+        ArgParser.logger.debug(f"Moved file: {file['name']} (id: {file['id']})")
+        ArgParser._journal_done(file, file['id'])
+
+    @staticmethod
+    def _move_failed(file, error) -> None:
+        with ArgParser._failed_copies_lock:
+            ArgParser._move_fallbacks += 1
+        ArgParser.logger.info(f"Could not move {file['name']}, copying it instead.  Error: {error}")
+
+    @staticmethod
+    def _move_callback(file, dest_id: str, fallback: List):
+        # Per-file callback for batched moves, files that could not be moved are collected to be copied.
+        def callback(request_id, response, exception):
+            if exception is not None:
+                ArgParser._move_failed(file, exception)
+                fallback.append((file, dest_id))
+            else:
+                ArgParser._moved(file)
+        return callback
+
+    @staticmethod
+    def _move_summary() -> str:
+        return f"Moved {ArgParser._moved_files} files, {ArgParser._move_fallbacks} could not be moved and were copied."
+
+    @staticmethod
+    def _copy_file(file, dest_id: str):
+        if ArgParser._move and ArgParser._can_move(file):
+            ArgParser.logger.info(f"Moving {file['name']}")
+            try:
+                moved = ArgParser._execute(ArgParser._move_request(file, dest_id), "files.update")
+            except HttpError as e:
+                ArgParser._move_failed(file, e)
+            else:
+                ArgParser._moved(file)
+                return moved
         ArgParser.logger.info(f"Copying {file['name']}")
+        new_file = None
         try:
-            new_file = ArgParser._service.files().copy(fileId=file['id'], body=new_file_body).execute()
+            new_file = ArgParser._execute(ArgParser._copy_request(file, dest_id), "files.copy")
         except HttpError as e:
-            ArgParser.logger.warning(f"Failed to copy {file['name']}.  Error: {e}")
+            ArgParser._copy_failed(file, e)
         else:
             ArgParser.logger.debug(f"Copied file: {file['name']} (id: {new_file.get('id')}, parents: {new_file.get('parents')})")
+            ArgParser._journal_done(file, new_file.get('id'))
         return new_file
 
     @staticmethod
-    def _copy_all_files(orig: Dict, new_: Dict) -> None:
+    def _queue_copy(file, dest_id: str) -> None:
+        # Copies are sent in batches once enough of them are queued.  A batch size of 1 copies immediately.
+        if ArgParser._dedupe is not None and ArgParser._dedupe.is_duplicate(file, dest_id):
+            ArgParser.logger.info(f"Skipping {file['name']}, it is already in the library")
+            ArgParser._journal_done(file)
+            return
+        if ArgParser._batch_size <= 1:
+            if ArgParser._executor is not None:
+                ArgParser._executor.submit_copy(file, dest_id)
+            else:
+                ArgParser._copy_file(file, dest_id)
+            return
+        ArgParser.logger.info(f"Queueing copy of {file['name']}")
+        ArgParser._pending_copies.append((file, dest_id))
+        if len(ArgParser._pending_copies) >= ArgParser._batch_size:
+            ArgParser._flush_copies()
+
+    @staticmethod
+    def _flush_copies() -> None:
+        pending = ArgParser._pending_copies
+        ArgParser._pending_copies = []
+        if len(pending) > 0:
+            if ArgParser._executor is not None:
+                ArgParser._executor.submit_copies(pending)
+            else:
+                ArgParser._send_copies(pending)
+
+    @staticmethod
+    def _send_copies(pending: List) -> None:
+        # Requests are built here so that they use the client of the thread sending them.
+        if ArgParser._move:
+            moves = [(f, dest_id) for f, dest_id in pending if ArgParser._can_move(f)]
+            pending = [(f, dest_id) for f, dest_id in pending if not ArgParser._can_move(f)]
+            if len(moves) > 0:
+                ArgParser.logger.debug(f"Sending batch of {len(moves)} moves")
+                fallback = []
+                ArgParser._execute_batch([(ArgParser._move_request(f, dest_id),
+                                           ArgParser._move_callback(f, dest_id, fallback))
+                                          for f, dest_id in moves], "files.update")
+                pending.extend(fallback)
+            if len(pending) == 0:
+                return
+        ArgParser.logger.debug(f"Sending batch of {len(pending)} copies")
+        ArgParser._execute_batch([(ArgParser._copy_request(f, dest_id), ArgParser._copy_callback(f))
+                                  for f, dest_id in pending], "files.copy")
+
+    @staticmethod
+    def _add_created_folder(orig: Dict, folder_name: str, folder_id: str) -> Dict:
+        # Keeps the destination tree current, so it can be reused by later merges in the same run.
+        node = FolderNode(folder_name, folder_id, orig['folder_name'])
+        orig.setdefault('child_folders', []).append(node)
+        return node
+
+    @staticmethod
+    def _copy_all_files(orig: Dict, new_: Dict, flush: bool = True) -> None:
         ArgParser.logger.debug("Entering _copy_all_files")
         # parameters data structure:
         # dict {
@@ -153,103 +1004,166 @@ class ArgParser(ABC):
         #       (Optional List) 'child_files'
         #       (Optional List) 'child_folders'
         # }
-        next_orig_root = None
+        # Both trees are indexed by relative path and diffed into a flat plan, which is then executed.
+        plan, orig_index = diff_trees(orig, new_)
+        ArgParser.logger.info(f"Merge plan: {len(plan.folders)} folders to create, {len(plan.copies)} files to copy")
+        ArgParser._execute_merge_plan(plan, orig_index)
 
-        def _copy_files_from_one_folder_to_another(files_to_copy: List, dest_folder: str) -> None:
-            for f in files_to_copy:
-                if f['mimeType'] != ArgParser._folder_mimetype:
-                    ArgParser._copy_file(f, dest_folder)
+        if flush:
+            ArgParser._flush_copies()
+            if ArgParser._executor is not None:
+                ArgParser._executor.wait()
 
-        if "child_files" in new_.keys():
+    @staticmethod
+    def _create_planned_folders(plan: MergePlan, orig_index: Dict) -> None:
+        # Creates the folders of a plan one depth at a time with generated IDs, so each depth goes out in batch
+        # requests.  Folders already in the index (e.g. created for an earlier plan) are not created again.
+        by_depth = defaultdict(list)
+        for path, parent_path, folder_name in plan.folders:
+            by_depth[len(path)].append((path, parent_path, folder_name))
+        for depth in sorted(by_depth.keys()):
+            level = []
+            for path, parent_path, folder_name in by_depth[depth]:
+                if path in orig_index:
+                    continue
+                if parent_path not in orig_index:
+                    ArgParser.logger.error(f"Skipping folder {folder_name}, its parent could not be created")
+                    continue
+                level.append((path, parent_path, folder_name))
+            if len(level) == 0:
+                continue
+            ids = ArgParser._generate_ids(len(level))
+            ArgParser.logger.info(f"Creating {len(level)} planned folders at depth {depth}")
+            created = ArgParser._create_folder_level([(orig_index[parent_path]['folder_id'], folder_name, new_id)
+                                                      for (path, parent_path, folder_name), new_id in zip(level, ids)])
+            for (path, parent_path, folder_name), new_id in zip(level, ids):
+                if new_id in created:
+                    orig_index[path] = ArgParser._add_created_folder(orig_index[parent_path], folder_name, new_id)
+                    if ArgParser._journal is not None:
+                        ArgParser._journal.folder(path, new_id)
+
+    @staticmethod
+    def _execute_merge_plan(plan: MergePlan, orig_index: Dict, batch_folders: bool = False) -> None:
+        # Folders are created parents first.  Created folders are added to the destination tree (and its index)
+        # so the tree stays current for later merges in the same run.  With a journal, the whole plan is recorded
+        # before the first copy and files it has as done (from an interrupted merge) are skipped.
+        journal = ArgParser._journal
+        if batch_folders:
+            ArgParser._create_planned_folders(plan, orig_index)
+            plan_folders = []
+        else:
+            plan_folders = plan.folders
+        for path, parent_path, folder_name in plan_folders:
+            if parent_path not in orig_index:
+                ArgParser.logger.error(f"Skipping folder {folder_name}, its parent could not be created")
+                continue
+            parent = orig_index[parent_path]
             try:
-                ArgParser.logger.debug("Copying files from root directory.")
-                _copy_files_from_one_folder_to_another(new_['child_files'], orig['folder_id'])
+                new_folder_id = ArgParser._create_folder(parent['folder_id'], folder_name)
             except HttpError as e:
-                print(f"Could not copy files from {new_['folder_name']}")
-                print(f"HttpError: {e}")
-
-        if "child_folders" in new_.keys():
-            ArgParser.logger.debug("child_folders in new_.keys()")
-            for f in new_['child_folders']:
-                if not "child_files" in f.keys():
-                    ArgParser.logger.debug("no child_files in f.keys() - continuing")
-                    continue
-                if "child_folders" in orig.keys():
-                    ArgParser.logger.debug("child_folders in orig.keys()")
-                    found = False
-                    for ff in orig['child_folders']:
-                        if f['folder_name'] == ff['folder_name']:
-                            # We've found a matching folder.  Copy the items from new_ to orig.
-                            ArgParser.logger.debug("found a matching folder")
-                            found = True
-                            try:
-                                ArgParser.logger.debug("Getting ready to enter "
-                                                       "_copy_files_from_one_folder_to_another()")
-                                if "child_files" in f:
-                                    _copy_files_from_one_folder_to_another(f['child_files'], ff['folder_id'])
-                                else:
-                                    ArgParser.logger.critical("How did we hit this part??")
-                            except HttpError as e:
-                                ArgParser.logger.error(f"Could not copy files from {f['folder_name']}")
-                                ArgParser.logger.error(f"HttpError: {e}")
-                            ArgParser.logger.debug("setting next_orig_root")
-                            next_orig_root = ff
-                            break  # This one is break because we're in nested for loop currently.
-                    if not found:
-                        # Then we have a new folder.  Create the new folder in orig with the name from new_
-                        # and then copy the items from new_ to orig.  Make sure there's actually files in new_
-                        try:
-                            ArgParser.logger.debug("creating new folder in orig (from new_)")
-                            new_folder_id = ArgParser._create_folder(orig['folder_id'], f['folder_name'])
-                        except HttpError as e:
-                            ArgParser.logger.error(f"Could not create new folder: {f['folder_name']}")
-                            ArgParser.logger.error(f"HttpError: {e}")
-                            continue  # not break?
-                        try:
-                            ArgParser.logger.debug("Getting ready to enter "
-                                                   "_copy_files_from_one_folder_to_another()")
-                            _copy_files_from_one_folder_to_another(f['child_files'], new_folder_id)
-                        except HttpError as e:
-                            ArgParser.logger.error(f"Could not copy files from {f['folder_name']}")
-                            ArgParser.logger.error(f"HttpError: {e}")
-                else:
-                    # Then we also have a new folder.  Create the new folder in orig with the name from new_
-                    # and then copy the items from new_ to orig.  Make sure there's actually files in new_
-                    try:
-                        new_folder_id = ArgParser._create_folder(orig['folder_id'], f['folder_name'])
-                    except HttpError as e:
-                        ArgParser.logger.error(f"Could not create new folder: {f['folder_name']}")
-                        ArgParser.logger.error(f"HttpError: {e}")
-                        continue  # not break?
-                    try:
-                        _copy_files_from_one_folder_to_another(f['child_files'], new_folder_id)
-                    except HttpError as e:
-                        ArgParser.logger.error(f"Could not copy files from {f['folder_name']}")
-                        ArgParser.logger.error(f"HttpError: {e}")
-                if "child_folders" in f.keys():
-                    ArgParser.logger.info("Recursing on child_folders of f.keys()")
-                    # Recurse
-                    if next_orig_root is None:
-                        ArgParser.logger.debug("Setting 'fake' next_orig_root")
-                        # Create a fake dictionary to pass to the recursive call.
-                        next_orig_root = {
-                            "folder_name": f['folder_name'],
-                            "folder_id": new_folder_id,
-                        }
-                    ArgParser._copy_all_files(next_orig_root, f)
-
-    @staticmethod
-    def _share_folder_with_user(file_id: str, user: str, email_message: str = None):
+                ArgParser.logger.error(f"Could not create new folder: {folder_name}")
+                ArgParser.logger.error(f"HttpError: {e}")
+                continue
+            orig_index[path] = ArgParser._add_created_folder(parent, folder_name, new_folder_id)
+            if journal is not None:
+                journal.folder(path, new_folder_id)
+
+        copies = []
+        for f, path in plan.copies:
+            if path not in orig_index:
+                ArgParser._copy_failed(f, "destination folder could not be created")
+            elif journal is not None and journal.is_done(f['id']):
+                ArgParser.logger.debug(f"Skipping {f['name']}, the journal has it as copied")
+            else:
+                copies.append((f, orig_index[path]['folder_id']))
+        if journal is not None:
+            for f, dest_id in copies:
+                journal.copy(f, dest_id)
+            journal.finish_plan()
+        for f, dest_id in copies:
+            ArgParser._queue_copy(f, dest_id)
+
+    @staticmethod
+    def _share_request(file_id: str, user: str, email_message: str = None, notify: bool = True):
         user_permission = {
             'type': 'user',
             'role': 'writer',
             'emailAddress': f"{user}"
         }
-        response = ArgParser._service.permissions().create(fileId=file_id,
-                                                           body=user_permission,
-                                                           fields='id').execute()
+        param = {'emailMessage': email_message} if email_message and notify else {}
+        return ArgParser._get_service().permissions().create(fileId=file_id,
+                                                             body=user_permission,
+                                                             fields='id',
+                                                             sendNotificationEmail=notify,
+                                                             supportsAllDrives=True,
+                                                             **param)
+
+    @staticmethod
+    def _share_folder_with_user(file_id: str, user: str, email_message: str = None, notify: bool = True):
+        request = ArgParser._share_request(file_id, user, email_message=email_message, notify=notify)
+        response = ArgParser._execute(request, "permissions.create")
         return response.get('id')
 
+    @staticmethod
+    def _list_permissions(file_ids: List) -> Dict:
+        # The permissions of many files, read with batched permissions.list calls.  Files whose permissions
+        # could not be read are left out.
+        permissions = {}
+        more = []
+
+        def callback_for(file_id: str):
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    ArgParser.logger.warning(f"Could not read the permissions of {file_id}.  Error: {exception}")
+                    return
+                permissions[file_id] = response.get('permissions', [])
+                if 'nextPageToken' in response:
+                    more.append((file_id, response['nextPageToken']))
+            return callback
+
+        requests = []
+        for file_id in file_ids:
+            request = ArgParser._get_service().permissions().list(fileId=file_id,
+                                                                  fields=ArgParser._permission_fields,
+                                                                  pageSize=100, supportsAllDrives=True)
+            requests.append((request, callback_for(file_id)))
+        ArgParser._execute_batch(requests, "permissions.list")
+        # Only files shared with more than 100 principals need more pages.
+        for file_id, page_token in more:
+            while page_token:
+                request = ArgParser._get_service().permissions().list(fileId=file_id, pageToken=page_token,
+                                                                      fields=ArgParser._permission_fields,
+                                                                      pageSize=100, supportsAllDrives=True)
+                response = ArgParser._execute(request, "permissions.list")
+                permissions[file_id].extend(response.get('permissions', []))
+                page_token = response.get('nextPageToken')
+        return permissions
+
+    @staticmethod
+    def _apply_acl_plan(plan: AclPlan, notify: bool = True) -> int:
+        # Sends the grants and revocations of an AclPlan in batch requests, returns the number that failed.
+        failed = []
+
+        def callback_for(action: str):
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    ArgParser.logger.warning(f"Failed to {action}.  Error: {exception}")
+                    failed.append(action)
+                else:
+                    ArgParser.logger.debug(f"Done: {action}")
+            return callback
+
+        grants = [(ArgParser._share_request(folder_id, user, notify=notify),
+                   callback_for(f"share {folder_id} with {user}")) for folder_id, user in plan.grants]
+        ArgParser._execute_batch(grants, "permissions.create")
+        revocations = []
+        for folder_id, permission in plan.revocations:
+            request = ArgParser._get_service().permissions().delete(fileId=folder_id, permissionId=permission['id'],
+                                                                    supportsAllDrives=True)
+            revocations.append((request, callback_for(f"revoke {permission.get('emailAddress')} on {folder_id}")))
+        ArgParser._execute_batch(revocations, "permissions.delete")
+        return len(failed)
+
 
 
 
@@ -0,0 +1,203 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.tree import FolderNode, FileNode
+from googleapiclient.errors import HttpError
+from collections import defaultdict
+from typing import Dict, List
+from pathlib import Path
+import sqlite3
+import logging
+import json
+import time
+
+
+class MetadataCache:
+    """On-disk cache of crawled folder and file metadata, keyed by Drive ID."""
+
+    logger = logging.getLogger("gdrive-share.cache")
+
+    _folder_fields = "nextPageToken, files(id, name, mimeType, modifiedTime, parents)"
+
+    _schema = [
+        "CREATE TABLE IF NOT EXISTS items (id TEXT PRIMARY KEY, name TEXT NOT NULL, mime_type TEXT NOT NULL, "
+        "modified_time TEXT, resource TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS edges (parent_id TEXT NOT NULL, child_id TEXT NOT NULL, "
+        "PRIMARY KEY (parent_id, child_id))",
+        "CREATE INDEX IF NOT EXISTS edges_child ON edges (child_id)",
+        # The modifiedTime a folder had when its files were last listed.
+        "CREATE TABLE IF NOT EXISTS listings (folder_id TEXT PRIMARY KEY, modified_time TEXT)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+        # Folders found by name, see ArgParser._get_folder_by_name_under_parent.
+        "CREATE TABLE IF NOT EXISTS paths (parent_id TEXT NOT NULL, name TEXT NOT NULL, resource TEXT NOT NULL, "
+        "checked REAL NOT NULL, PRIMARY KEY (parent_id, name))",
+    ]
+
+    def __init__(self, path: Path, refresh: bool = False):
+        self.path = path
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.path_hits = 0
+        MetadataCache.logger.debug(f"Opening metadata cache at {path}")
+        self._db = sqlite3.connect(str(path))
+        with self._db:
+            for statement in MetadataCache._schema:
+                self._db.execute(statement)
+            # Listings cached with other fields than the crawls now ask for are missing data, so list them again.
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'list_fields'").fetchone()
+            if row is None or row[0] != ArgParser._list_fields:
+                self._db.execute("DELETE FROM listings")
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('list_fields', ?)",
+                                 (ArgParser._list_fields,))
+
+    def close(self) -> None:
+        self._db.close()
+
+    def summary(self) -> str:
+        return f"Metadata cache: {self.hits} hits, {self.misses} misses, {self.path_hits} folders found by name."
+
+    def get_path(self, parent_id: str, name: str, check: bool = True) -> Dict:
+        # A folder found by name.  With check, one files.get makes sure it still has its name and one of the parents
+        # it was found under (the real ID of My Drive rather than 'root'), and it is forgotten if not.
+        if self.refresh:
+            return None
+        row = self._db.execute("SELECT resource FROM paths WHERE parent_id = ? AND name = ?",
+                               (parent_id, name)).fetchone()
+        if row is None:
+            return None
+        folder = json.loads(row[0])
+        if check:
+            try:
+                request = ArgParser._get_service().files().get(fileId=folder['id'],
+                                                               fields='id, name, parents, trashed',
+                                                               supportsAllDrives=True)
+                current = ArgParser._execute(request, "files.get")
+            except HttpError as e:
+                MetadataCache.logger.debug(f"Could not check cached folder {name}: {e}")
+                current = None
+            if current is None or current.get('trashed') or current['name'] != name or \
+                    len(set(current.get('parents', [])) & set(folder.get('parents', []))) == 0:
+                MetadataCache.logger.debug(f"Cached folder {name} under {parent_id} changed, looking it up again")
+                self.forget_path(parent_id, name)
+                return None
+            with self._db:
+                self._db.execute("UPDATE paths SET checked = ? WHERE parent_id = ? AND name = ?",
+                                 (time.time(), parent_id, name))
+        self.path_hits += 1
+        return folder
+
+    def forget_path(self, parent_id: str, name: str) -> None:
+        with self._db:
+            self._db.execute("DELETE FROM paths WHERE parent_id = ? AND name = ?", (parent_id, name))
+
+    def set_path(self, parent_id: str, name: str, folder: Dict) -> None:
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO paths (parent_id, name, resource, checked) VALUES (?, ?, ?, ?)",
+                             (parent_id, name, json.dumps(folder), time.time()))
+
+    @staticmethod
+    def _list_all_folders(drive_id: str = None) -> Dict:
+        # Every folder in the drive (the shared drive drive_id, if given) is listed with a few large pages instead
+        # of one listing per folder.
+        query = f"mimeType='{ArgParser._folder_mimetype}' and trashed=false"
+        folders = ArgParser._get_children_by_query(query, fields=MetadataCache._folder_fields,
+                                                   page_size=ArgParser._page_size, drive_id=drive_id)
+        return {f['id']: f for f in folders}
+
+    def _is_fresh(self, folder_id: str, modified_time: str) -> bool:
+        if self.refresh or modified_time is None:
+            return False
+        row = self._db.execute("SELECT modified_time FROM listings WHERE folder_id = ?", (folder_id,)).fetchone()
+        return row is not None and row[0] == modified_time
+
+    def _store_folders(self, folders: List, children: Dict) -> None:
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO items (id, name, mime_type, modified_time, resource) VALUES (?, ?, ?, ?, ?)",
+                [(f['id'], f['name'], f['mimeType'], f.get('modifiedTime'), json.dumps(f)) for f in folders])
+            for f in folders:
+                self._db.execute("DELETE FROM edges WHERE parent_id = ? AND child_id IN "
+                                 "(SELECT id FROM items WHERE mime_type = ?)", (f['id'], ArgParser._folder_mimetype))
+                self._db.executemany("INSERT OR IGNORE INTO edges (parent_id, child_id) VALUES (?, ?)",
+                                     [(f['id'], c['id']) for c in children[f['id']]])
+
+    def _store_files(self, folders: List, files: List) -> None:
+        # Replaces the files cached under the given folders with a fresh listing.
+        folder_ids = {f['id'] for f in folders}
+        with self._db:
+            for f in folders:
+                self._db.execute("DELETE FROM edges WHERE parent_id = ? AND child_id IN "
+                                 "(SELECT id FROM items WHERE mime_type != ?)", (f['id'], ArgParser._folder_mimetype))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO items (id, name, mime_type, modified_time, resource) VALUES (?, ?, ?, ?, ?)",
+                [(f['id'], f['name'], f['mimeType'], f.get('modifiedTime'), json.dumps(f)) for f in files])
+            self._db.executemany("INSERT OR IGNORE INTO edges (parent_id, child_id) VALUES (?, ?)",
+                                 [(p, f['id']) for f in files for p in f.get('parents', []) if p in folder_ids])
+            self._db.executemany("INSERT OR REPLACE INTO listings (folder_id, modified_time) VALUES (?, ?)",
+                                 [(f['id'], f.get('modifiedTime')) for f in folders])
+
+    def _cached_files(self, folder_ids: List) -> Dict:
+        files = defaultdict(list)
+        for i in range(0, len(folder_ids), 500):
+            chunk = folder_ids[i:i + 500]
+            rows = self._db.execute(
+                f"SELECT e.parent_id, i.resource FROM edges e JOIN items i ON i.id = e.child_id "
+                f"WHERE i.mime_type != ? AND e.parent_id IN ({', '.join('?' * len(chunk))})",
+                [ArgParser._folder_mimetype] + chunk)
+            for parent_id, resource in rows:
+                files[parent_id].append(FileNode(json.loads(resource)))
+        return files
+
+    def crawl(self, root_folder: Dict, include_files: bool = True, batch_size: int = 50, drive_id: str = None) -> Dict:
+        # Builds the same nested dict as the other crawls.  The folder skeleton comes from a listing of every
+        # folder, and files are only listed again for folders whose modifiedTime changed since they were cached.
+        folders = MetadataCache._list_all_folders(drive_id)
+        children = defaultdict(list)
+        for f in folders.values():
+            for p in f.get('parents', []):
+                children[p].append(f)
+
+        root = folders.get(root_folder['id'], {'id': root_folder['id'], 'name': root_folder['name'],
+                                               'mimeType': ArgParser._folder_mimetype})
+        subtree = [root]
+        seen = {root['id']}
+        for f in subtree:
+            for c in children[f['id']]:
+                if c['id'] not in seen:
+                    seen.add(c['id'])
+                    subtree.append(c)
+        self._store_folders(subtree, children)
+
+        if include_files:
+            stale = [f for f in subtree if not self._is_fresh(f['id'], f.get('modifiedTime'))]
+            self.hits += len(subtree) - len(stale)
+            self.misses += len(stale)
+            MetadataCache.logger.debug(f"{len(subtree) - len(stale)} cached folders are current, "
+                                       f"{len(stale)} need listing")
+            for i in range(0, len(stale), batch_size):
+                chunk = stale[i:i + batch_size]
+                query = " or ".join(f"'{f['id']}' in parents" for f in chunk)
+                query = f"({query}) and trashed=false and not mimeType='{ArgParser._folder_mimetype}'"
+                files = ArgParser._get_children_by_query(query, fields=ArgParser._list_fields,
+                                                         page_size=ArgParser._page_size, drive_id=drive_id)
+                self._store_files(chunk, files)
+            files = self._cached_files([f['id'] for f in subtree])
+        else:
+            files = {}
+
+        def build(folder: Dict, parent_name: str) -> Dict:
+            node = FolderNode(folder['name'], folder['id'], parent_name)
+            if len(files.get(folder['id'], [])) > 0:
+                node['child_files'] = files[folder['id']]
+            return node
+
+        result = build(root, root['name'])
+        level = [(root, result)]
+        while len(level) > 0:
+            next_level = []
+            for folder, node in level:
+                for c in children[folder['id']]:
+                    child = build(c, folder['name'])
+                    node.setdefault('child_folders', []).append(child)
+                    next_level.append((c, child))
+            level = next_level
+        return result
@@ -0,0 +1,35 @@
+from typing import Dict
+from pathlib import Path
+import logging
+import json
+import os
+
+
+class MergeCheckpoints:
+    """State kept between merges for each uploader folder, stored as JSON next to token.json."""
+
+    logger = logging.getLogger("gdrive-share.checkpoint")
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._state = {}
+        if path.exists():
+            try:
+                with open(path) as f:
+                    self._state = json.load(f)
+            except ValueError as e:
+                MergeCheckpoints.logger.warning(f"Ignoring unreadable checkpoint file {path}.  Error: {e}")
+
+    def get(self, folder_id: str) -> Dict:
+        return self._state.get(folder_id)
+
+    def set(self, folder_id: str, **values) -> None:
+        self._state.setdefault(folder_id, {}).update(values)
+
+    def save(self) -> None:
+        # Written to a temporary file first so an interrupted run never leaves a truncated checkpoint.
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(tmp, self.path)
+        MergeCheckpoints.logger.debug(f"Saved checkpoints to {self.path}")
@@ -1,11 +1,10 @@
 from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.session import Session
+from gdrive_sharing_manager.filters import FolderFilter
 from typing import List, Dict
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import traceback
+import time
 import sys
 import logging
 from pathlib import Path
@@ -16,6 +15,8 @@ class Create(ArgParser):
 
     parser = None
     logger = logging.getLogger("gdrive-share.create")
+    # --only and --exclude patterns of the configuration file, used when none are given on the command line.
+    _config_patterns = {}
 
     def __init__(self):
         super(Create, Create.__init__())
@@ -27,78 +28,78 @@ class Create(ArgParser):
             help="Create empty folder structure to share with Ludo fan.",
             parents=parents)
         source_group = Create.parser.add_mutually_exclusive_group(required=False)
-        source_group.add_argument('--source-root', help="Name of source folder (will use first one found).  "
+        source_group.add_argument('--source-root', help="Name or path (e.g. 'Concerts/2026') of source folder "
+                                                        "(will use first one found).  "
                                                         "This is where the repository of files is.")
         source_group.add_argument('--source-root-id', help="Specific ID of the source folder.")
         dest_group = Create.parser.add_mutually_exclusive_group(required=False)
-        dest_group.add_argument('--dest-root', help="Name of destination folder (will use first one found).  "
+        dest_group.add_argument('--dest-root', help="Name or path (e.g. 'Concerts/2026') of destination "
+                                                    "folder (will use first one found).  "
                                                     "The new folder to share will be created here.")
         dest_group.add_argument('--dest-root-id', help="Specific ID of the destination folder.")
+        Create.parser.add_argument('--folder-creation', choices=["recursive", "level"], default="recursive",
+                                   help="How to create the folder structure.  'recursive' creates one folder "
+                                        "at a time, 'level' creates all folders of the same depth in batch "
+                                        "requests using pre-generated IDs.")
+        Create.parser.add_argument('--batch-size', type=int, default=100,
+                                   help="Number of folders created per batch request (max 100) when using "
+                                        "'--folder-creation level'.")
+        Create.parser.add_argument('--max-depth', type=int,
+                                   help="Only copy folders up to this many levels below the source folder, e.g. 1 "
+                                        "for its subfolders only.")
+        Create.parser.add_argument('--only', action="append",
+                                   help="Only copy the folders matching this path or glob of folder names below the "
+                                        "source folder, e.g. '2026/*', with their subfolders and the folders on the "
+                                        "way to them.  Can be used multiple times.")
+        Create.parser.add_argument('--exclude', action="append",
+                                   help="Don't copy the folders matching this path or glob, e.g. 'Archive' or "
+                                        "'*/Old*', or their subfolders.  Can be used multiple times.")
+        Create.parser.add_argument('--skip-empty', action="store_true",
+                                   help="Don't copy folders without files in them or below them.  This lists the "
+                                        "files of the source folder as well as its folders.")
 
         # Make sure that create() is called when this function is used because
         # there are no subcommands.
         Create.parser.set_defaults(func=Create.create)
 
+        Create._config_patterns = {}
         if defaults is not None:
             if Create.__name__ in defaults.keys():
+                for key in ('only', 'exclude'):
+                    if key in defaults[Create.__name__].keys():
+                        # Several patterns can be configured, separated by commas.  Like the configured users,
+                        # they are not defaults of the append options, which would add to them.
+                        Create._config_patterns[key] = [p.strip() for p in defaults[Create.__name__].pop(key).split(",")
+                                                        if p.strip()]
                 Create.parser.set_defaults(**defaults[Create.__name__])
 
     def create(self):
-        if not self.user:
+        if not self.users:
             Create.logger.critical("Must specify user to create upload folder for!")
             sys.exit(1)
-
-        # Need to set token/credential
-        test_token_path = self.creds.parent.joinpath("token.json")
-        if test_token_path.exists():
-            Create._token = test_token_path
-
-        creds = None
-        if Create._token.exists():
-            Create.logger.debug(f"Retrieving credentials from {Create._token.resolve()}")
-            creds = Credentials.from_authorized_user_file(str(Create._token), Create._SCOPES)
-        if not creds or not creds.valid:
-            Create.logger.debug(f"Creds are invalid.")
-            if creds and creds.expired and creds.refresh_token:
-                Create.logger.debug(f"Refreshing expired credentials")
-                creds.refresh(Request())
-            else:
-                if not Create._creds.exists():
-                    try:
-                        Create._creds = Path(self.creds).expanduser()
-                    except:
-                        Create.logger.critical("Could not find credential!")
-                        sys.exit(1)
-                    if not Create._creds.exists():
-                        Create.logger.critical("Could not find credential!")
-                        sys.exit(1)
-                Create.logger.debug(f"Retrieving credentials from {Create._creds.resolve()}")
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    str(Create._creds), Create._SCOPES)
-                creds = flow.run_local_server(port=0)
-
-            # Save the creds for the next run.
-            with open(Create._token, "w") as token:
-                Create.logger.debug(f"Writing token to {Create._token.resolve()}")
-                token.write(creds.to_json())
+        if self.max_depth is not None and self.max_depth < 0:
+            Create.logger.critical("--max-depth can't be negative!")
+            sys.exit(1)
+        folder_filter = Create._get_folder_filter(self)
 
         try:
-            Create.logger.debug(f"Connecting to API")
-            ArgParser._service = build('drive', 'v3', credentials=creds)
-            Create.logger.info(f"Connected to API")
+            Session.start(self)
 
+            ArgParser._phase("resolve roots")
             Create.logger.debug(f"Retrieving source (main media) folder")
             if not self.source_root_id:
                 if not self.source_root:
                     Create.logger.critical("Must specify a source folder or source folder ID!")
                     sys.exit(1)
                 # Get the root folder information
-                Create.logger.debug(f"Getting folder by name: {self.source_root}")
-                source_folder = ArgParser._get_folder_by_name_under_parent(parent_id='root',
-                                                                           folder_name=self.source_root)
+                Create.logger.debug(f"Getting folder by path: {self.source_root}")
+                source_folder = ArgParser._get_folder_by_path(self.source_root)
             else:
                 Create.logger.debug(f"Getting folder by ID: {self.source_root_id}")
                 source_folder = ArgParser._get_folder_by_id(self.source_root_id)
+            if source_folder is None:
+                Create.logger.critical("Could not find the source folder!")
+                sys.exit(1)
 
             Create.logger.info(f"Retrieved source folder.")
             Create.logger.debug(f"Source folder ID: {source_folder['id']}")
@@ -109,50 +110,112 @@ class Create(ArgParser):
                     Create.logger.critical("Must specify a destination folder or destination folder ID!")
                     sys.exit(1)
                 # Get the root folder information
-                Create.logger.debug(f"Getting folder by name: {self.dest_root}")
-                dest_folder = ArgParser._get_folder_by_name_under_parent(parent_id='root',
-                                                                         folder_name=self.dest_root)
+                Create.logger.debug(f"Getting folder by path: {self.dest_root}")
+                dest_folder = ArgParser._get_folder_by_path(self.dest_root)
             else:
                 Create.logger.debug(f"Getting folder by ID: {self.dest_root_id}")
-                source_folder = ArgParser._get_folder_by_id(self.dest_root_id)
+                dest_folder = ArgParser._get_folder_by_id(self.dest_root_id)
+            if dest_folder is None:
+                Create.logger.critical("Could not find the destination folder!")
+                sys.exit(1)
 
             Create.logger.info(f"Retrieved destination folder")
             Create.logger.debug(f"Destination folder ID: {dest_folder['id']}")
 
+            ArgParser._phase("crawl source")
             Create.logger.debug("Retrieving folder structure")
             queue = [{
                 "id": source_folder['id'],
                 "name": source_folder['name']
             }]
 
-            folder_structure = ArgParser._get_files_folders_dict(queue, include_files=False)
+            if folder_filter is not None:
+                Create.logger.info(f"Only copying folders {folder_filter.describe()}")
+            # Files are only listed to tell which folders are empty.
+            folder_structure = ArgParser._get_files_folders_dict(queue, include_files=self.skip_empty, crawl=self.crawl,
+                                                                 crawl_batch=self.crawl_batch,
+                                                                 folder_filter=folder_filter)
+            if self.skip_empty:
+                Create.logger.info(f"Skipping {ArgParser._drop_empty_folders(folder_structure)} folders without files")
+            Create.logger.info(f"Copying {Create._count_folders(folder_structure)} folders for each user")
 
         except HttpError as e:
             Create.logger.critical(f"The following error occurred: {e}")
             traceback.print_exc()
             sys.exit(1)
 
-        try:
-            Create.logger.info(f"Creating new folder for {self.user}")
-            new_upload_folder_id = Create._create_folder(dest_folder['id'], self.user)
-            Create.logger.info(f"Creating folder structure under {self.user}")
-            if "child_folders" in folder_structure.keys():
-                Create._duplicate_folder_structure(new_upload_folder_id, folder_structure['child_folders'])
-            else:
-                Create.logger.debug("No folder structure to create.")
-        except HttpError as e:
-            Create.logger.critical(f"The following error occurred: {e}")
-            traceback.print_exc()
+        ArgParser._batch_size = max(1, min(self.batch_size, ArgParser._max_batch_size))
+        results = []
+        for user in self.users:
+            # The source skeleton was crawled once above and is shared by every user.
+            calls_before = ArgParser._api_call_count()
+            started = time.monotonic()
+            try:
+                status = Create._create_for_user(user, dest_folder, folder_structure, self.folder_creation)
+            except HttpError as e:
+                Create.logger.critical(f"The following error occurred for {user}: {e}")
+                traceback.print_exc()
+                status = "failed"
+            results.append((user, ArgParser._api_call_count() - calls_before, time.monotonic() - started, status))
+
+        if ArgParser._executor is not None:
+            ArgParser._executor.shutdown()
+        print(ArgParser._user_summary(results))
+        Create.logger.info(ArgParser._governor.summary())
+        if ArgParser._cache is not None:
+            Create.logger.info(ArgParser._cache.summary())
+            ArgParser._cache.close()
+        if ArgParser._stats is not None:
+            if self.stats:
+                print(ArgParser._stats.summary())
+            if self.stats_file:
+                ArgParser._stats.write(Path(self.stats_file).expanduser())
+        if any(status != "ok" for _, _, _, status in results):
             sys.exit(1)
 
+    def _get_folder_filter(self) -> FolderFilter:
+        # The folders to copy, or None to copy all of them.  Patterns given on the command line replace the
+        # configured ones.
+        only = self.only if self.only is not None else Create._config_patterns.get('only')
+        exclude = self.exclude if self.exclude is not None else Create._config_patterns.get('exclude')
+        folder_filter = FolderFilter(self.max_depth, only, exclude)
+        return folder_filter if folder_filter.describe() != "" else None
+
+    @staticmethod
+    def _count_folders(folder_structure: Dict) -> int:
+        # Folders below the root of the skeleton, which is what is created for each user.
+        count = 0
+        stack = [folder_structure]
+        while len(stack) > 0:
+            folder = stack.pop()
+            count += len(folder.get('child_folders', []))
+            stack.extend(folder.get('child_folders', []))
+        return count
+
+    @staticmethod
+    def _create_for_user(user: str, dest_folder: Dict, folder_structure: Dict, folder_creation: str) -> str:
+        # Creates and shares the upload folder of user, returns the status for the summary.
+        ArgParser._phase("create")
+        Create.logger.info(f"Creating new folder for {user}")
+        new_upload_folder_id = Create._create_folder(dest_folder['id'], user)
+        Create.logger.info(f"Creating folder structure under {user}")
+        if "child_folders" in folder_structure.keys():
+            if folder_creation == "level":
+                missing = Create._duplicate_folder_structure_by_level(new_upload_folder_id,
+                                                                      folder_structure['child_folders'])
+                if missing > 0:
+                    # Like a failed create of the other modes, the incomplete folder is not shared.
+                    Create.logger.error(f"Could not create {missing} folders for {user}, not sharing the folder")
+                    return f"{missing} folders failed"
+            else:
+                Create._duplicate_folder_structure(new_upload_folder_id, folder_structure['child_folders'])
+        else:
+            Create.logger.debug("No folder structure to create.")
         Create.logger.info("Folder structure completed.")
 
         # Time to share the folder.
-        Create.logger.debug(f"Sharing folder with: {self.user}")
-        try:
-            perm_id = ArgParser._share_folder_with_user(file_id=new_upload_folder_id, user=self.user)
-        except HttpError as e:
-            Create.logger.critical(f"The following error occurred: {e}")
-            traceback.print_exc()
-            sys.exit(1)
-        Create.logger.info(f"Shared folder with: {self.user}")
\ No newline at end of file
+        ArgParser._phase("share")
+        Create.logger.debug(f"Sharing folder with: {user}")
+        ArgParser._share_folder_with_user(file_id=new_upload_folder_id, user=user)
+        Create.logger.info(f"Shared folder with: {user}")
+        return "ok"
\ No newline at end of file
@@ -0,0 +1,64 @@
+from collections import defaultdict
+from typing import Dict
+import logging
+
+
+class DedupeIndex:
+    """Index of the files in the main library by content, used to skip copying files that are already there.
+
+    Files are keyed on md5Checksum plus size.  Files without a checksum (e.g. Google Docs) are never skipped.
+    The 'folder' policy only skips a file when the same content is already in its destination folder, the
+    'global' policy skips it when the content is anywhere in the library.
+    """
+
+    logger = logging.getLogger("gdrive-share.dedupe")
+
+    policies = ["folder", "global"]
+
+    def __init__(self, policy: str = "global"):
+        if policy not in DedupeIndex.policies:
+            raise ValueError(f"Unknown dedupe policy: {policy}")
+        self.policy = policy
+        # (md5Checksum, size) to the IDs of the folders holding that content.
+        self._folders = defaultdict(set)
+        self.skipped = 0
+        self.skipped_bytes = 0
+
+    @staticmethod
+    def _key(file: Dict):
+        if 'md5Checksum' not in file.keys():
+            return None
+        return file['md5Checksum'], int(file.get('size', 0))
+
+    def add(self, file: Dict, folder_id: str) -> None:
+        key = DedupeIndex._key(file)
+        if key is not None:
+            self._folders[key].add(folder_id)
+
+    def add_tree(self, tree: Dict) -> None:
+        # Indexes every file of a nested folder dict, see ArgParser._get_files_folders_dict.
+        stack = [tree]
+        count = 0
+        while len(stack) > 0:
+            folder = stack.pop()
+            for f in folder.get('child_files', []):
+                self.add(f, folder['folder_id'])
+                count += 1
+            stack.extend(folder.get('child_folders', []))
+        DedupeIndex.logger.debug(f"Indexed {count} files, {len(self._folders)} distinct")
+
+    def is_duplicate(self, file: Dict, dest_id: str) -> bool:
+        # A file that is not a duplicate is added to the index, so it is only copied once per run.
+        key = DedupeIndex._key(file)
+        if key is None:
+            return False
+        folders = self._folders[key]
+        if (self.policy == "global" and len(folders) > 0) or dest_id in folders:
+            self.skipped += 1
+            self.skipped_bytes += key[1]
+            return True
+        folders.add(dest_id)
+        return False
+
+    def summary(self) -> str:
+        return f"Skipped {self.skipped} duplicate files ({self.skipped_bytes / (1024 * 1024):.1f} MB)."
@@ -0,0 +1,114 @@
+from typing import Dict, Tuple
+import unicodedata
+
+# Folder dictionaries are the nested dicts (or the FolderNode and FileNode of tree.py, which are read the same way)
+# built by ArgParser._get_files_folders_dict:
+# dict {
+#       'folder_name'
+#       'folder_id'
+#       'parent_name'
+#       (Optional List) 'child_files'
+#       (Optional List) 'child_folders'
+# }
+
+_folder_mimetype = "application/vnd.google-apps.folder"
+
+
+def normalize_name(name: str) -> str:
+    # Names typed on different devices can differ in unicode composition and trailing whitespace.
+    return unicodedata.normalize("NFC", name).strip()
+
+
+def index_tree(root: Dict) -> Dict:
+    """Maps the normalized relative path (a tuple of names) of every folder under root to its dict."""
+    index = {(): root}
+    stack = [((), root)]
+    while len(stack) > 0:
+        path, folder = stack.pop()
+        for child in folder.get('child_folders', []):
+            child_path = path + (normalize_name(child['folder_name']),)
+            # For now we'll always just take the first one if there are multiple name matches.
+            if child_path not in index:
+                index[child_path] = child
+                stack.append((child_path, child))
+    return index
+
+
+class MergePlan:
+    """Flat list of the folders to create and files to copy to merge one tree into another."""
+
+    def __init__(self):
+        # (path, parent path, folder name), parents always come before their children.
+        self.folders = []
+        # (file, destination folder path)
+        self.copies = []
+
+    def __len__(self) -> int:
+        return len(self.folders) + len(self.copies)
+
+
+def diff_trees(orig: Dict, new_: Dict, orig_index: Dict = None) -> Tuple[MergePlan, Dict]:
+    """Plans copying every file in new_ to the folder with the same relative path in orig.
+
+    Folders missing from orig are planned only when they (or their subfolders) hold files.  Runs in time linear
+    in the size of both trees.  Returns the plan and the index of orig, which can be passed back in to diff
+    another tree against the same destination.
+    """
+    if orig_index is None:
+        orig_index = index_tree(orig)
+    plan = MergePlan()
+    planned = set()
+    # (normalized path, original names along the path, folder)
+    stack = [((), (), new_)]
+    while len(stack) > 0:
+        path, names, folder = stack.pop()
+        files = [f for f in folder.get('child_files', []) if f['mimeType'] != _folder_mimetype]
+        if len(files) > 0:
+            _plan_folder(plan, path, names, orig_index, planned)
+            plan.copies.extend((f, path) for f in files)
+        for child in reversed(folder.get('child_folders', [])):
+            stack.append((path + (normalize_name(child['folder_name']),), names + (child['folder_name'],), child))
+    return plan, orig_index
+
+
+def _plan_folder(plan: MergePlan, path: Tuple, names: Tuple, orig_index: Dict, planned: set) -> None:
+    # Plans the creation of path and any of its missing ancestors, outermost first.
+    missing = []
+    while path not in orig_index and path not in planned:
+        missing.append(path)
+        path = path[:-1]
+    for p in reversed(missing):
+        planned.add(p)
+        plan.folders.append((p, p[:-1], names[len(p) - 1]))
+
+
+def plan_to_dict(plan: MergePlan, orig_index: Dict) -> Dict:
+    """Plan as plain JSON-able data.  Folders and copies whose parent already exists carry its Drive ID."""
+    def folder_id(path: Tuple) -> str:
+        return orig_index[path]['folder_id'] if path in orig_index else None
+    return {
+        'folders': [{'path': list(path), 'name': name, 'parent_id': folder_id(parent_path)}
+                    for path, parent_path, name in plan.folders],
+        'copies': [{'file': dict(f), 'path': list(path), 'dest_id': folder_id(path)} for f, path in plan.copies],
+    }
+
+
+def plan_from_dict(data: Dict, orig_index: Dict = None) -> Tuple[MergePlan, Dict]:
+    """Reverses plan_to_dict.  Returns the plan and an index of the destination folders it refers to, which
+    (like with diff_trees) can be passed back in for the next plan against the same destination."""
+    if orig_index is None:
+        orig_index = {}
+
+    def known(path: Tuple, folder_id: str) -> None:
+        if folder_id is not None and path not in orig_index:
+            orig_index[path] = {'folder_id': folder_id, 'folder_name': path[-1] if len(path) > 0 else ""}
+    plan = MergePlan()
+    for folder in data['folders']:
+        path = tuple(folder['path'])
+        known(path[:-1], folder['parent_id'])
+        plan.folders.append((path, path[:-1], folder['name']))
+    for copy in data['copies']:
+        path = tuple(copy['path'])
+        known(path, copy['dest_id'])
+        plan.copies.append((copy['file'], path))
+    return plan, orig_index
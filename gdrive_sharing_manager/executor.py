@@ -0,0 +1,69 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, List
+import threading
+import logging
+
+
+class DriveExecutor:
+    """Runs Drive work items on a pool of threads, each with its own Drive client."""
+
+    logger = logging.getLogger("gdrive-share.executor")
+
+    def __init__(self, service_factory: Callable, workers: int):
+        # Drive clients are not thread-safe, so every worker thread builds its own client with service_factory.
+        # With the pooled transport the clients share its connections.
+        self._service_factory = service_factory
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gdrive-share",
+                                        initializer=self._init_thread)
+        self._futures = []
+        self._lock = threading.Lock()
+        self.workers = workers
+
+    def _init_thread(self) -> None:
+        DriveExecutor.logger.debug(f"Building Drive client for {threading.current_thread().name}")
+        ArgParser._local.service = self._service_factory()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        future = self._pool.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def submit_copy(self, file, dest_id: str) -> Future:
+        return self.submit(ArgParser._copy_file, file, dest_id)
+
+    def submit_copies(self, pending: List) -> Future:
+        return self.submit(ArgParser._send_copies, pending)
+
+    def create_tree(self, parent_id: str, folders: List) -> None:
+        # A folder is only created once its parent exists, siblings are created concurrently.
+        for f in folders:
+            self.submit(self._create_subtree, parent_id, f)
+
+    def _create_subtree(self, parent_id: str, folder) -> str:
+        # Children are queued before this work item completes so wait() always sees them.
+        new_folder_id = ArgParser._create_folder(parent_id=parent_id, folder_name=folder['folder_name'])
+        if "child_folders" in folder.keys():
+            self.create_tree(new_folder_id, folder['child_folders'])
+        return new_folder_id
+
+    def wait(self) -> List:
+        # Work items can queue further work (e.g. subfolders), so keep waiting until nothing is left.  Returns the
+        # exceptions of the work items that failed.
+        failures = []
+        while True:
+            with self._lock:
+                futures = self._futures
+                self._futures = []
+            if len(futures) == 0:
+                break
+            for future in futures:
+                if future.exception() is not None:
+                    DriveExecutor.logger.error(f"Work item failed.  Error: {future.exception()}")
+                    failures.append(future.exception())
+        return failures
+
+    def shutdown(self) -> None:
+        self.wait()
+        self._pool.shutdown()
@@ -0,0 +1,124 @@
+from gdrive_sharing_manager.diff import normalize_name
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+from fnmatch import fnmatchcase
+
+_size_units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_time(value: str) -> str:
+    """An ISO 8601 date or time as the UTC form used in files.list queries.  Times without an offset are local."""
+    moment = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def parse_size(value: str) -> int:
+    """A number of bytes, optionally with a K, M or G suffix (powers of 1024)."""
+    value = value.strip().upper().rstrip("B")
+    if value[-1:] in _size_units:
+        return int(float(value[:-1]) * _size_units[value[-1]])
+    return int(value)
+
+
+class FileFilter:
+    """Which uploaded files a merge looks at.
+
+    The conditions Drive can evaluate (time and MIME type) are added to the files.list queries with query(), so
+    other files are never sent.  Drive has no query term for the size, which is checked on the listed files.
+    """
+
+    def __init__(self, since: str = None, mime_types: List = None, min_size: int = None):
+        # since is a time as returned by parse_time, mime_types are types such as 'video/mp4' or 'image/*'.
+        self.since = since
+        self.mime_types = [m.strip() for m in mime_types or [] if m.strip() != ""]
+        self.min_size = min_size
+
+    def query(self) -> str:
+        # The conditions as a files.list query term, or None if there are none.
+        terms = []
+        if self.since is not None:
+            # Uploads keep the modifiedTime of the original file, so one uploaded since may look older.
+            terms.append(f"(modifiedTime > '{self.since}' or createdTime > '{self.since}')")
+        if len(self.mime_types) > 0:
+            types = [f"mimeType contains '{m[:-1]}'" if m.endswith("/*") else f"mimeType = '{m}'"
+                     for m in self.mime_types]
+            terms.append(f"({' or '.join(types)})")
+        return " and ".join(terms) if len(terms) > 0 else None
+
+    def matches(self, file: Dict, listed: bool = False) -> bool:
+        # listed files came from a query with query() in it, so only the size is left to check.
+        if self.min_size is not None and int(file.get('size', 0)) < self.min_size:
+            return False
+        if listed:
+            return True
+        if self.since is not None:
+            since = datetime.fromisoformat(self.since).replace(tzinfo=timezone.utc)
+            times = [datetime.fromisoformat(file[key].replace("Z", "+00:00"))
+                     for key in ('modifiedTime', 'createdTime') if key in file]
+            if not any(t > since for t in times):
+                return False
+        if len(self.mime_types) > 0:
+            mime_type = file.get('mimeType', "")
+            if not any(mime_type.startswith(m[:-1]) if m.endswith("/*") else mime_type == m
+                       for m in self.mime_types):
+                return False
+        return True
+
+    def describe(self) -> str:
+        conditions = []
+        if self.since is not None:
+            conditions.append(f"since {self.since} UTC")
+        if len(self.mime_types) > 0:
+            conditions.append(f"of type {', '.join(self.mime_types)}")
+        if self.min_size is not None:
+            conditions.append(f"of at least {self.min_size} bytes")
+        return " ".join(conditions)
+
+
+def _split_pattern(pattern: str) -> Tuple:
+    return tuple(normalize_name(part) for part in pattern.strip().strip("/").split("/"))
+
+
+def _inside(path: Tuple, pattern: Tuple) -> bool:
+    # Whether path is a folder matching pattern or a folder below one.
+    return len(path) >= len(pattern) and all(fnmatchcase(name, part) for name, part in zip(path, pattern))
+
+
+def _leads_to(path: Tuple, pattern: Tuple) -> bool:
+    # Whether folders below path could match pattern.
+    return len(path) < len(pattern) and all(fnmatchcase(name, part) for name, part in zip(path, pattern))
+
+
+class FolderFilter:
+    """Which folders of a tree are crawled, by depth and by their path of names from the root.
+
+    Patterns are globs matched one folder name at a time, e.g. '2026/*' for every folder in 2026.  A folder is
+    kept when it is at most max_depth deep, doesn't match an exclude pattern and, when there are only patterns, is
+    in a folder matching one of them or on the way to one.  The crawls don't list the folders that aren't kept.
+    """
+
+    def __init__(self, max_depth: int = None, only: List = None, exclude: List = None):
+        self.max_depth = max_depth
+        self.only = [_split_pattern(p) for p in only or [] if p.strip("/ ") != ""]
+        self.exclude = [_split_pattern(p) for p in exclude or [] if p.strip("/ ") != ""]
+
+    def wanted(self, path: Tuple) -> bool:
+        # path holds the names of the folders from the root (excluded) to the folder (included).
+        if self.max_depth is not None and len(path) > self.max_depth:
+            return False
+        path = tuple(normalize_name(name) for name in path)
+        if any(_inside(path, pattern) for pattern in self.exclude):
+            return False
+        return len(self.only) == 0 or any(_inside(path, p) or _leads_to(path, p) for p in self.only)
+
+    def describe(self) -> str:
+        conditions = []
+        if self.max_depth is not None:
+            conditions.append(f"at most {self.max_depth} deep")
+        if len(self.only) > 0:
+            conditions.append(f"in {', '.join('/'.join(p) for p in self.only)}")
+        if len(self.exclude) > 0:
+            conditions.append(f"not in {', '.join('/'.join(p) for p in self.exclude)}")
+        return " ".join(conditions)
@@ -0,0 +1,121 @@
+from typing import Dict, List
+from pathlib import Path
+import threading
+import logging
+import json
+import time
+import os
+
+
+class MergeJournal:
+    """Append-only journal of the folders created and the files planned and copied by a merge.
+
+    Each line is a JSON record: 'start' (with any values needed to finish the merge), 'folder' for a created
+    folder, 'copy' for a planned copy or move, 'planned' once every copy of the plan is recorded and 'done' when a
+    copy or move completed.  A merge whose plan was recorded can be resumed from the journal alone.  Records are
+    fsynced in batches, so at most the last batch of completed copies is lost if the process dies.
+    """
+
+    logger = logging.getLogger("gdrive-share.journal")
+
+    def __init__(self, path: Path, sync_every: int = 200, sync_interval: float = 2.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.meta = {}
+        self.planned = False
+        self._copies = {}
+        self._done = set()
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+
+    def open(self, resume: bool = False) -> None:
+        # Without resume an existing journal is replaced, with it its records are loaded and appended to.
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume and self.path.exists():
+            self._load()
+            self._file = open(self.path, "a")
+        else:
+            if self.path.exists():
+                MergeJournal.logger.warning("Replacing the journal of an unfinished merge, use --resume to "
+                                            "continue it instead")
+            self._file = open(self.path, "w")
+
+    def _load(self) -> None:
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may have been cut short when the process died.
+                    MergeJournal.logger.debug(f"Ignoring unreadable journal line: {line!r}")
+                    continue
+                if record['op'] == "start":
+                    self.meta.update(record.get('meta', {}))
+                elif record['op'] == "copy":
+                    self._copies[record['file']['id']] = (record['file'], record['dest'])
+                elif record['op'] == "planned":
+                    self.planned = True
+                elif record['op'] == "done":
+                    self._done.add(record['src'])
+        MergeJournal.logger.debug(f"Loaded journal {self.path}: {len(self._copies)} planned copies, "
+                                  f"{len(self._done)} done")
+
+    def _append(self, record: Dict, sync: bool = False) -> None:
+        with self._lock:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._unsynced += 1
+            if sync or self._unsynced >= self.sync_every or \
+                    time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def start(self, **meta) -> None:
+        # Starts a new plan, replacing any planned copies of an unfinished one.  Completed copies are kept.
+        self.meta.update(meta)
+        self.planned = False
+        self._copies = {}
+        self._append({'op': "start", 'meta': meta})
+
+    def folder(self, path, folder_id: str) -> None:
+        self._append({'op': "folder", 'path': list(path), 'id': folder_id})
+
+    def copy(self, file: Dict, dest_id: str) -> None:
+        self._copies[file['id']] = (file, dest_id)
+        self._append({'op': "copy", 'file': dict(file), 'dest': dest_id})
+
+    def finish_plan(self) -> None:
+        self.planned = True
+        self._append({'op': "planned", 'count': len(self._copies)}, sync=True)
+
+    def done(self, file_id: str, new_id: str = None) -> None:
+        self._done.add(file_id)
+        self._append({'op': "done", 'src': file_id, 'new': new_id})
+
+    def is_done(self, file_id: str) -> bool:
+        return file_id in self._done
+
+    def remaining(self) -> List:
+        # (file, destination folder ID) of the planned copies that were not completed.
+        return [(f, dest_id) for file_id, (f, dest_id) in self._copies.items() if file_id not in self._done]
+
+    def close(self, complete: bool = False) -> None:
+        # The journal of a complete merge is removed, otherwise it is kept so the merge can be resumed.
+        if self._file is None:
+            return
+        with self._lock:
+            self._sync()
+            self._file.close()
+            self._file = None
+        if complete:
+            self.path.unlink()
+            MergeJournal.logger.debug(f"Merge complete, removed journal {self.path}")
+        else:
+            MergeJournal.logger.info(f"Kept journal {self.path}, use --resume to finish this merge")
@@ -4,6 +4,7 @@ import sys
 from pathlib import Path
 from gdrive_sharing_manager.create.create import Create
 from gdrive_sharing_manager.merge.merge import Merge
+from gdrive_sharing_manager.share.share import Share
 from configparser import ConfigParser, ExtendedInterpolation
 
 
@@ -35,14 +36,56 @@ def parse_args():
     primary.add_argument('-l', '--log', help="Path to log file if desired.")
     primary.add_argument('-C', '--credentials', dest="creds",
                         help="Path to credentials.json"),
-    primary.add_argument('-u', '--user', help="User to share folder/retrieve files from.")
-
+    primary.add_argument('-u', '--user', action="append",
+                         help="User to share folder/retrieve files from.  Can be used multiple times.")
+    primary.add_argument('--users-file', help="Path to a file with one user per line to share folders with/retrieve "
+                                              "files from, in addition to any --user.")
+    primary.add_argument('--crawl', choices=["auto", "level", "flat", "single", "legacy"], default="auto",
+                         help="How to crawl folder structures.  'level' lists many folders of the same depth "
+                              "per query, 'flat' lists a whole shared drive and rebuilds the tree, 'single' lists "
+                              "each folder once, 'legacy' uses the original separate file/folder listings.  "
+                              "'auto' uses the metadata cache with --cache, and otherwise 'flat' for folders "
+                              "holding a large share of their shared drive and 'level' for the others.")
+    primary.add_argument('--crawl-batch', type=int, default=50,
+                         help="Maximum number of folders listed per query by the 'level' crawl.")
+    primary.add_argument('-w', '--workers', type=int, default=1,
+                         help="Number of threads used to create folders and copy files, each with its own "
+                              "Drive connection.")
+    primary.add_argument('--transport', choices=["pooled", "httplib2"], default="pooled",
+                         help="HTTP transport of the Drive clients.  'pooled' shares a pool of keep-alive "
+                              "connections between all threads, 'httplib2' gives each client its own connection.")
+    primary.add_argument('--rate-limit', type=float,
+                         help="Maximum number of Drive requests per 100 seconds.  Unlimited by default.")
+    primary.add_argument('--max-retries', type=int, default=5,
+                         help="Number of times a throttled or failed request is retried with exponential "
+                              "backoff.")
+    primary.add_argument('--cache', action="store_true",
+                         help="Keep crawled folders and files and the folders found by name in a metadata cache "
+                              "next to token.json, so later runs only list the files of folders whose "
+                              "modifiedTime changed.  Drive doesn't change a folder's modifiedTime when files are "
+                              "added to it, so those files are missed until --refresh-cache.  Only used by the "
+                              "'auto' crawl, and the uploads folders of merge are always listed in full.")
+    primary.add_argument('--refresh-cache', action="store_true",
+                         help="With --cache, ignore cached listings and list the files of every folder again.")
+    primary.add_argument('--stats', action="store_true",
+                         help="Print the number, size, retries and latency of requests by endpoint and by "
+                              "phase of the run when done.")
+    primary.add_argument('--stats-file',
+                         help="Write the request statistics to this file, in the Prometheus text format if it "
+                              "ends in .prom (for the node exporter textfile collector) and as JSON otherwise.")
+
+    config_users = []
     if config is not None and "Primary" in config.keys():
+        if "user" in config['Primary'].keys():
+            # Several users can be configured, separated by commas.  They are not a default of --user, which would
+            # add the users given on the command line to them instead of replacing them.
+            config_users = [u.strip() for u in config['Primary'].pop('user').split(",") if u.strip()]
         primary.set_defaults(**config['Primary'])
 
     subparsers = root.add_subparsers()
     Create.add_arguments(subparsers, [primary], config)
     Merge.add_arguments(subparsers, [primary], config)
+    Share.add_arguments(subparsers, [primary], config)
 
     # Check if anything at all has been passed in and display usage if not
     if len(sys.argv) <= 1:
@@ -83,6 +126,19 @@ def parse_args():
         logger.critical("Must specify credentials file.")
         sys.exit(1)
 
+    users = list(args.user or [])
+    if args.users_file is not None:
+        users_file = Path(args.users_file).expanduser()
+        if not users_file.exists():
+            logger.critical(f"Could not find users file: {users_file}")
+            sys.exit(1)
+        with open(users_file) as f:
+            users.extend(line.strip() for line in f if line.strip() and not line.strip().startswith("#"))
+    if args.user is None and args.users_file is None:
+        users = config_users
+    # Keep the order users were given in but only handle each of them once.
+    args.users = list(dict.fromkeys(users))
+
     return args, root
 
 
@@ -1,11 +1,17 @@
 from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.session import Session
+from gdrive_sharing_manager.checkpoint import MergeCheckpoints
+from gdrive_sharing_manager.journal import MergeJournal
+from gdrive_sharing_manager.pipeline import StreamingMerge, DestinationResolver
+from gdrive_sharing_manager.dedupe import DedupeIndex
+from gdrive_sharing_manager.diff import diff_trees, plan_to_dict, plan_from_dict
+from gdrive_sharing_manager.filters import FileFilter, parse_time, parse_size
 from typing import List, Dict
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import traceback
+import json
+import os
+import time
 import sys
 import logging
 from pathlib import Path
@@ -17,6 +23,10 @@ class Merge(ArgParser):
     parser = None
     logger = logging.getLogger("gdrive-share.merge")
 
+    # Seconds taken off the time a merge started when it is recorded for --since last, in case this computer's
+    # clock is ahead of Drive's.  Files listed again because of it are already in the main folder and skipped.
+    _since_margin = 600
+
     def __init__(self):
         super(Merge, Merge.__init__())
 
@@ -27,14 +37,58 @@ class Merge(ArgParser):
             help="Merge the new pictures into the main album.",
             parents=parents)
         source_group = Merge.parser.add_mutually_exclusive_group(required=False)
-        source_group.add_argument('--source-root', help="Name of source folder (will use first one found).  "
+        source_group.add_argument('--source-root', help="Name or path (e.g. 'Concerts/2026') of source folder "
+                                                        "(will use first one found).  "
                                                         "This is the folder where the user's files are found")
         source_group.add_argument('--source-root-id', help="Specific ID of the source folder.")
         dest_group = Merge.parser.add_mutually_exclusive_group(required=False)
-        dest_group.add_argument('--dest-root', help="Name of destination folder (will use first one found).  "
+        dest_group.add_argument('--dest-root', help="Name or path (e.g. 'Concerts/2026') of destination "
+                                                    "folder (will use first one found).  "
                                                     "This is where to copy the files to.  This is most "
                                                     "likely the source folder from the `create` step.")
         dest_group.add_argument('--dest-root-id', help="Specific ID of the destination folder.")
+        Merge.parser.add_argument('--batch-size', type=int, default=100,
+                                  help="Number of copies sent per batch request (max 100).  "
+                                       "Use 1 to copy files one at a time.")
+        Merge.parser.add_argument('--incremental', action="store_true",
+                                  help="Only merge files changed since the last incremental merge of this user, "
+                                       "using the Drive changes feed.  The first run merges everything.")
+        Merge.parser.add_argument('--stream', action="store_true",
+                                  help="Start copying while the uploads folder is still being crawled, resolving "
+                                       "destination folders as they are needed instead of crawling the main "
+                                       "folder.")
+        Merge.parser.add_argument('--queue-size', type=int, default=1000,
+                                  help="Maximum number of crawled files waiting to be copied when using --stream.")
+        Merge.parser.add_argument('--dedupe', choices=["off"] + DedupeIndex.policies, default="off",
+                                  help="Skip files whose content (md5 and size) is already in the main folder.  "
+                                       "'folder' only checks the destination folder, 'global' checks the whole "
+                                       "main folder.  Needs a full crawl of the main folder.")
+        Merge.parser.add_argument('--move', action="store_true",
+                                  help="Move files into the main folder instead of copying them, which is much "
+                                       "faster and uses no extra storage but empties the uploads folder.  Files "
+                                       "that can't be moved (e.g. not owned by the account) are copied.")
+        Merge.parser.add_argument('--since',
+                                  help="Only merge files uploaded or modified after this time, an ISO 8601 date or "
+                                       "time (e.g. 2026-10-01 or 2026-10-01T18:00, local time unless an offset is "
+                                       "given), or 'last' for the start of the last successful merge of the user.  "
+                                       "Only the matching files are listed, instead of every file ever uploaded.")
+        Merge.parser.add_argument('--mime',
+                                  help="Only merge files of these comma-separated MIME types, e.g. "
+                                       "'image/*,video/*,application/pdf'.")
+        Merge.parser.add_argument('--min-size', type=parse_size,
+                                  help="Only merge files of at least this size in bytes, or with a K, M or G suffix.  "
+                                       "Drive can't filter listings by size, so this saves copies but not listing.")
+        Merge.parser.add_argument('--resume', action="store_true",
+                                  help="Continue an interrupted merge from its journal instead of starting over.  "
+                                       "If the plan of the merge was recorded, the remaining files are copied "
+                                       "without crawling either folder again.")
+        plan_group = Merge.parser.add_mutually_exclusive_group(required=False)
+        plan_group.add_argument('--plan-out',
+                                help="Only crawl and plan the merge, writing the folders to create and the files "
+                                     "to copy to this JSON file.  Nothing is changed in Drive.")
+        plan_group.add_argument('--execute',
+                                help="Carry out a plan written by --plan-out without crawling.  The folders and "
+                                     "users are taken from the plan.")
         Merge.parser.set_defaults(func=Merge.merge)
 
         # Make sure that merge() is called when this function is used because
@@ -46,106 +100,376 @@ class Merge(ArgParser):
                 Merge.parser.set_defaults(**defaults[Merge.__name__])
 
     def merge(self):
-        if not self.user:
-            Merge.logger.critical("Muse specify user to retrieve media from!")
-
-        # Need to set token/credential
-        test_token_path = self.creds.parent.joinpath("token.json")
-        if test_token_path.exists():
-            Merge._token = test_token_path
-
-        creds = None
-        if Merge._token.exists():
-            Merge.logger.debug(f"Retrieving credentials from {Merge._token.resolve()}")
-            creds = Credentials.from_authorized_user_file(str(Merge._token), Merge._SCOPES)
-        if not creds or not creds.valid:
-            Merge.logger.debug(f"Creds are invalid.")
-            if creds and creds.expired and creds.refresh_token:
-                Merge.logger.debug(f"Refreshing expired credentials")
-                creds.refresh(Request())
-            else:
-                if not Merge._creds.exists():
-                    try:
-                        Merge._creds = Path(self.creds).expanduser()
-                    except:
-                        Merge.logger.critical("Could not find credential!")
-                        sys.exit(1)
-                    if not Merge._creds.exists():
-                        Merge.logger.critical("Could not find credential!")
-                        sys.exit(1)
-                Merge.logger.debug(f"Retrieving credentials from {Merge._creds.resolve()}")
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    str(Merge._creds), Merge._SCOPES)
-                creds = flow.run_local_server(port=0)
-
-            # Save the creds for the next run.
-            with open(Merge._token, "w") as token:
-                Merge.logger.debug(f"Writing token to {Merge._token.resolve()}")
-                token.write(creds.to_json())
+        if not self.users and not self.execute:
+            Merge.logger.critical("Must specify user to retrieve media from!")
+            sys.exit(1)
+        if self.move and self.stream:
+            # Moving files out of folders that are still being listed could make the listing skip files.
+            Merge.logger.critical("--move can't be used with --stream!")
+            sys.exit(1)
+        if self.stream and (self.plan_out or self.execute):
+            Merge.logger.critical("--stream can't be used with --plan-out or --execute!")
+            sys.exit(1)
+        if self.since and self.since != "last":
+            try:
+                parse_time(self.since)
+            except ValueError:
+                Merge.logger.critical(f"Could not read --since {self.since}, use an ISO 8601 date or time or 'last'")
+                sys.exit(1)
+        plan = None
+        if self.execute:
+            plan = Merge._read_plan(Path(self.execute).expanduser())
+
         try:
-            Merge.logger.debug(f"Connecting to API")
-            ArgParser._service = build('drive', 'v3', credentials=creds)
-            Merge.logger.info(f"Connected to API")
+            Session.start(self)
 
+            ArgParser._phase("resolve roots")
             Merge.logger.debug(f"Retrieving source (uploads) folder")
-            if not self.source_root_id:
+            if plan is not None:
+                Merge.logger.debug(f"Using source folder of the plan")
+                source_folder = plan['source_root']
+            elif not self.source_root_id:
                 if not self.source_root:
                     Merge.logger.critical("Must specify a source folder or source folder ID!")
                     sys.exit(1)
                 # Get the root folder information
-                Merge.logger.debug(f"Getting folder by name: {self.source_root}")
-                source_folder = ArgParser._get_folder_by_name_under_parent(parent_id='root',
-                                                                           folder_name=self.source_root)
+                Merge.logger.debug(f"Getting folder by path: {self.source_root}")
+                source_folder = ArgParser._get_folder_by_path(self.source_root)
             else:
                 Merge.logger.debug(f"Getting folder by ID: {self.source_root_id}")
                 source_folder = ArgParser._get_folder_by_id(self.source_root_id)
+            if source_folder is None:
+                Merge.logger.critical("Could not find the source folder!")
+                sys.exit(1)
 
             Merge.logger.info(f"Retrieved source folder.")
             Merge.logger.debug(f"Source folder ID: {source_folder['id']}")
 
             Merge.logger.debug("Retrieving destination (main media) folder")
-            if not self.dest_root_id:
+            if plan is not None:
+                Merge.logger.debug(f"Using destination folder of the plan")
+                dest_folder = plan['dest_root']
+            elif not self.dest_root_id:
                 if not self.dest_root:
                     Merge.logger.critical("Must specify a destination folder or destination folder ID!")
                     sys.exit(1)
                 # Get the root folder information
-                Merge.logger.debug(f"Getting folder by name: {self.dest_root}")
-                dest_folder = ArgParser._get_folder_by_name_under_parent(parent_id='root',
-                                                                         folder_name=self.dest_root)
+                Merge.logger.debug(f"Getting folder by path: {self.dest_root}")
+                dest_folder = ArgParser._get_folder_by_path(self.dest_root)
             else:
                 Merge.logger.debug(f"Getting folder by ID: {self.dest_root_id}")
                 dest_folder = ArgParser._get_folder_by_id(self.dest_root_id)
+            if dest_folder is None:
+                Merge.logger.critical("Could not find the destination folder!")
+                sys.exit(1)
 
             Merge.logger.info(f"Retrieved destination folder")
             Merge.logger.debug(f"Destination folder ID: {dest_folder['id']}")
 
-            Merge.logger.debug(f"Retrieving specific uploads folder")
-            folder_to_parse = Merge._get_folder_by_name_under_parent(source_folder['id'], self.user)
+            if self.batch_size > ArgParser._max_batch_size:
+                Merge.logger.warning(f"Batch size {self.batch_size} is too large, "
+                                     f"using {ArgParser._max_batch_size}")
+            ArgParser._batch_size = min(self.batch_size, ArgParser._max_batch_size)
+            # Holds the changes token of incremental merges and the time of the last merge of each user.
+            checkpoints = MergeCheckpoints(self.creds.parent.joinpath("merge_state.json"))
+            if self.dedupe != "off":
+                ArgParser._dedupe = DedupeIndex(self.dedupe)
+            ArgParser._move = self.move
 
-            Merge.logger.debug(f"Creating folder & files structure of new items to merge")
-            queue = [{
-                "id": folder_to_parse['id'],
-                "name": folder_to_parse['name']
-            }]
-            uploaded_files = Merge._get_files_folders_dict(queue)
+        except HttpError as e:
+            Merge.logger.critical(f"The following error occurred: {e}")
+            traceback.print_exc()
+            sys.exit(1)
+
+        # The destination tree is crawled at most once and shared by every user.
+        shared = {}
+        results = []
+        entries = {}
+        users = self.users
+        if plan is not None:
+            entries = {entry['user']: entry for entry in plan['users']}
+            # Users given on the command line limit the plan to them.
+            users = [u for u in self.users if u in entries] if self.users else list(entries.keys())
+        for user in users:
+            calls_before = ArgParser._api_call_count()
+            started = time.monotonic()
+            try:
+                if self.plan_out:
+                    status = Merge._plan_user(self, user, source_folder, dest_folder, shared, checkpoints, entries)
+                else:
+                    status = Merge._merge_user(self, user, source_folder, dest_folder, shared, checkpoints,
+                                               entries.get(user))
+            except (HttpError, KeyError) as e:
+                Merge.logger.critical(f"The following error occurred for {user}: {e}")
+                traceback.print_exc()
+                status = "failed"
+            results.append((user, ArgParser._api_call_count() - calls_before, time.monotonic() - started, status))
 
+        if ArgParser._executor is not None:
+            ArgParser._executor.shutdown()
+        if self.plan_out:
+            Merge._write_plan(Path(self.plan_out).expanduser(), source_folder, dest_folder, entries)
+        print(ArgParser._user_summary(results))
+        Merge.logger.info(ArgParser._governor.summary())
+        if ArgParser._dedupe is not None:
+            Merge.logger.info(ArgParser._dedupe.summary())
+        if ArgParser._move:
+            Merge.logger.info(ArgParser._move_summary())
+        if ArgParser._cache is not None:
+            Merge.logger.info(ArgParser._cache.summary())
+            ArgParser._cache.close()
+        if ArgParser._stats is not None:
+            if self.stats:
+                print(ArgParser._stats.summary())
+            if self.stats_file:
+                ArgParser._stats.write(Path(self.stats_file).expanduser())
+        if any(status != "ok" for _, _, _, status in results):
+            sys.exit(1)
+        if self.plan_out:
+            Merge.logger.info(f"Wrote merge plan to {self.plan_out}")
+        else:
+            Merge.logger.info(f"Successfully copied all files over!")
+
+    @staticmethod
+    def _read_plan(path: Path) -> Dict:
+        if not path.exists():
+            Merge.logger.critical(f"Could not find plan: {path}")
+            sys.exit(1)
+        with open(path) as f:
+            plan = json.load(f)
+        if plan.get('version') != 1:
+            Merge.logger.critical(f"Unsupported plan version: {plan.get('version')}")
+            sys.exit(1)
+        return plan
+
+    @staticmethod
+    def _write_plan(path: Path, source_folder: Dict, dest_folder: Dict, entries: Dict) -> None:
+        plan = {
+            'version': 1,
+            'created': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            'source_root': {'id': source_folder['id'], 'name': source_folder['name']},
+            'dest_root': {'id': dest_folder['id'], 'name': dest_folder['name']},
+            'summary': {
+                # A folder planned for several users is only created once.
+                'folders': len({tuple(f['path']) for e in entries.values() for f in e['folders']}),
+                'files': sum(len(e['copies']) for e in entries.values()),
+                'bytes': sum(int(c['file'].get('size', 0)) for e in entries.values() for c in e['copies']),
+            },
+            'users': list(entries.values()),
+        }
+        # Written to a temporary file first so an interrupted run never leaves a truncated plan.
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(plan, f, indent=1)
+        os.replace(tmp, path)
+        summary = plan['summary']
+        print(f"Plan: {summary['folders']} folders to create, {summary['files']} files to copy "
+              f"({summary['bytes'] / (1024 * 1024):.1f} MB)")
+
+    def _get_original_files(self, dest_folder: Dict, shared: Dict) -> Dict:
+        # The destination tree is crawled (and indexed for dedupe) once per run.
+        if "original_files" not in shared.keys():
+            ArgParser._phase("crawl dest")
             Merge.logger.debug(f"Creating folder & files structure of destination folder")
             queue = [{
                 "id": dest_folder['id'],
                 "name": dest_folder['name']
             }]
-            original_files = Merge._get_files_folders_dict(queue)
+            shared['original_files'] = Merge._get_files_folders_dict(queue, crawl=self.crawl,
+                                                                     crawl_batch=self.crawl_batch)
+            if ArgParser._dedupe is not None:
+                ArgParser._dedupe.add_tree(shared['original_files'])
+        return shared['original_files']
+
+    def _get_uploads_folder(self, user: str, source_folder: Dict, entry: Dict = None) -> Dict:
+        if entry is not None:
+            return {'id': entry['uploads_folder_id'], 'name': entry['uploads_folder_name']}
+        ArgParser._phase("resolve roots")
+        Merge.logger.debug(f"Retrieving uploads folder of {user}")
+        return Merge._get_folder_by_name_under_parent(source_folder['id'], user)
+
+    def _plan_user(self, user: str, source_folder: Dict, dest_folder: Dict, shared: Dict,
+                   checkpoints: MergeCheckpoints, entries: Dict) -> str:
+        # Crawls and diffs like a merge but only adds the plan to entries.  Only read requests are made.
+        folder_to_parse = Merge._get_uploads_folder(self, user, source_folder)
+        if folder_to_parse is None:
+            Merge.logger.error(f"Could not find an uploads folder for {user}")
+            return "no uploads folder"
+        listed_at = Merge._listing_time()
+        file_filter = Merge._get_file_filter(self, user, folder_to_parse, checkpoints)
+        original_files, uploaded_files, page_token = Merge._crawl_trees(self, user, folder_to_parse, dest_folder,
+                                                                        shared, checkpoints, file_filter)
+        ArgParser._phase("plan")
+        plan, orig_index = diff_trees(original_files, uploaded_files)
+        if ArgParser._dedupe is not None:
+            # Folders that don't exist yet are keyed by their path.
+            plan.copies = [(f, path) for f, path in plan.copies
+                           if not ArgParser._dedupe.is_duplicate(f, orig_index[path]['folder_id'] if path in orig_index
+                                                                 else "/".join(path))]
+        Merge.logger.info(f"Planned {len(plan.folders)} folders to create and {len(plan.copies)} files to copy "
+                          f"for {user}")
+        entries[user] = dict(plan_to_dict(plan, orig_index), user=user, uploads_folder_id=folder_to_parse['id'],
+                             uploads_folder_name=folder_to_parse['name'], start_page_token=page_token,
+                             listed_at=listed_at)
+        return "ok"
 
-            Merge.logger.info(f"Merging in new media!")
+    def _merge_user(self, user: str, source_folder: Dict, dest_folder: Dict, shared: Dict,
+                    checkpoints: MergeCheckpoints, entry: Dict = None) -> str:
+        # Merges one user's uploads, or carries out their entry of a plan, and returns their status for the summary.
+        folder_to_parse = Merge._get_uploads_folder(self, user, source_folder, entry)
+        if folder_to_parse is None:
+            Merge.logger.error(f"Could not find an uploads folder for {user}")
+            return "no uploads folder"
+
+        # Streamed merges have no plan to record, everything else is journaled so it can be resumed.  That includes
+        # streamed merges with an incremental checkpoint, which copy the changes like any other merge.
+        journal = None
+        if not self.stream or Merge._checkpoint(self, folder_to_parse, checkpoints) is not None:
+            journal = MergeJournal(self.creds.parent.joinpath("journals", f"{folder_to_parse['id']}.jsonl"))
+            journal.open(resume=self.resume)
+            ArgParser._journal = journal
+        status = "failed"
+        try:
+            status = Merge._merge_folder(self, user, folder_to_parse, dest_folder, shared, checkpoints, journal,
+                                         entry)
+        finally:
+            ArgParser._journal = None
+            if journal is not None:
+                journal.close(complete=status == "ok")
+        return status
+
+    def _merge_folder(self, user: str, folder_to_parse: Dict, dest_folder: Dict, shared: Dict,
+                      checkpoints: MergeCheckpoints, journal: MergeJournal, entry: Dict = None) -> str:
+        ArgParser._failed_copies = 0
+        if journal is not None and journal.planned:
+            # The plan of the interrupted merge was recorded in full, so neither tree is crawled again.
+            remaining = journal.remaining()
+            Merge.logger.info(f"Resuming merge of {user}, {len(remaining)} files left")
+            ArgParser._phase("copy")
+            for f, dest_id in remaining:
+                ArgParser._queue_copy(f, dest_id)
+            ArgParser._flush_copies()
+            if ArgParser._executor is not None:
+                ArgParser._executor.wait()
+            return Merge._finish_merge(folder_to_parse, checkpoints, journal.meta.get('start_page_token'),
+                                       journal.meta.get('listed_at'))
+
+        if entry is not None:
+            # Planned with --plan-out, the folders of every entry share one index so none is created twice.
+            plan, orig_index = plan_from_dict(entry, shared.setdefault('plan_index', {}))
+            ArgParser._phase("copy")
+            Merge.logger.info(f"Executing plan for {user}: {len(plan.folders)} folders to create, "
+                              f"{len(plan.copies)} files to copy")
+            journal.start(start_page_token=entry['start_page_token'], listed_at=entry.get('listed_at'))
+            ArgParser._execute_merge_plan(plan, orig_index, batch_folders=True)
+            ArgParser._flush_copies()
+            if ArgParser._executor is not None:
+                ArgParser._executor.wait()
+            return Merge._finish_merge(folder_to_parse, checkpoints, entry['start_page_token'],
+                                       entry.get('listed_at'))
+
+        listed_at = Merge._listing_time()
+        file_filter = Merge._get_file_filter(self, user, folder_to_parse, checkpoints)
+        original_files, uploaded_files, page_token = Merge._crawl_trees(self, user, folder_to_parse, dest_folder,
+                                                                        shared, checkpoints, file_filter,
+                                                                        stream=self.stream)
+        if uploaded_files is None:
+            if "resolver" not in shared.keys():
+                shared['resolver'] = DestinationResolver(dest_folder)
+            ArgParser._phase("stream")
+            Merge.logger.info(f"Streaming new media from {user}!")
+            StreamingMerge(ArgParser._service_factory, queue_size=self.queue_size, crawl_batch=self.crawl_batch,
+                           file_filter=file_filter).run(folder_to_parse, shared['resolver'])
+        else:
+            ArgParser._phase("copy")
+            Merge.logger.info(f"Merging in new media from {user}!")
+            journal.start(start_page_token=page_token, listed_at=listed_at)
             ArgParser._copy_all_files(original_files, uploaded_files)
+        return Merge._finish_merge(folder_to_parse, checkpoints, page_token, listed_at)
 
-        except HttpError as e:
-            Merge.logger.critical(f"The following error occurred: {e}")
-            traceback.print_exc()
-            sys.exit(1)
-        except KeyError as e:
-            Merge.logger.critical(f"The following error occurred: {e}")
-            traceback.print_exc()
-            sys.exit(1)
+    @staticmethod
+    def _listing_time() -> str:
+        # Taken before crawling so nothing uploaded during this merge is missed by the next --since last.
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() - Merge._since_margin))
+
+    def _get_file_filter(self, user: str, folder_to_parse: Dict, checkpoints: MergeCheckpoints) -> FileFilter:
+        # The uploads of user to merge, or None to merge all of them.
+        since = None
+        if self.since == "last":
+            since = (checkpoints.get(folder_to_parse['id']) or {}).get('last_merge')
+            if since is None:
+                Merge.logger.info(f"No previous merge of {user}, merging everything")
+        elif self.since:
+            since = parse_time(self.since)
+        file_filter = FileFilter(since, self.mime.split(",") if self.mime else None, self.min_size)
+        if file_filter.describe() == "":
+            return None
+        Merge.logger.info(f"Only merging files of {user} {file_filter.describe()}")
+        return file_filter
+
+    def _crawl_trees(self, user: str, folder_to_parse: Dict, dest_folder: Dict, shared: Dict,
+                     checkpoints: MergeCheckpoints, file_filter: FileFilter = None, stream: bool = False):
+        # Returns the destination tree, the tree of uploads to merge and the changes token to checkpoint (None
+        # unless incremental).  A streamed merge crawls as it copies, so both trees are None unless there is an
+        # incremental checkpoint.
+        page_token = None
+        checkpoint = Merge._checkpoint(self, folder_to_parse, checkpoints)
+        if checkpoint is None and self.incremental:
+            # Taken before crawling so nothing uploaded during this merge is missed next time.
+            Merge.logger.info(f"No checkpoint for {user}, merging everything")
+            page_token = Merge._get_start_page_token(folder_to_parse.get('driveId'))
+
+        if ArgParser._dedupe is not None:
+            # The whole main folder is needed to know what is already in it.
+            Merge._get_original_files(self, dest_folder, shared)
+
+        if checkpoint is not None:
+            ArgParser._phase("crawl source")
+            Merge.logger.debug(f"Retrieving changes since the last merge")
+            uploaded_files, page_token = Merge._get_changed_files_dict(folder_to_parse, checkpoint,
+                                                                       file_filter=file_filter,
+                                                                       batch_size=self.crawl_batch)
+            ArgParser._phase("crawl dest")
+            Merge.logger.debug(f"Retrieving matching folders of destination folder")
+            original_files = Merge._get_matching_folders_dict(dest_folder, uploaded_files,
+                                                              batch_size=self.crawl_batch)
+        elif stream:
+            return None, None, page_token
         else:
-            Merge.logger.info(f"Successfully copied all files over!")
\ No newline at end of file
+            ArgParser._phase("crawl source")
+            Merge.logger.debug(f"Creating folder & files structure of new items to merge")
+            queue = [{
+                "id": folder_to_parse['id'],
+                "name": folder_to_parse['name']
+            }]
+            # Adding files doesn't change the modifiedTime of their folder, so the metadata cache could miss
+            # new uploads.
+            uploaded_files = Merge._get_files_folders_dict(queue, crawl=self.crawl, crawl_batch=self.crawl_batch,
+                                                           file_filter=file_filter, use_cache=False)
+
+            original_files = Merge._get_original_files(self, dest_folder, shared)
+        return original_files, uploaded_files, page_token
+
+    def _checkpoint(self, folder_to_parse: Dict, checkpoints: MergeCheckpoints) -> str:
+        # The changes token to merge the uploads from, or None to crawl all of them.
+        if not self.incremental:
+            return None
+        return (checkpoints.get(folder_to_parse['id']) or {}).get('start_page_token')
+
+    @staticmethod
+    def _finish_merge(folder_to_parse: Dict, checkpoints: MergeCheckpoints, page_token: str,
+                      listed_at: str = None) -> str:
+        # Moves the checkpoint forward if every copy succeeded and returns the status for the summary.
+        if ArgParser._failed_copies > 0:
+            Merge.logger.warning(f"{ArgParser._failed_copies} copies failed, keeping the previous "
+                                 f"checkpoint so they are retried next time")
+            return f"{ArgParser._failed_copies} copies failed"
+        values = {}
+        if page_token is not None:
+            values['start_page_token'] = page_token
+        if listed_at is not None:
+            values['last_merge'] = listed_at
+        if len(values) > 0:
+            checkpoints.set(folder_to_parse['id'], **values)
+            checkpoints.save()
+        return "ok"
\ No newline at end of file
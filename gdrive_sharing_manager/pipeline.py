@@ -0,0 +1,130 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.diff import normalize_name
+from gdrive_sharing_manager.filters import FileFilter
+from googleapiclient.errors import HttpError
+from typing import Callable, Dict, Tuple
+import threading
+import logging
+import queue
+import time
+import sys
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak memory is then not reported.
+    resource = None
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class DestinationResolver:
+    """Resolves relative paths to folder IDs under a destination folder, listing and creating folders on demand."""
+
+    logger = logging.getLogger("gdrive-share.pipeline")
+
+    def __init__(self, root_folder: Dict):
+        # Normalized path to folder ID, None for folders that could not be created.
+        self._ids = {(): root_folder['id']}
+        self._listed = set()
+
+    def resolve(self, path: Tuple):
+        key = tuple(normalize_name(name) for name in path)
+        if key not in self._ids:
+            parent_id = self.resolve(path[:-1])
+            if parent_id is None:
+                self._ids[key] = None
+                return None
+            parent_key = key[:-1]
+            if parent_key not in self._listed:
+                # One listing finds every existing sibling, so they don't need a lookup of their own.
+                self._listed.add(parent_key)
+                for child in ArgParser._get_children_listing(parent_id, include_files=False):
+                    self._ids.setdefault(parent_key + (normalize_name(child['name']),), child['id'])
+            if key not in self._ids:
+                try:
+                    self._ids[key] = ArgParser._create_folder(parent_id, path[-1])
+                except HttpError as e:
+                    DestinationResolver.logger.error(f"Could not create new folder: {path[-1]}.  Error: {e}")
+                    self._ids[key] = None
+        return self._ids[key]
+
+
+class StreamingMerge:
+    """Copies files while the uploads folder is still being crawled.
+
+    A crawler thread (with its own Drive client) puts (relative path, file) records on a bounded queue as pages
+    arrive, which caps how much is held in memory.  The calling thread resolves each path to a destination folder
+    and queues the copy.
+    """
+
+    logger = logging.getLogger("gdrive-share.pipeline")
+
+    def __init__(self, service_factory: Callable, queue_size: int = 1000, crawl_batch: int = 50,
+                 file_filter: FileFilter = None):
+        self._service_factory = service_factory
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._crawl_batch = crawl_batch
+        self._file_filter = file_filter
+        self._errors = []
+        self._stop = threading.Event()
+
+    def _crawl(self, root_folder: Dict) -> None:
+        ArgParser._local.service = self._service_factory()
+        try:
+            for record in ArgParser._iter_files_by_path(root_folder, batch_size=self._crawl_batch,
+                                                        file_filter=self._file_filter):
+                if self._stop.is_set():
+                    break
+                self._queue.put(record)
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            self._queue.put(None)
+
+    def run(self, root_folder: Dict, resolver: DestinationResolver) -> int:
+        started = time.monotonic()
+        first_copy = None
+        count = 0
+        crawler = threading.Thread(target=self._crawl, args=(root_folder,), name="gdrive-share-crawl", daemon=True)
+        crawler.start()
+        try:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                path, file = record
+                dest_id = resolver.resolve(path)
+                if dest_id is None:
+                    ArgParser._copy_failed(file, "destination folder could not be created")
+                    continue
+                if first_copy is None:
+                    first_copy = time.monotonic() - started
+                    StreamingMerge.logger.info(f"First copy queued after {first_copy:.1f}s")
+                ArgParser._queue_copy(file, dest_id)
+                count += 1
+        except Exception:
+            # Let the crawler finish instead of leaving it blocked on a full queue.
+            self._stop.set()
+            while self._queue.get() is not None:
+                pass
+            raise
+        finally:
+            crawler.join()
+        if len(self._errors) > 0:
+            raise self._errors[0]
+
+        ArgParser._flush_copies()
+        if ArgParser._executor is not None:
+            ArgParser._executor.wait()
+        peak = peak_rss_mb()
+        StreamingMerge.logger.info(f"Streamed {count} copies in {time.monotonic() - started:.1f}s, "
+                                   f"first copy after {first_copy or 0:.1f}s"
+                                   f"{f', peak RSS {peak:.0f} MB' if peak is not None else ''}")
+        return count
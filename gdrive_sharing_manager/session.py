@@ -0,0 +1,135 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.executor import DriveExecutor
+from gdrive_sharing_manager.cache import MetadataCache
+from gdrive_sharing_manager.throttle import RequestGovernor, TokenBucket
+from gdrive_sharing_manager.stats import RequestStats
+from pathlib import Path
+import threading
+import logging
+import time
+import sys
+import os
+
+
+class Session:
+    """Credentials and Drive clients shared by the subcommands.
+
+    The Google client libraries are only imported once a session is started, so that `--help` and argument errors
+    don't pay for them.  The Drive v3 discovery document is cached next to token.json and read once per process.
+    With the 'pooled' transport every client shares one PooledHttp, otherwise each client has its own httplib2
+    connection.
+    """
+
+    logger = logging.getLogger("gdrive-share.session")
+
+    _discovery_url = "https://www.googleapis.com/discovery/v1/apis/drive/v3/rest"
+    # Seconds before the cached discovery document is read again from the client library (or Google).
+    discovery_max_age = 7 * 24 * 3600
+
+    def __init__(self, creds_path: Path, transport: str = "pooled", pool_size: int = 10):
+        self.creds_path = creds_path
+        self.transport = transport
+        self.pool_size = pool_size
+        self.http = None
+        self.token_path = creds_path.parent.joinpath("token.json")
+        self.discovery_path = creds_path.parent.joinpath("discovery-drive-v3.json")
+        self.credentials = None
+        self._document = None
+        self._lock = threading.Lock()
+
+    def authenticate(self):
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+
+        creds = None
+        if self.token_path.exists():
+            Session.logger.debug(f"Retrieving credentials from {self.token_path.resolve()}")
+            creds = Credentials.from_authorized_user_file(str(self.token_path), ArgParser._SCOPES)
+        if not creds or not creds.valid:
+            Session.logger.debug(f"Creds are invalid.")
+            if creds and creds.expired and creds.refresh_token:
+                Session.logger.debug(f"Refreshing expired credentials")
+                creds.refresh(Request())
+            else:
+                if not self.creds_path.exists():
+                    Session.logger.critical("Could not find credential!")
+                    sys.exit(1)
+                from google_auth_oauthlib.flow import InstalledAppFlow
+                Session.logger.debug(f"Retrieving credentials from {self.creds_path.resolve()}")
+                flow = InstalledAppFlow.from_client_secrets_file(str(self.creds_path), ArgParser._SCOPES)
+                creds = flow.run_local_server(port=0)
+
+            # Save the creds for the next run.
+            with open(self.token_path, "w") as token:
+                Session.logger.debug(f"Writing token to {self.token_path.resolve()}")
+                token.write(creds.to_json())
+        self.credentials = creds
+        return creds
+
+    def _discovery_document(self) -> str:
+        # Read from disk once and then shared by every client of this process, including worker threads.
+        with self._lock:
+            if self._document is not None:
+                return self._document
+            path = self.discovery_path
+            if path.exists() and time.time() - path.stat().st_mtime < Session.discovery_max_age:
+                Session.logger.debug(f"Using cached discovery document {path}")
+                self._document = path.read_text()
+                return self._document
+
+            from googleapiclient.discovery_cache import get_static_doc
+            document = get_static_doc("drive", "v3")
+            if document is None:
+                import urllib.request
+                Session.logger.debug(f"Fetching discovery document from {Session._discovery_url}")
+                with urllib.request.urlopen(Session._discovery_url) as response:
+                    document = response.read().decode("utf-8")
+            tmp = path.with_suffix(".tmp")
+            try:
+                tmp.write_text(document)
+                os.replace(tmp, path)
+            except OSError as e:
+                Session.logger.warning(f"Could not cache discovery document at {path}: {e}")
+            self._document = document
+            return document
+
+    def _pooled_http(self):
+        with self._lock:
+            if self.http is None:
+                from gdrive_sharing_manager.transport import PooledHttp
+                Session.logger.debug(f"Using a pool of {self.pool_size} connections")
+                self.http = PooledHttp(self.credentials, pool_size=self.pool_size)
+            return self.http
+
+    def build(self):
+        # A new Drive client.  Clients are not thread-safe, so each thread needs its own, but they can share a
+        # PooledHttp.
+        from googleapiclient.discovery import build_from_document
+        if self.transport == "pooled":
+            return build_from_document(self._discovery_document(), http=self._pooled_http())
+        return build_from_document(self._discovery_document(), credentials=self.credentials)
+
+    @staticmethod
+    def start(args) -> "Session":
+        """Authenticates and sets up the shared ArgParser state from the primary options."""
+        session = Session(args.creds, transport=args.transport, pool_size=max(10, args.workers))
+        session.authenticate()
+
+        bucket = TokenBucket(args.rate_limit) if args.rate_limit else None
+        ArgParser._governor = RequestGovernor(bucket, max_retries=args.max_retries)
+        if args.stats or args.stats_file:
+            ArgParser._stats = RequestStats()
+        Session.logger.debug(f"Connecting to API")
+        ArgParser._service = session.build()
+        ArgParser._service_factory = session.build
+        if ArgParser._stats is not None:
+            ArgParser._stats.transport = session.http
+        Session.logger.info(f"Connected to API")
+        if args.workers > 1:
+            Session.logger.debug(f"Starting {args.workers} worker threads")
+            ArgParser._executor = DriveExecutor(ArgParser._service_factory, args.workers)
+        if args.cache:
+            cache_path = args.creds.parent.joinpath("cache.sqlite")
+            Session.logger.debug(f"Using metadata cache at {cache_path}")
+            ArgParser._cache = MetadataCache(cache_path, refresh=args.refresh_cache)
+        return session
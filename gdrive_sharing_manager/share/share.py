@@ -0,0 +1,185 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.session import Session
+from gdrive_sharing_manager.acl import diff_acls, naive_calls, describe, uploaders
+from gdrive_sharing_manager.diff import normalize_name
+from collections import defaultdict
+from typing import List, Dict
+from googleapiclient.errors import HttpError
+import traceback
+import csv
+import sys
+import logging
+from pathlib import Path
+
+
+class Share(ArgParser):
+    """Class that makes the sharing of upload folders match a mapping of users to folders."""
+
+    parser = None
+    logger = logging.getLogger("gdrive-share.share")
+
+    def __init__(self):
+        super(Share, Share.__init__())
+
+    @staticmethod
+    def add_arguments(subparsers, parents: List = [], defaults: Dict = None) -> None:
+        Share.parser = subparsers.add_parser(
+            'share',
+            help="Give users access to their upload folders, changing only what differs.",
+            parents=parents)
+        uploads_group = Share.parser.add_mutually_exclusive_group(required=False)
+        uploads_group.add_argument('--uploads-root', help="Name or path (e.g. 'Concerts/2026') of the folder "
+                                                          "holding the upload folders (will use first one found).")
+        uploads_group.add_argument('--uploads-root-id', help="Specific ID of the folder holding the upload folders.")
+        Share.parser.add_argument('--mapping',
+                                  help="Path to a CSV file of 'user,folder' lines giving each user write access to "
+                                       "an upload folder (a name or path under the uploads root).  Users given with "
+                                       "--user get the folder named after them, like `create` makes.")
+        Share.parser.add_argument('--prune', action="store_true",
+                                  help="Also revoke the writers of upload folders that are not in the mapping.")
+        Share.parser.add_argument('--no-email', action="store_true",
+                                  help="Don't send Google's sharing notification emails.")
+        Share.parser.add_argument('--dry-run', action="store_true",
+                                  help="Only print the grants and revocations that would be made.")
+        Share.parser.add_argument('--batch-size', type=int, default=100,
+                                  help="Number of permission calls sent per batch request (max 100).")
+
+        # Make sure that share() is called when this function is used because
+        # there are no subcommands.
+        Share.parser.set_defaults(func=Share.share)
+
+        if defaults is not None:
+            if Share.__name__ in defaults.keys():
+                Share.parser.set_defaults(**defaults[Share.__name__])
+
+    def share(self):
+        mapping = Share._read_mapping(self)
+        if len(mapping) == 0:
+            Share.logger.critical("Must specify users or a mapping of users to upload folders!")
+            sys.exit(1)
+
+        try:
+            Session.start(self)
+
+            ArgParser._phase("resolve roots")
+            Share.logger.debug("Retrieving uploads folder")
+            if not self.uploads_root_id:
+                if not self.uploads_root:
+                    Share.logger.critical("Must specify an uploads folder or uploads folder ID!")
+                    sys.exit(1)
+                Share.logger.debug(f"Getting folder by path: {self.uploads_root}")
+                uploads_folder = ArgParser._get_folder_by_path(self.uploads_root)
+            else:
+                Share.logger.debug(f"Getting folder by ID: {self.uploads_root_id}")
+                uploads_folder = ArgParser._get_folder_by_id(self.uploads_root_id)
+            if uploads_folder is None:
+                Share.logger.critical("Could not find the uploads folder!")
+                sys.exit(1)
+            Share.logger.info(f"Retrieved uploads folder")
+            Share.logger.debug(f"Uploads folder ID: {uploads_folder['id']}")
+
+            ArgParser._batch_size = max(1, min(self.batch_size, ArgParser._max_batch_size))
+            calls_before = ArgParser._api_call_count()
+            batches_before = ArgParser._api_calls['batch']
+
+            ArgParser._phase("resolve folders")
+            children = ArgParser._get_children_listing(uploads_folder['id'], include_files=False)
+            folders = Share._get_upload_folders(uploads_folder, children, {folder for _, folder in mapping})
+            desired = defaultdict(set)
+            missing = 0
+            for user, folder in mapping:
+                if folder not in folders:
+                    Share.logger.warning(f"Could not find upload folder {folder} for {user}, use `create` first")
+                    missing += 1
+                    continue
+                desired[folders[folder]['id']].add(user)
+            names = {f['id']: f['name'] for f in folders.values()}
+            if self.prune:
+                for f in children:
+                    names.setdefault(f['id'], f['name'])
+                    desired.setdefault(f['id'], set())
+
+            ArgParser._phase("read permissions")
+            read = [uploads_folder['id']] + list(desired.keys())
+            current = ArgParser._list_permissions(read)
+            # Whoever can write to the uploads folder itself (e.g. the other organisers) keeps their access.
+            keep = uploaders(current.get(uploads_folder['id'], []))
+            # Folders whose permissions could not be read are left alone rather than changed blindly.
+            unread = [folder_id for folder_id in desired if folder_id not in current]
+            plan = diff_acls({k: v for k, v in desired.items() if k in current}, current, keep)
+
+            for line in describe(plan, names):
+                if self.dry_run:
+                    print(line)
+                else:
+                    Share.logger.info(line)
+            failed = 0
+            if not self.dry_run:
+                ArgParser._phase("apply permissions")
+                failed = ArgParser._apply_acl_plan(plan, notify=not self.no_email)
+
+        except HttpError as e:
+            Share.logger.critical(f"The following error occurred: {e}")
+            traceback.print_exc()
+            sys.exit(1)
+
+        if ArgParser._executor is not None:
+            ArgParser._executor.shutdown()
+        requests = ArgParser._api_call_count() - calls_before
+        batches = ArgParser._api_calls['batch'] - batches_before
+        # Every call inside a batch counts against quota, the batch request itself doesn't.  Reading a folder's
+        # permissions costs a call like sharing it does, but it is not a change and sends no email.
+        changes = 0 if self.dry_run else len(plan)
+        calls = requests - batches + len(read) + changes
+        naive = naive_calls(desired)
+        emails = naive - (0 if self.no_email else len(plan.grants))
+        print(f"{len(plan.grants)} grants, {len(plan.revocations)} revocations, {plan.unchanged} already shared"
+              f"{' (dry run)' if self.dry_run else ''}")
+        print(f"Used {requests} requests ({calls} calls, {changes} changes) where sharing every folder again would "
+              f"use {naive} requests and changes, saving {naive - requests} requests, {naive - changes} changes and "
+              f"{emails} notification emails")
+        Share.logger.info(ArgParser._governor.summary())
+        if ArgParser._cache is not None:
+            Share.logger.info(ArgParser._cache.summary())
+            ArgParser._cache.close()
+        if ArgParser._stats is not None:
+            if self.stats:
+                print(ArgParser._stats.summary())
+            if self.stats_file:
+                ArgParser._stats.write(Path(self.stats_file).expanduser())
+        if failed > 0 or missing > 0 or len(unread) > 0:
+            sys.exit(1)
+
+    def _read_mapping(self) -> List:
+        # (user, upload folder) pairs, in the order given and without repeats.
+        mapping = [(user, user) for user in self.users]
+        if self.mapping is not None:
+            mapping_file = Path(self.mapping).expanduser()
+            if not mapping_file.exists():
+                Share.logger.critical(f"Could not find mapping file: {mapping_file}")
+                sys.exit(1)
+            with open(mapping_file, newline="") as f:
+                for row in csv.reader(f):
+                    row = [cell.strip() for cell in row]
+                    if len(row) == 0 or row[0] == "" or row[0].startswith("#"):
+                        continue
+                    mapping.append((row[0], row[1] if len(row) > 1 and row[1] != "" else row[0]))
+        return list(dict.fromkeys(mapping))
+
+    @staticmethod
+    def _get_upload_folders(uploads_folder: Dict, children: List, wanted: set) -> Dict:
+        # Folder names and paths of the mapping to their folders.  Names are found among the listed children of
+        # the uploads folder, only paths reaching deeper are looked up one folder at a time.
+        by_name = {}
+        for f in children:
+            # For now we'll always just take the first one if there are multiple name matches.
+            by_name.setdefault(normalize_name(f['name']), f)
+        folders = {}
+        for name in wanted:
+            if "/" in name.strip("/"):
+                folder = ArgParser._get_folder_by_path(name, parent_id=uploads_folder['id'])
+            else:
+                folder = by_name.get(normalize_name(name.strip("/")))
+            if folder is not None:
+                folders[name] = folder
+        return folders
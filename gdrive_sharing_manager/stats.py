@@ -0,0 +1,178 @@
+from collections import defaultdict
+from typing import Dict, List
+from pathlib import Path
+import threading
+import logging
+import json
+import time
+import os
+
+
+class _Totals:
+    def __init__(self):
+        self.requests = 0
+        self.calls = 0
+        self.bytes = 0
+        self.retries = 0
+        self.failures = 0
+        self.latency_sum = 0.0
+        self.latencies = []
+
+    def as_dict(self) -> Dict:
+        latencies = sorted(self.latencies)
+
+        def quantile(q: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 4) if latencies else 0.0
+        return {
+            'requests': self.requests,
+            'calls': self.calls,
+            'bytes': self.bytes,
+            'retries': self.retries,
+            'failures': self.failures,
+            'latency_seconds': {'sum': round(self.latency_sum, 4), 'p50': quantile(0.5), 'p95': quantile(0.95),
+                                'max': round(latencies[-1], 4) if latencies else 0.0,
+                                'buckets': RequestStats.histogram(latencies)},
+        }
+
+
+class RequestStats:
+    """Counts, response sizes, retries and latencies of Drive requests by endpoint and by phase of a run."""
+
+    logger = logging.getLogger("gdrive-share.stats")
+
+    # Upper bounds in seconds of the latency histogram buckets.
+    buckets = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+    def __init__(self):
+        self.endpoints = defaultdict(_Totals)
+        self.phases = defaultdict(_Totals)
+        self.phase_seconds = defaultdict(float)
+        self.phase_name = "setup"
+        self._phase_started = time.monotonic()
+        # Optional PooledHttp whose connections and token refreshes are reported too.
+        self.transport = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def histogram(latencies: List) -> Dict:
+        # Cumulative counts, like Prometheus histograms.
+        counts = {}
+        for bound in RequestStats.buckets:
+            counts[str(bound)] = sum(1 for latency in latencies if latency <= bound)
+        counts["+Inf"] = len(latencies)
+        return counts
+
+    def start_phase(self, name: str) -> None:
+        # Ends the current phase.  Requests made from now on (from any thread) are counted against name.
+        now = time.monotonic()
+        with self._lock:
+            self.phase_seconds[self.phase_name] += now - self._phase_started
+            self.phase_name = name
+            self._phase_started = now
+
+    def record(self, endpoint: str, attempts: List, response, failed: bool, calls: int = 1) -> None:
+        # attempts holds the latency of every attempt, so all but one of them were retries.
+        size = len(json.dumps(response)) if isinstance(response, dict) else 0
+        with self._lock:
+            for totals in (self.endpoints[endpoint], self.phases[self.phase_name]):
+                totals.requests += 1
+                totals.calls += calls
+                totals.bytes += size
+                totals.retries += max(0, len(attempts) - 1)
+                totals.failures += 1 if failed else 0
+                totals.latency_sum += sum(attempts)
+                totals.latencies.extend(attempts)
+
+    def record_batch_calls(self, endpoint: str, calls: int) -> None:
+        # Calls sent inside a batch request are counted against their own endpoint as well.
+        with self._lock:
+            self.endpoints[endpoint].calls += calls
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            seconds = dict(self.phase_seconds)
+            seconds[self.phase_name] = seconds.get(self.phase_name, 0.0) + time.monotonic() - self._phase_started
+            stats = {
+                'endpoints': {name: totals.as_dict() for name, totals in sorted(self.endpoints.items())},
+                'phases': {name: dict(totals.as_dict(), seconds=round(seconds.get(name, 0.0), 3))
+                           for name, totals in self.phases.items()},
+            }
+        if self.transport is not None:
+            stats['transport'] = self.transport.as_dict()
+        return stats
+
+    def summary(self) -> str:
+        stats = self.as_dict()
+        lines = [f"{'Endpoint':<28}  {'Requests':>8}  {'Calls':>7}  {'KB':>8}  {'Retries':>7}  {'p50 (s)':>7}  "
+                 f"{'p95 (s)':>7}  {'Max (s)':>7}"]
+        for section in ('endpoints', 'phases'):
+            if section == 'phases':
+                lines.append("")
+                lines.append(f"{'Phase':<28}  {'Requests':>8}  {'Calls':>7}  {'KB':>8}  {'Retries':>7}  "
+                             f"{'p50 (s)':>7}  {'p95 (s)':>7}  {'Time (s)':>8}")
+            for name, s in stats[section].items():
+                latency = s['latency_seconds']
+                last = s['seconds'] if section == 'phases' else latency['max']
+                lines.append(f"{name:<28}  {s['requests']:>8}  {s['calls']:>7}  {s['bytes'] / 1024:>8.1f}  "
+                             f"{s['retries']:>7}  {latency['p50']:>7.3f}  {latency['p95']:>7.3f}  {last:>7.3f}")
+        if self.transport is not None:
+            lines.append("")
+            lines.append(self.transport.summary())
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        stats = self.as_dict()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List) -> None:
+            lines.append(f"# HELP gdrive_share_{name} {help_text}")
+            lines.append(f"# TYPE gdrive_share_{name} {kind}")
+            for labels, value in samples:
+                sample(name, labels, value)
+
+        def sample(name: str, labels: Dict, value) -> None:
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"gdrive_share_{name}{{{label_text}}} {value}" if labels else f"gdrive_share_{name} {value}")
+
+        endpoints = stats['endpoints'].items()
+        metric("requests_total", "counter", "HTTP requests sent to Drive.",
+               [({'endpoint': e}, s['requests']) for e, s in endpoints])
+        metric("calls_total", "counter", "API calls, including the ones inside batch requests.",
+               [({'endpoint': e}, s['calls']) for e, s in endpoints])
+        metric("response_bytes_total", "counter", "Approximate size of the responses.",
+               [({'endpoint': e}, s['bytes']) for e, s in endpoints])
+        metric("retries_total", "counter", "Requests retried after being throttled or failing.",
+               [({'endpoint': e}, s['retries']) for e, s in endpoints])
+        metric("failures_total", "counter", "Requests that failed after all retries.",
+               [({'endpoint': e}, s['failures']) for e, s in endpoints])
+        metric("request_duration_seconds", "histogram", "Latency of each attempt of a request.", [])
+        for e, s in endpoints:
+            latency = s['latency_seconds']
+            for bound, count in latency['buckets'].items():
+                sample("request_duration_seconds_bucket", {'endpoint': e, 'le': bound}, count)
+            sample("request_duration_seconds_sum", {'endpoint': e}, latency['sum'])
+            sample("request_duration_seconds_count", {'endpoint': e}, latency['buckets']['+Inf'])
+        phases = stats['phases'].items()
+        metric("phase_requests_total", "counter", "HTTP requests sent during each phase of a run.",
+               [({'phase': p}, s['requests']) for p, s in phases])
+        metric("phase_seconds", "gauge", "Time spent in each phase of a run.",
+               [({'phase': p}, s['seconds']) for p, s in phases])
+        if 'transport' in stats:
+            metric("connections_total", "counter", "HTTPS connections opened, each with a TLS handshake.",
+                   [({}, stats['transport']['connections'])])
+            metric("token_refreshes_total", "counter", "OAuth access token refreshes.",
+                   [({}, stats['transport']['token_refreshes'])])
+        metric("last_run_timestamp_seconds", "gauge", "When the run finished.", [({}, int(time.time()))])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path) -> None:
+        # A .prom file is written in the Prometheus text format (for the node exporter textfile collector),
+        # anything else as JSON.  Written to a temporary file first so a collector never reads a partial file.
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            if path.suffix == ".prom":
+                f.write(self.prometheus())
+            else:
+                json.dump(self.as_dict(), f, indent=2)
+        os.replace(tmp, path)
+        RequestStats.logger.debug(f"Wrote request statistics to {path}")
@@ -0,0 +1,125 @@
+from googleapiclient.errors import HttpError
+from collections import Counter
+from typing import Callable
+import threading
+import logging
+import random
+import json
+import time
+
+
+class TokenBucket:
+    """Rate limiter configured in requests per 100 seconds, the unit Drive quotas are published in."""
+
+    def __init__(self, requests_per_100s: float, capacity: float = None,
+                 clock: Callable = time.monotonic, sleep: Callable = time.sleep):
+        self.rate = requests_per_100s / 100.0
+        # By default allow a burst of one second's worth of requests.
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        # Blocks until the request may be sent and returns how long it waited.  A request costing more than the
+        # capacity (e.g. a full batch) waits for a full bucket and then leaves the bucket in debt.
+        waited = 0.0
+        with self._lock:
+            while True:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                needed = min(tokens, self.capacity)
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    return waited
+                delay = (needed - self._tokens) / self.rate
+                self._sleep(delay)
+                waited += delay
+
+
+class RequestGovernor:
+    """Executes Drive requests through an optional rate limiter, retrying quota and server errors with
+    exponential backoff and jitter."""
+
+    logger = logging.getLogger("gdrive-share.throttle")
+
+    # 403 responses are only retried when Drive says they were caused by rate limiting.
+    _retry_statuses = {429, 500, 502, 503, 504}
+    _rate_limit_reasons = {"userRateLimitExceeded", "rateLimitExceeded"}
+
+    def __init__(self, bucket: TokenBucket = None, max_retries: int = 5, base_delay: float = 1.0,
+                 max_delay: float = 64.0, sleep: Callable = time.sleep, jitter: Callable = random.uniform):
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self._jitter = jitter
+        self._lock = threading.Lock()
+        # Throttle events are kept so the quota can be sized from a run's log.
+        self.events = Counter()
+        self.backoff_time = 0.0
+        self.rate_limited_time = 0.0
+
+    @staticmethod
+    def error_reason(error: HttpError) -> str:
+        try:
+            details = json.loads(error.content.decode("utf-8"))['error']
+            return details['errors'][0]['reason']
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+            return ""
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, HttpError):
+            status = int(error.resp.status)
+            if status in RequestGovernor._retry_statuses:
+                return True
+            return status == 403 and RequestGovernor.error_reason(error) in RequestGovernor._rate_limit_reasons
+        return isinstance(error, (ConnectionError, TimeoutError))
+
+    def record(self, endpoint: str, error: Exception) -> None:
+        if isinstance(error, HttpError):
+            reason = RequestGovernor.error_reason(error)
+            event = f"{endpoint} {error.resp.status}{' ' + reason if reason else ''}"
+        else:
+            event = f"{endpoint} {type(error).__name__}"
+        with self._lock:
+            self.events[event] += 1
+
+    def backoff(self, attempt: int) -> None:
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) + self._jitter(0, self.base_delay)
+        with self._lock:
+            self.backoff_time += delay
+        self._sleep(delay)
+
+    def acquire(self, cost: int = 1) -> None:
+        if self.bucket is not None:
+            waited = self.bucket.acquire(cost)
+            if waited > 0:
+                with self._lock:
+                    self.rate_limited_time += waited
+
+    def call(self, fn: Callable, endpoint: str, cost: int = 1):
+        attempt = 0
+        while True:
+            self.acquire(cost)
+            try:
+                return fn()
+            except Exception as e:
+                if not self.is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                self.record(endpoint, e)
+                RequestGovernor.logger.info(f"{endpoint} was throttled or failed ({e}), "
+                                            f"retry {attempt + 1} of {self.max_retries}")
+                self.backoff(attempt)
+                attempt += 1
+
+    def summary(self) -> str:
+        if len(self.events) == 0 and self.rate_limited_time == 0:
+            return "No throttling."
+        events = ", ".join(f"{event}: {count}" for event, count in sorted(self.events.items()))
+        return (f"Throttle events: {events or 'none'}.  Backed off for {self.backoff_time:.1f}s, "
+                f"rate limited for {self.rate_limited_time:.1f}s.")
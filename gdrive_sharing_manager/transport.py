@@ -0,0 +1,123 @@
+from typing import Dict
+import threading
+import logging
+import socket
+import time
+
+
+class PooledHttp:
+    """Thread-safe stand-in for httplib2.Http backed by a pooled requests session, for the Drive clients.
+
+    Connections are kept alive in a pool of up to pool_size per host and shared by every thread, so a run pays for a
+    few TLS handshakes instead of one per client.  Responses are gzip-compressed.  The OAuth token is applied to
+    each request and refreshed under a lock, once, whichever thread notices it expired.
+    """
+
+    logger = logging.getLogger("gdrive-share.transport")
+
+    def __init__(self, credentials=None, pool_size: int = 10, timeout: float = 120.0, verify=True):
+        # The Google client libraries and requests are only needed once a session is started.
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._refresh_lock = threading.Lock()
+        self.timeout = timeout
+        self.requests = 0
+        self.refreshes = 0
+        self.latencies = []
+        self._credentials = credentials
+        self._lock = threading.Lock()
+        # A CA bundle given here is passed with every request, as requests lets REQUESTS_CA_BUNDLE override the
+        # session's.
+        self._verify = {} if verify is True else {'verify': verify}
+        self._session = requests.Session()
+        # Retries are left to RequestGovernor.  pool_block makes extra threads wait for a connection rather than
+        # open (and throw away) connections beyond the pool.
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0, pool_block=True)
+        self._session.mount("https://", self._adapter)
+        self._session.mount("http://", self._adapter)
+
+    def _refresh(self) -> None:
+        # Called with _refresh_lock held.
+        from google.auth.transport.requests import Request
+        PooledHttp.logger.debug("Refreshing access token")
+        self._credentials.refresh(Request(self._session))
+        self.refreshes += 1
+
+    def _authorize(self, headers: Dict) -> str:
+        # Adds the Authorization header, returns the token used.
+        if self._credentials is None:
+            return None
+        with self._refresh_lock:
+            if not self._credentials.valid:
+                self._refresh()
+            self._credentials.apply(headers)
+            return self._credentials.token
+
+    def _send(self, uri: str, method: str, body, headers: Dict, follow_redirects: bool):
+        import requests
+
+        started = time.perf_counter()
+        try:
+            return self._session.request(method, uri, data=body, headers=headers, timeout=self.timeout,
+                                         allow_redirects=follow_redirects, **self._verify)
+        # Raised as the exceptions httplib2 would raise, which the client library retries.
+        except requests.exceptions.Timeout as e:
+            raise socket.timeout(str(e)) from e
+        except requests.exceptions.ConnectionError as e:
+            raise ConnectionError(str(e)) from e
+        finally:
+            with self._lock:
+                self.requests += 1
+                self.latencies.append(time.perf_counter() - started)
+
+    def request(self, uri: str, method: str = "GET", body=None, headers: Dict = None, redirections: int = 5,
+                connection_type=None):
+        """Same signature and return value, (response, content), as httplib2.Http.request."""
+        import httplib2
+
+        headers = dict(headers or {})
+        headers.setdefault('accept-encoding', "gzip")
+        token = self._authorize(headers)
+        response = self._send(uri, method, body, headers, redirections > 0)
+        if response.status_code == 401 and self._credentials is not None:
+            # The token expired or was revoked in flight.  Only the first thread to see that refreshes it.
+            with self._refresh_lock:
+                if self._credentials.token == token:
+                    self._refresh()
+                self._credentials.apply(headers)
+            response = self._send(uri, method, body, headers, redirections > 0)
+
+        info = {key.lower(): value for key, value in response.headers.items()}
+        # The body has already been decompressed, like httplib2 does.
+        if 'content-encoding' in info:
+            info['-content-encoding'] = info.pop('content-encoding')
+        info['status'] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        return resp, response.content
+
+    def connections(self) -> int:
+        # Connections opened so far, each of which cost a TLS handshake.
+        pools = self._adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+        return {
+            'requests': self.requests,
+            'connections': self.connections(),
+            'token_refreshes': self.refreshes,
+            'latency_p50': round(latencies[len(latencies) // 2], 4) if latencies else 0.0,
+            'latency_p95': round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 4)
+            if latencies else 0.0,
+        }
+
+    def summary(self) -> str:
+        t = self.as_dict()
+        return f"Transport: {t['requests']} requests over {t['connections']} connections, {t['token_refreshes']} " \
+               f"token refreshes, latency p50 {t['latency_p50']:.3f} s, p95 {t['latency_p95']:.3f} s"
+
+    def close(self) -> None:
+        self._session.close()
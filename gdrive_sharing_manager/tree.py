@@ -0,0 +1,86 @@
+from collections.abc import Mapping, MutableMapping
+from typing import Dict
+import sys
+
+# Compact nodes for the trees built by ArgParser._get_files_folders_dict.  They are read and changed like the
+# nested dicts they replace (folder['child_files'], file.get('size'), ...), so code written against the dicts works
+# with either, but each one takes a fraction of the memory: no per-node hash table, names, MIME types and folder IDs
+# are interned, and only the file fields in ArgParser._list_fields are kept.
+
+
+class FolderNode(MutableMapping):
+    """A folder of a crawled tree, with the keys 'folder_name', 'folder_id', 'parent_name' and optionally
+    'child_files' and 'child_folders'."""
+
+    __slots__ = ('folder_name', 'folder_id', 'parent_name', 'child_files', 'child_folders')
+
+    def __init__(self, folder_name: str, folder_id: str, parent_name: str = None):
+        self.folder_name = sys.intern(folder_name)
+        self.folder_id = sys.intern(folder_id)
+        # The root keeps its own name, as in the crawls.
+        self.parent_name = self.folder_name if parent_name is None else sys.intern(parent_name)
+        self.child_files = None
+        self.child_folders = None
+
+    def __getitem__(self, key: str):
+        value = getattr(self, key, None) if key in FolderNode.__slots__ else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value) -> None:
+        if key not in FolderNode.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self[key]
+        setattr(self, key, None)
+
+    def __iter__(self):
+        return (key for key in FolderNode.__slots__ if getattr(self, key) is not None)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"FolderNode({self.folder_name!r}, {self.folder_id!r})"
+
+
+class FileNode(Mapping):
+    """A file of a crawled tree, read like the files.list resource it was made from.  The size is kept as a number
+    and the checksum as bytes, both are given back as strings like Drive sends them."""
+
+    __slots__ = ('id', 'name', 'mimeType', 'parents', 'size', 'md5', 'movable')
+
+    def __init__(self, resource: Dict):
+        self.id = resource['id']
+        self.name = sys.intern(resource['name'])
+        self.mimeType = sys.intern(resource['mimeType'])
+        self.parents = tuple(sys.intern(p) for p in resource.get('parents', []))
+        self.size = int(resource['size']) if 'size' in resource else None
+        self.md5 = bytes.fromhex(resource['md5Checksum']) if 'md5Checksum' in resource else None
+        self.movable = resource.get('capabilities', {}).get('canMoveItemWithinDrive')
+
+    def __getitem__(self, key: str):
+        if key in ('id', 'name', 'mimeType'):
+            return getattr(self, key)
+        if key == 'parents':
+            return list(self.parents)
+        if key == 'size' and self.size is not None:
+            return str(self.size)
+        if key == 'md5Checksum' and self.md5 is not None:
+            return self.md5.hex()
+        if key == 'capabilities' and self.movable is not None:
+            return {'canMoveItemWithinDrive': self.movable}
+        raise KeyError(key)
+
+    def __iter__(self):
+        keys = ('id', 'name', 'mimeType', 'parents', 'size', 'md5Checksum', 'capabilities')
+        return (key for key in keys if key in self)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"FileNode({self.name!r}, {self.id!r})"
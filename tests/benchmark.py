@@ -0,0 +1,470 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.throttle import RequestGovernor
+from gdrive_sharing_manager.session import Session
+from gdrive_sharing_manager.transport import PooledHttp
+from gdrive_sharing_manager.tree import FolderNode, FileNode
+from tests.fake_drive import FakeDrive
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from typing import Callable, Dict, List
+from pathlib import Path
+import tracemalloc
+import threading
+import gzip
+import ssl
+import subprocess
+import statistics
+import tempfile
+import os
+import argparse
+import logging
+import json
+import time
+import sys
+
+# Limits for each scenario as (fixed, per 1000 nodes of the library), for HTTP round trips (a batch is one round
+# trip) and for calls (which is what counts against quota).  A run above these is a regression.
+THRESHOLDS = {
+    "crawl": {'round_trips': (10, 3), 'calls': (10, 3)},
+    "flat": {'round_trips': (10, 2), 'calls': (10, 2)},
+    "create": {'round_trips': (20, 5), 'calls': (20, 120)},
+    "merge": {'round_trips': (20, 7), 'calls': (20, 70)},
+    "move": {'round_trips': (20, 7), 'calls': (20, 70)},
+}
+
+
+def build_library(drive: FakeDrive, nodes: int, files_per_folder: int = 9, parent_id: str = "root") -> str:
+    """Creates a year/venue/date library of roughly nodes folders and files, files are in the date folders."""
+    fanout = max(2, round((nodes / (1 + files_per_folder)) ** (1 / 3)))
+    root = drive.add_folder(name="Library", parent_id=parent_id)
+    level = [root]
+    for depth in range(3):
+        level = [drive.add_folder(name=f"{depth}-{i}", parent_id=parent) for parent in level for i in range(fanout)]
+    for folder in level:
+        for i in range(files_per_folder):
+            drive.add_file(f"IMG_{i:04d}.jpg", folder, size=1024 * 1024 * (i + 1))
+    return root
+
+
+def add_uploads(drive: FakeDrive, upload_root: str, share: float = 0.1, files_per_folder: int = 5) -> int:
+    # Uploads files into a share of the deepest folders of a skeleton created by 'create'.
+    level = [upload_root]
+    for depth in range(3):
+        level = [c['id'] for f in level for c in drive.children_of(f, folders_only=True)]
+    step = max(1, round(1 / share))
+    count = 0
+    for folder in level[::step]:
+        for i in range(files_per_folder):
+            drive.add_file(f"upload_{i:04d}.jpg", folder, size=2 * 1024 * 1024)
+            count += 1
+    return count
+
+
+def _reset(drive: FakeDrive) -> None:
+    ArgParser._service = drive
+    ArgParser._api_calls = Counter()
+    ArgParser._pending_copies = []
+    ArgParser._failed_copies = 0
+    ArgParser._moved_files = 0
+    ArgParser._move_fallbacks = 0
+    ArgParser._move = False
+    ArgParser._executor = None
+    ArgParser._cache = None
+    ArgParser._dedupe = None
+    ArgParser._journal = None
+    ArgParser._stats = None
+    ArgParser._folder_memo = {}
+    ArgParser._drive_ids = {}
+    ArgParser._batch_size = 100
+    ArgParser._governor = RequestGovernor()
+    drive.calls = Counter()
+    drive.round_trips = 0
+    drive.simulated_time = 0.0
+
+
+def _measure(name: str, nodes: int, drive: FakeDrive, fn: Callable, memory: bool = True) -> Dict:
+    _reset(drive)
+    if memory:
+        tracemalloc.start()
+    storage = drive.storage_used()
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    storage_added = drive.storage_used() - storage
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        'scenario': name,
+        'nodes': nodes,
+        'round_trips': drive.round_trips,
+        'calls': sum(drive.calls.values()),
+        'calls_by_endpoint': dict(drive.calls),
+        'simulated_seconds': round(drive.simulated_time, 2),
+        'storage_added_mb': round(storage_added / (1024 * 1024), 1),
+        'cpu_seconds': round(elapsed, 3),
+        'peak_memory_mb': round(peak / (1024 * 1024), 1) if peak is not None else None,
+    }
+
+
+def run(nodes: int, latency: float = 0.05, memory: bool = True) -> List:
+    """Runs the crawl, create and merge scenarios against a synthetic library of roughly nodes items, and the crawl
+    of the same library in a shared drive."""
+    drive = FakeDrive(latency=latency)
+    library = build_library(drive, nodes)
+    uploads = drive.add_folder(name="Uploads")
+    total = sum(drive.count(library).values()) + 1
+    results = []
+
+    def crawl():
+        ArgParser._get_files_folders_dict([{'id': library, 'name': "Library"}])
+    results.append(_measure("crawl", total, drive, crawl, memory))
+
+    shared_library = build_library(drive, nodes, parent_id=drive.add_shared_drive("Shared Library"))
+
+    def flat():
+        ArgParser._get_files_folders_dict([{'id': shared_library, 'name': "Library"}], crawl="auto")
+    results.append(_measure("flat", total, drive, flat, memory))
+
+    def create(user: str = "fan@example.com"):
+        skeleton = ArgParser._get_files_folders_dict([{'id': library, 'name': "Library"}], include_files=False)
+        user_folder = ArgParser._create_folder(uploads, user)
+        ArgParser._duplicate_folder_structure_by_level(user_folder, skeleton['child_folders'])
+        ArgParser._share_folder_with_user(user_folder, user)
+    results.append(_measure("create", total, drive, create, memory))
+
+    def merge(user_folder: Dict, move: bool = False):
+        ArgParser._move = move
+        try:
+            new_ = ArgParser._get_files_folders_dict([{'id': user_folder['id'], 'name': user_folder['name']}])
+            orig = ArgParser._get_files_folders_dict([{'id': library, 'name': "Library"}])
+            ArgParser._copy_all_files(orig, new_)
+        finally:
+            ArgParser._move = False
+
+    # The same uploads are merged by copying them, and then (from a second user folder) by moving them.
+    _reset(drive)
+    create("mover@example.com")
+    for name, user_folder in zip(("merge", "move"), drive.children_of(uploads, folders_only=True)):
+        uploaded = add_uploads(drive, user_folder['id'])
+        result = _measure(name, total, drive, lambda: merge(user_folder, move=name == "move"), memory)
+        result['uploaded_files'] = uploaded
+        results.append(result)
+    return results
+
+
+def startup(runs: int = 5) -> Dict:
+    """Times `gdrive-share --help` in new interpreters and building a Drive client with and without a cached
+    discovery document.  Cold CLI runs compile every module, warm ones reuse the bytecode."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=str(Path(tmp).joinpath("pycache")))
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        command = [sys.executable, "-m", "gdrive_sharing_manager.main", "--help"]
+
+        def cli() -> float:
+            started = time.perf_counter()
+            subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            return time.perf_counter() - started
+        cold_cli = cli()
+        warm_cli = statistics.median(cli() for _ in range(runs))
+
+        from google.oauth2.credentials import Credentials
+
+        def client() -> float:
+            session = Session(Path(tmp).joinpath("credentials.json"))
+            session.credentials = Credentials("benchmark")
+            started = time.perf_counter()
+            session.build()
+            return time.perf_counter() - started
+        cold_client = client()
+        warm_client = statistics.median(client() for _ in range(runs))
+    return {
+        'help_cold_seconds': round(cold_cli, 3),
+        'help_warm_seconds': round(warm_cli, 3),
+        'client_cold_seconds': round(cold_client, 4),
+        'client_warm_seconds': round(warm_client, 4),
+    }
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    # Answers every request with the same files.list page, gzip-compressed when asked to.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if length > 0:
+            self.rfile.read(length)
+        body = self.server.page
+        self.send_response(200)
+        self.send_header('Content-Type', "application/json; charset=UTF-8")
+        if "gzip" in self.headers.get('Accept-Encoding', ""):
+            body = self.server.page_gzip
+            self.send_header('Content-Encoding', "gzip")
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.sent(len(body))
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StandIn(ThreadingHTTPServer):
+    """Local HTTPS stand-in for Drive that counts the connections (so TLS handshakes) and bytes it serves."""
+
+    daemon_threads = True
+
+    def __init__(self, context: ssl.SSLContext, items: int = 100):
+        super().__init__(("localhost", 0), _StandInHandler)
+        self.context = context
+        files = [{'id': f"f{i:09d}", 'name': f"IMG_{i:04d}.jpg", 'mimeType': "image/jpeg", 'parents': ["d000000001"],
+                  'md5Checksum': f"{i:032x}", 'size': "1048576"} for i in range(items)]
+        self.page = json.dumps({'files': files}).encode("utf-8")
+        self.page_gzip = gzip.compress(self.page)
+        self.connections = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def get_request(self):
+        request, address = self.socket.accept()
+        with self._lock:
+            self.connections += 1
+        return request, address
+
+    def finish_request(self, request, client_address):
+        # The handshake is done by the thread handling the connection, not the one accepting them.
+        tls = self.context.wrap_socket(request, server_side=True)
+        try:
+            self.RequestHandlerClass(tls, client_address, self)
+        finally:
+            tls.close()
+
+    def sent(self, size: int) -> None:
+        with self._lock:
+            self.bytes += size
+
+
+def _self_signed_certificate(directory: Path) -> Path:
+    # A throwaway certificate for localhost, made with the openssl command line tool.
+    cert, key = directory.joinpath("cert.pem"), directory.joinpath("key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                    "-addext", "subjectAltName=DNS:localhost", "-keyout", str(key), "-out", str(cert)],
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return cert
+
+
+def transport(requests: int = 400, threads: int = 8, clients: int = 50) -> List:
+    """Sends requests files.list calls from threads threads to a local HTTPS stand-in, once with an httplib2
+    connection per Drive client and once with a shared PooledHttp.  The calls are made by clients short-lived
+    clients, like the crawler client a streamed merge builds for every user."""
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+
+    document = get_static_doc("drive", "v3")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cert = _self_signed_certificate(Path(tmp))
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, Path(tmp).joinpath("key.pem"))
+        for name in ("httplib2", "pooled"):
+            server = _StandIn(context)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            endpoint = f"https://localhost:{server.server_address[1]}/drive/v3/"
+            pooled = PooledHttp(verify=str(cert), pool_size=threads) if name == "pooled" else None
+            latencies = []
+
+            def client(calls: int) -> None:
+                http = pooled if pooled is not None else httplib2.Http(ca_certs=str(cert))
+                service = build_from_document(document, http=http, client_options={'api_endpoint': endpoint})
+                for _ in range(calls):
+                    started = time.perf_counter()
+                    service.files().list(pageSize=100).execute()
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(client, [requests // clients + (1 if i < requests % clients else 0)
+                                       for i in range(clients)]))
+            elapsed = time.perf_counter() - started
+            server.shutdown()
+            server.server_close()
+            latencies.sort()
+            results.append({
+                'transport': name,
+                'requests': requests,
+                'threads': threads,
+                'clients': clients,
+                'handshakes': server.connections,
+                'seconds': round(elapsed, 3),
+                'latency_p50': round(latencies[len(latencies) // 2], 4),
+                'latency_p95': round(latencies[int(0.95 * len(latencies))], 4),
+                'kb_received': round(server.bytes / 1024, 1),
+            })
+    return results
+
+
+def _synthetic_pages(folder_ids: List, files_per_folder: int, page_size: int = 1000):
+    # files.list pages of the files of the given folders, parsed from JSON like the client library does, so every
+    # resource has its own strings.
+    page = []
+    for folder_id in folder_ids:
+        for i in range(files_per_folder):
+            page.append({'id': f"{folder_id}f{i:04d}", 'name': f"IMG_{i:04d}.jpg", 'mimeType': "image/jpeg",
+                         'parents': [folder_id], 'md5Checksum': f"{hash((folder_id, i)) & (2 ** 128 - 1):032x}",
+                         'size': str(1024 * (i + 1)), 'capabilities': {'canMoveItemWithinDrive': True}})
+            if len(page) == page_size:
+                yield json.loads(json.dumps(page))
+                page = []
+    if len(page) > 0:
+        yield json.loads(json.dumps(page))
+
+
+def _synthetic_tree(files: int, files_per_folder: int, compact: bool) -> Dict:
+    # A year/venue/date tree like build_library's, with files in the date folders, built the way the level crawl
+    # builds it: with FolderNode and FileNode, or with the nested dicts and API resources used before them.
+    def folder(name: str, folder_id: str, parent_name: str):
+        if compact:
+            return FolderNode(name, folder_id, parent_name)
+        return {'folder_name': name, 'folder_id': folder_id, 'parent_name': parent_name}
+
+    fanout = max(2, round((files / files_per_folder) ** (1 / 3)))
+    root = folder("Library", "root", "Library")
+    level = [root]
+    for depth in range(3):
+        next_level = []
+        for parent in level:
+            for i in range(fanout):
+                node = folder(f"{depth}-{i}", f"{parent['folder_id']}.{i}", parent['folder_name'])
+                parent.setdefault('child_folders', []).append(node)
+                next_level.append(node)
+        level = next_level
+    by_id = {node['folder_id']: node for node in level}
+    per_folder = max(1, files // len(level))
+    for page in _synthetic_pages(list(by_id.keys()), per_folder):
+        for resource in page:
+            by_id[resource['parents'][0]].setdefault('child_files', []).append(
+                FileNode(resource) if compact else resource)
+    return root
+
+
+def tree_memory(files: int = 1000000, files_per_folder: int = 100) -> List:
+    """Memory held by the crawled tree of a synthetic library of about files files, built with the compact nodes
+    and with plain dicts."""
+    results = []
+    for compact in (False, True):
+        tracemalloc.start()
+        started = time.perf_counter()
+        tree = _synthetic_tree(files, files_per_folder, compact)
+        elapsed = time.perf_counter() - started
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # The tree is also walked the way diff_trees and DedupeIndex do, to check the nodes read like the dicts.
+        counts = Counter()
+        stack = [tree]
+        while len(stack) > 0:
+            node = stack.pop()
+            counts['folders'] += 1
+            counts['files'] += len(node.get('child_files', []))
+            counts['bytes'] += sum(int(f.get('size', 0)) for f in node.get('child_files', []))
+            stack.extend(node.get('child_folders', []))
+        del tree
+        results.append({
+            'representation': "compact" if compact else "dicts",
+            'files': counts['files'],
+            'folders': counts['folders'],
+            'memory_mb': round(held / (1024 * 1024), 1),
+            'peak_memory_mb': round(peak / (1024 * 1024), 1),
+            'bytes_per_file': round(held / max(1, counts['files'])),
+            'seconds': round(elapsed, 2),
+        })
+    return results
+
+
+def check(results: List, thresholds: Dict = THRESHOLDS) -> List:
+    """Returns a message for every result above its threshold."""
+    failures = []
+    for r in results:
+        for metric, (fixed, per_1000) in thresholds[r['scenario']].items():
+            limit = fixed + per_1000 * r['nodes'] / 1000
+            if r[metric] > limit:
+                failures.append(f"{r['scenario']} at {r['nodes']} nodes used {r[metric]} {metric}, "
+                                f"limit is {limit:.0f}")
+    return failures
+
+
+def main(argv: List = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark create and merge against an in-memory fake Drive.")
+    parser.add_argument('--sizes', type=int, nargs="+", default=[1000, 10000],
+                        help="Approximate number of nodes of the synthetic libraries.")
+    parser.add_argument('--latency', type=float, default=0.05, help="Simulated seconds per round trip.")
+    parser.add_argument('--no-memory', action="store_true", help="Don't trace memory, which is slow.")
+    parser.add_argument('--json', help="Write the results to this file as JSON.")
+    parser.add_argument('--no-thresholds', action="store_true", help="Don't fail on regressions.")
+    parser.add_argument('--startup', action="store_true",
+                        help="Also time the startup of the CLI and of building a Drive client.")
+    parser.add_argument('--transport', action="store_true",
+                        help="Also compare the httplib2 and pooled transports against a local HTTPS stand-in.")
+    parser.add_argument('--tree-memory', type=int, metavar="FILES",
+                        help="Also measure the memory held by the crawled tree of a synthetic library of this many "
+                             "files (e.g. 1000000), with compact nodes and with plain dicts.")
+    args = parser.parse_args(argv)
+    logging.getLogger("gdrive-share").setLevel(logging.WARNING)
+
+    results = []
+    for size in args.sizes:
+        results.extend(run(size, latency=args.latency, memory=not args.no_memory))
+
+    print(f"{'Scenario':<8}  {'Nodes':>7}  {'Round trips':>11}  {'Calls':>7}  {'Simulated (s)':>13}  "
+          f"{'CPU (s)':>7}  {'Peak (MB)':>9}  {'Storage (MB)':>12}")
+    for r in results:
+        peak = f"{r['peak_memory_mb']:.1f}" if r['peak_memory_mb'] is not None else "-"
+        print(f"{r['scenario']:<8}  {r['nodes']:>7}  {r['round_trips']:>11}  {r['calls']:>7}  "
+              f"{r['simulated_seconds']:>13.1f}  {r['cpu_seconds']:>7.2f}  {peak:>9}  {r['storage_added_mb']:>12.1f}")
+    startup_times = None
+    if args.startup:
+        startup_times = startup()
+        print()
+        print(f"Startup: --help {startup_times['help_cold_seconds']:.3f} s cold, "
+              f"{startup_times['help_warm_seconds']:.3f} s warm; Drive client "
+              f"{startup_times['client_cold_seconds']:.4f} s without cached discovery document, "
+              f"{startup_times['client_warm_seconds']:.4f} s with it")
+    transport_results = None
+    if args.transport:
+        transport_results = transport()
+        print()
+        print(f"{'Transport':<9}  {'Requests':>8}  {'Threads':>7}  {'Clients':>7}  {'Handshakes':>10}  "
+              f"{'Time (s)':>8}  {'p50 (s)':>7}  {'p95 (s)':>7}  {'KB':>8}")
+        for t in transport_results:
+            print(f"{t['transport']:<9}  {t['requests']:>8}  {t['threads']:>7}  {t['clients']:>7}  "
+                  f"{t['handshakes']:>10}  {t['seconds']:>8.2f}  {t['latency_p50']:>7.4f}  {t['latency_p95']:>7.4f}  "
+                  f"{t['kb_received']:>8.1f}")
+    tree_results = None
+    if args.tree_memory:
+        tree_results = tree_memory(args.tree_memory)
+        print()
+        print(f"{'Tree':<8}  {'Files':>9}  {'Folders':>7}  {'Held (MB)':>9}  {'Peak (MB)':>9}  {'Bytes/file':>10}  "
+              f"{'Time (s)':>8}")
+        for t in tree_results:
+            print(f"{t['representation']:<8}  {t['files']:>9}  {t['folders']:>7}  {t['memory_mb']:>9.1f}  "
+                  f"{t['peak_memory_mb']:>9.1f}  {t['bytes_per_file']:>10}  {t['seconds']:>8.2f}")
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            if startup_times or transport_results or tree_results:
+                json.dump({'scenarios': results, 'startup': startup_times, 'transport': transport_results,
+                           'tree_memory': tree_results}, f, indent=2)
+            else:
+                json.dump(results, f, indent=2)
+
+    failures = [] if args.no_thresholds else check(results)
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    return 1 if len(failures) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,562 @@
+from googleapiclient.errors import HttpError
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List
+import threading
+import itertools
+import logging
+import httplib2
+import json
+import re
+import time
+
+
+class _QueryParser:
+    """Parses the Drive 'q' search syntax into a predicate over file resources.
+
+    Supports and/or/not, parentheses, '<value>' in <collection>, comparisons (=, !=, <, <=, >, >=) and contains.
+    """
+
+    _token = re.compile(r"\s*(?:(?P<string>'(?:[^'\\]|\\.)*')|(?P<op><=|>=|!=|=|<|>)|(?P<paren>[()])|"
+                        r"(?P<word>[A-Za-z_][A-Za-z0-9_.]*)|(?P<number>-?\d+(?:\.\d+)?))")
+
+    def __init__(self, query: str):
+        self.tokens = []
+        pos = 0
+        query = query.strip()
+        while pos < len(query):
+            match = _QueryParser._token.match(query, pos)
+            if match is None or match.end() == pos:
+                raise ValueError(f"Invalid query at {pos}: {query}")
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == "string":
+                value = re.sub(r"\\(.)", r"\1", value[1:-1])
+            elif kind == "number":
+                value = float(value)
+            self.tokens.append((kind, value))
+            pos = match.end()
+        self.pos = 0
+
+    def _peek(self, value=None):
+        if self.pos >= len(self.tokens):
+            return None
+        kind, token = self.tokens[self.pos]
+        if value is not None and not (kind in ("word", "paren", "op") and str(token).lower() == value):
+            return None
+        return kind, token
+
+    def _next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        expr = self._or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"Unexpected {self.tokens[self.pos]} in query")
+        return expr
+
+    def _or(self):
+        terms = [self._and()]
+        while self._peek("or"):
+            self._next()
+            terms.append(self._and())
+        return terms[0] if len(terms) == 1 else ("or", terms)
+
+    def _and(self):
+        factors = [self._not()]
+        while self._peek("and"):
+            self._next()
+            factors.append(self._not())
+        return factors[0] if len(factors) == 1 else ("and", factors)
+
+    def _not(self):
+        if self._peek("not"):
+            self._next()
+            return "not", self._not()
+        if self._peek("("):
+            self._next()
+            expr = self._or()
+            self._next()
+            return expr
+        return self._comparison()
+
+    def _value(self):
+        kind, value = self._next()
+        if kind == "word" and value.lower() in ("true", "false"):
+            return value.lower() == "true"
+        return value
+
+    def _comparison(self):
+        kind, left = self._next()
+        if kind == "string":
+            # '<value>' in <collection>
+            self._next()
+            _, field = self._next()
+            return "in", left, field
+        kind, op = self._next()
+        if kind == "word" and op.lower() == "contains":
+            return "contains", left, self._value()
+        return "cmp", left, op, self._value()
+
+
+def _evaluate(expr, item: Dict) -> bool:
+    kind = expr[0]
+    if kind == "or":
+        return any(_evaluate(e, item) for e in expr[1])
+    if kind == "and":
+        return all(_evaluate(e, item) for e in expr[1])
+    if kind == "not":
+        return not _evaluate(expr[1], item)
+    if kind == "in":
+        return expr[1] in item.get(expr[2], [])
+    if kind == "contains":
+        return str(expr[2]) in str(item.get(expr[1], ""))
+    _, field, op, value = expr
+    actual = item.get(field)
+    if field == "trashed":
+        actual = bool(actual)
+    elif isinstance(value, float) and actual is not None:
+        actual = float(actual)
+    if op == "=":
+        return actual == value
+    if op == "!=":
+        return actual != value
+    if actual is None:
+        return False
+    return {"<": actual < value, "<=": actual <= value, ">": actual > value, ">=": actual >= value}[op]
+
+
+def _parent_candidates(expr):
+    # Parent IDs every match must have one of, so listings only look at those children instead of every item.
+    kind = expr[0]
+    if kind == "in" and expr[2] == "parents":
+        return {expr[1]}
+    if kind == "or":
+        candidates = [_parent_candidates(e) for e in expr[1]]
+        if any(c is None for c in candidates):
+            return None
+        return set().union(*candidates)
+    if kind == "and":
+        for e in expr[1]:
+            candidates = _parent_candidates(e)
+            if candidates is not None:
+                return candidates
+    return None
+
+
+def _select(resource: Dict, fields: str) -> Dict:
+    # Partial response for a flat field list such as 'id, name, parents'.
+    if fields is None:
+        return {k: resource[k] for k in ("kind", "id", "name", "mimeType") if k in resource}
+    if fields.strip() == "*":
+        return dict(resource)
+    selected = {}
+    for field in (f.strip() for f in fields.split(",")):
+        # Nested fields are given as a path, e.g. 'capabilities/canMoveItemWithinDrive'.
+        key, _, sub = field.partition("/")
+        if key not in resource:
+            continue
+        if sub and isinstance(resource[key], dict):
+            if sub in resource[key]:
+                selected.setdefault(key, {})[sub] = resource[key][sub]
+        else:
+            selected[key] = resource[key]
+    return selected
+
+
+def _item_fields(fields: str, collection: str) -> str:
+    # Field list of the items of a list response, e.g. 'files(id, name)' -> 'id, name'.
+    if fields is None:
+        return None
+    match = re.search(collection + r"\(([^)]*)\)", fields)
+    return match.group(1) if match else None
+
+
+class FakeRequest:
+    """Stand-in for googleapiclient's HttpRequest, runs against the FakeDrive when executed."""
+
+    def __init__(self, drive, endpoint: str, fn: Callable):
+        self._drive = drive
+        self.endpoint = endpoint
+        self._fn = fn
+
+    def execute(self):
+        return self._drive._call(self.endpoint, self._fn)
+
+
+class FakeBatch:
+    """Stand-in for BatchHttpRequest.  The batch costs one round trip, each call in it counts against quota."""
+
+    def __init__(self, drive):
+        self._drive = drive
+        self._requests = []
+
+    def add(self, request: FakeRequest, callback: Callable = None, request_id: str = None) -> None:
+        if len(self._requests) >= 100:
+            raise ValueError("Batch requests are limited to 100 calls")
+        self._requests.append((request_id or str(len(self._requests) + 1), request, callback))
+
+    def execute(self):
+        def run():
+            results = []
+            for request_id, request, callback in self._requests:
+                try:
+                    response, exception = self._drive._call(request.endpoint, request._fn, round_trip=False), None
+                except HttpError as e:
+                    response, exception = None, e
+                results.append((request_id, callback, response, exception))
+            return results
+
+        for request_id, callback, response, exception in self._drive._call("batch", run):
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+class _Resource:
+    def __init__(self, **methods):
+        self.__dict__.update(methods)
+
+
+class FakeDrive:
+    """In-memory Drive v3 service that can be plugged in as ArgParser._service.
+
+    Implements the files, drives, permissions and changes calls used by this project plus batch requests.  Every round
+    trip advances a simulated clock by latency seconds (or really sleeps with sleep=True), and errors can be
+    injected to exercise the retry handling.
+    """
+
+    logger = logging.getLogger("gdrive-share.fake")
+
+    folder_mimetype = "application/vnd.google-apps.folder"
+
+    def __init__(self, latency: float = 0.05, batch_latency: float = None, sleep: bool = False):
+        self.latency = latency
+        self.batch_latency = batch_latency if batch_latency is not None else latency * 2
+        self.sleep = sleep
+        self.items = {}
+        self.children = defaultdict(dict)
+        self.acls = defaultdict(dict)
+        self.change_log = []
+        # Sharing notification emails Drive would have sent.
+        self.emails_sent = 0
+        # Counts of every call by endpoint and of HTTP round trips (a batch is one round trip).
+        self.calls = Counter()
+        self.round_trips = 0
+        self.simulated_time = 0.0
+        self._errors = []
+        self._error_rate = None
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._clock = itertools.count(1)
+        self.add_folder("root", "My Drive", parent_id=None)
+
+    # Setting up data.
+
+    def _new_id(self, prefix: str = "f") -> str:
+        return f"{prefix}{next(self._ids):09d}"
+
+    def _timestamp(self) -> str:
+        tick = next(self._clock)
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(1_600_000_000 + tick)) + f".{tick % 1000:03d}Z"
+
+    def _insert(self, resource: Dict) -> Dict:
+        resource.setdefault('kind', "drive#file")
+        resource.setdefault('trashed', False)
+        resource.setdefault('createdTime', self._timestamp())
+        resource.setdefault('modifiedTime', resource['createdTime'])
+        # Items of a shared drive carry its ID, like the drive's root folder does.
+        drive_ids = [self.items[p]['driveId'] for p in resource.get('parents', [])
+                     if 'driveId' in self.items.get(p, {})]
+        if drive_ids:
+            resource['driveId'] = drive_ids[0]
+        self.items[resource['id']] = resource
+        for p in resource.get('parents', []):
+            # Like Drive, the modifiedTime of the parent folder is left as it is.
+            self.children[p][resource['id']] = None
+        self.change_log.append({'kind': "drive#change", 'changeType': "file", 'fileId': resource['id'],
+                             'removed': False, 'time': resource['modifiedTime']})
+        return resource
+
+    def add_folder(self, folder_id: str = None, name: str = "folder", parent_id: str = "root") -> str:
+        resource = {'id': folder_id or self._new_id("d"), 'name': name, 'mimeType': FakeDrive.folder_mimetype}
+        if parent_id is not None:
+            resource['parents'] = [parent_id]
+        return self._insert(resource)['id']
+
+    def add_shared_drive(self, name: str = "Shared drive") -> str:
+        # The root folder of a new shared drive, its ID is also the drive's ID.
+        drive_id = self._new_id("0A")
+        return self._insert({'id': drive_id, 'name': name, 'mimeType': FakeDrive.folder_mimetype,
+                             'driveId': drive_id})['id']
+
+    def add_file(self, name: str, parent_id: str, mime_type: str = "image/jpeg", size: int = 1024,
+                 md5: str = None, movable: bool = True) -> str:
+        # movable=False stands in for a file the account can't move, e.g. one owned by someone else.
+        resource = {'id': self._new_id(), 'name': name, 'mimeType': mime_type, 'parents': [parent_id],
+                    'size': str(size), 'md5Checksum': md5 or f"{hash((name, size)) & 0xffffffffffff:032x}",
+                    'capabilities': {'canMoveItemWithinDrive': movable}}
+        return self._insert(resource)['id']
+
+    def inject_errors(self, status: int = 403, reason: str = "userRateLimitExceeded", count: int = 1,
+                      endpoint: str = None, after: int = 0) -> None:
+        # The next count calls (to endpoint, or any) fail with the given status, once after calls went through.
+        with self._lock:
+            self._errors.extend([(status, reason, endpoint, after if i == 0 else 0) for i in range(count)])
+
+    def set_error_rate(self, every: int, status: int = 429, reason: str = "rateLimitExceeded") -> None:
+        # Every n-th call fails, 0 turns this off.
+        self._error_rate = (every, status, reason) if every > 0 else None
+
+    @staticmethod
+    def http_error(status: int, reason: str = "") -> HttpError:
+        content = json.dumps({'error': {'code': status, 'message': reason,
+                                        'errors': [{'reason': reason, 'message': reason}]}}).encode("utf-8")
+        return HttpError(httplib2.Response({'status': str(status)}), content)
+
+    # Request handling.
+
+    def _call(self, endpoint: str, fn: Callable, round_trip: bool = True):
+        with self._lock:
+            self.calls[endpoint] += 1
+            if round_trip:
+                self.round_trips += 1
+                delay = self.batch_latency if endpoint == "batch" else self.latency
+                self.simulated_time += delay
+            else:
+                delay = 0
+            error = None
+            for i, (status, reason, error_endpoint, after) in enumerate(self._errors):
+                if error_endpoint is None or error_endpoint == endpoint:
+                    if after > 0:
+                        self._errors[i] = (status, reason, error_endpoint, after - 1)
+                    else:
+                        error = FakeDrive.http_error(status, reason)
+                        del self._errors[i]
+                    break
+            if error is None and self._error_rate is not None and endpoint != "batch":
+                every, status, reason = self._error_rate
+                if every > 0 and sum(self.calls.values()) % every == 0:
+                    error = FakeDrive.http_error(status, reason)
+        if self.sleep and delay > 0:
+            time.sleep(delay)
+        if error is not None:
+            raise error
+        with self._lock:
+            return fn()
+
+    def _get_item(self, file_id: str, kwargs: Dict = None) -> Dict:
+        # Like Drive, items of shared drives are not found by requests that don't set supportsAllDrives.
+        item = self.items.get(file_id)
+        if item is None or ('driveId' in item and not (kwargs or {}).get('supportsAllDrives')):
+            raise FakeDrive.http_error(404, "notFound")
+        return item
+
+    # files()
+
+    def files(self):
+        return _Resource(list=self._files_list, get=self._files_get, create=self._files_create,
+                         copy=self._files_copy, update=self._files_update, generateIds=self._files_generate_ids)
+
+    def _files_list(self, q: str = None, spaces: str = "drive", fields: str = None, pageSize: int = 100,
+                    pageToken: str = None, **kwargs) -> FakeRequest:
+        def run():
+            corpora, drive_id = kwargs.get('corpora', "user"), kwargs.get('driveId')
+            all_drives = kwargs.get('supportsAllDrives') and kwargs.get('includeItemsFromAllDrives')
+            if corpora == "drive" and (drive_id is None or not all_drives):
+                raise FakeDrive.http_error(400, "invalid")
+            expr = _QueryParser(q).parse() if q else None
+            candidates = _parent_candidates(expr) if expr is not None else None
+            if candidates is not None:
+                ids = [c for p in candidates for c in self.children.get(p, {})]
+            else:
+                ids = list(self.items.keys())
+            if corpora == "drive":
+                # The drive's root folder is the drive itself and is not listed.
+                ids = [i for i in ids if self.items[i].get('driveId') == drive_id and i != drive_id]
+            elif not all_drives:
+                ids = [i for i in ids if 'driveId' not in self.items[i]]
+            matches = [self.items[i] for i in ids if expr is None or _evaluate(expr, self.items[i])]
+            start = int(pageToken or 0)
+            page_size = min(pageSize or 100, 1000)
+            item_fields = _item_fields(fields, "files")
+            response = {'files': [_select(m, item_fields) for m in matches[start:start + page_size]]}
+            if start + page_size < len(matches):
+                response['nextPageToken'] = str(start + page_size)
+            return response
+        return FakeRequest(self, "files.list", run)
+
+    def _files_get(self, fileId: str, fields: str = None, **kwargs) -> FakeRequest:
+        return FakeRequest(self, "files.get", lambda: _select(self._get_item(fileId, kwargs), fields))
+
+    def _files_create(self, body: Dict, fields: str = None, **kwargs) -> FakeRequest:
+        def run():
+            resource = dict(body)
+            resource.setdefault('id', self._new_id("d" if body.get('mimeType') == FakeDrive.folder_mimetype else "f"))
+            if resource['id'] in self.items:
+                raise FakeDrive.http_error(409, "duplicate")
+            resource.setdefault('parents', ["root"])
+            for p in resource['parents']:
+                self._get_item(p, kwargs)
+            return _select(self._insert(resource), fields)
+        return FakeRequest(self, "files.create", run)
+
+    def _files_copy(self, fileId: str, body: Dict = None, fields: str = None, **kwargs) -> FakeRequest:
+        def run():
+            resource = dict(self._get_item(fileId, kwargs))
+            for key in ('createdTime', 'modifiedTime', 'driveId'):
+                resource.pop(key, None)
+            resource.update(body or {})
+            for p in resource.get('parents', []):
+                self._get_item(p, kwargs)
+            resource['id'] = self._new_id()
+            return _select(self._insert(resource), fields)
+        return FakeRequest(self, "files.copy", run)
+
+    def _files_update(self, fileId: str, body: Dict = None, addParents: str = None, removeParents: str = None,
+                      fields: str = None, **kwargs) -> FakeRequest:
+        def run():
+            resource = self._get_item(fileId, kwargs)
+            for p in (addParents or "").split(","):
+                if p:
+                    self._get_item(p, kwargs)
+            movable = resource.get('capabilities', {}).get('canMoveItemWithinDrive', True)
+            if (addParents or removeParents) and not movable:
+                raise FakeDrive.http_error(403, "insufficientFilePermissions")
+            resource.update(body or {})
+            parents = [p for p in resource.get('parents', []) if p not in (removeParents or "").split(",")]
+            for p in resource.get('parents', []):
+                if p not in parents:
+                    self.children[p].pop(fileId, None)
+            parents.extend(p for p in (addParents or "").split(",") if p and p not in parents)
+            resource['parents'] = parents
+            resource['modifiedTime'] = self._timestamp()
+            return _select(self._insert(resource), fields)
+        return FakeRequest(self, "files.update", run)
+
+    def _files_generate_ids(self, count: int = 10, space: str = "drive", type: str = "files",
+                            **kwargs) -> FakeRequest:
+        def run():
+            if count > 1000:
+                raise FakeDrive.http_error(400, "invalid")
+            return {'kind': "drive#generatedIds", 'space': space, 'ids': [self._new_id("g") for _ in range(count)]}
+        return FakeRequest(self, "files.generateIds", run)
+
+    # drives()
+
+    def drives(self):
+        return _Resource(list=self._drives_list)
+
+    def _drives_list(self, q: str = None, fields: str = None, pageSize: int = 10, **kwargs) -> FakeRequest:
+        def run():
+            expr = _QueryParser(q).parse() if q else None
+            drives = [{'kind': "drive#drive", 'id': i['id'], 'name': i['name']} for i in self.items.values()
+                      if i.get('driveId') == i['id'] and (expr is None or _evaluate(expr, i))]
+            return {'drives': [_select(d, _item_fields(fields, "drives")) for d in drives[:pageSize]]}
+        return FakeRequest(self, "drives.list", run)
+
+    # permissions()
+
+    def permissions(self):
+        return _Resource(create=self._permissions_create, list=self._permissions_list,
+                         delete=self._permissions_delete)
+
+    def _permissions_create(self, fileId: str, body: Dict, fields: str = None, **kwargs) -> FakeRequest:
+        def run():
+            self._get_item(fileId, kwargs)
+            # Sharing with someone who already has a permission changes its role instead of adding another.
+            existing = [p for p in self.acls[fileId].values()
+                        if 'emailAddress' in body and p.get('emailAddress') == body['emailAddress']]
+            if existing:
+                permission = existing[0]
+                permission['role'] = body.get('role', permission['role'])
+            else:
+                permission = dict(body, id=self._new_id("p"), kind="drive#permission")
+                self.acls[fileId][permission['id']] = permission
+            if body.get('type') in ("user", "group") and kwargs.get('sendNotificationEmail', True):
+                self.emails_sent += 1
+            return _select(permission, fields)
+        return FakeRequest(self, "permissions.create", run)
+
+    def _permissions_list(self, fileId: str, fields: str = None, pageSize: int = 100, pageToken: str = None,
+                          **kwargs) -> FakeRequest:
+        def run():
+            self._get_item(fileId, kwargs)
+            permissions = list(self.acls[fileId].values())
+            start = int(pageToken or 0)
+            item_fields = _item_fields(fields, "permissions")
+            response = {'permissions': [_select(p, item_fields) for p in permissions[start:start + pageSize]]}
+            if start + pageSize < len(permissions):
+                response['nextPageToken'] = str(start + pageSize)
+            return response
+        return FakeRequest(self, "permissions.list", run)
+
+    def _permissions_delete(self, fileId: str, permissionId: str, **kwargs) -> FakeRequest:
+        def run():
+            self._get_item(fileId, kwargs)
+            if permissionId not in self.acls[fileId]:
+                raise FakeDrive.http_error(404, "notFound")
+            del self.acls[fileId][permissionId]
+            return ""
+        return FakeRequest(self, "permissions.delete", run)
+
+    # changes()
+
+    def changes(self):
+        return _Resource(getStartPageToken=self._changes_start_page_token, list=self._changes_list)
+
+    def _changes_start_page_token(self, **kwargs) -> FakeRequest:
+        return FakeRequest(self, "changes.getStartPageToken", lambda: {'startPageToken': str(len(self.change_log))})
+
+    def _changes_list(self, pageToken: str, fields: str = None, pageSize: int = 100, **kwargs) -> FakeRequest:
+        def run():
+            start = int(pageToken)
+            page = self.change_log[start:start + pageSize]
+            # Changes to a shared drive are listed with its driveId, the others without one.
+            drive_id = kwargs.get('driveId')
+            page = [c for c in page if self.items.get(c['fileId'], {}).get('driveId') == drive_id]
+            file_fields = None
+            if fields is not None:
+                match = re.search(r"file\(([^)]*)\)", fields)
+                file_fields = match.group(1) if match else None
+            changes = []
+            for change in page:
+                change = dict(change)
+                if change['fileId'] in self.items:
+                    change['file'] = _select(self.items[change['fileId']], file_fields)
+                changes.append(change)
+            response = {'changes': changes}
+            if start + pageSize < len(self.change_log):
+                response['nextPageToken'] = str(start + pageSize)
+            else:
+                response['newStartPageToken'] = str(len(self.change_log))
+            return response
+        return FakeRequest(self, "changes.list", run)
+
+    def new_batch_http_request(self, callback: Callable = None) -> FakeBatch:
+        return FakeBatch(self)
+
+    # Inspection helpers.
+
+    def children_of(self, folder_id: str, folders_only: bool = False) -> List:
+        children = [self.items[c] for c in self.children.get(folder_id, {}) if not self.items[c]['trashed']]
+        if folders_only:
+            children = [c for c in children if c['mimeType'] == FakeDrive.folder_mimetype]
+        return children
+
+    def storage_used(self) -> int:
+        # Bytes of every file in the drive, copies count again and moves don't.
+        return sum(int(item.get('size', 0)) for item in self.items.values() if not item['trashed'])
+
+    def count(self, folder_id: str) -> Counter:
+        # Number of folders and files under folder_id.
+        counts = Counter()
+        stack = [folder_id]
+        while len(stack) > 0:
+            for child in self.children_of(stack.pop()):
+                if child['mimeType'] == FakeDrive.folder_mimetype:
+                    counts['folders'] += 1
+                    stack.append(child['id'])
+                else:
+                    counts['files'] += 1
+        return counts
@@ -0,0 +1,85 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.acl import diff_acls, naive_calls, uploaders
+from gdrive_sharing_manager.throttle import RequestGovernor
+from tests.benchmark import _reset
+from tests.fake_drive import FakeDrive
+import unittest
+
+
+def _permission(email: str, role: str = "writer", inherited: bool = None) -> dict:
+    permission = {'id': f"p-{email}", 'type': "user", 'role': role, 'emailAddress': email}
+    if inherited is not None:
+        permission['permissionDetails'] = [{'inherited': inherited}]
+    return permission
+
+
+class TestDiffAcls(unittest.TestCase):
+
+    def test_grants_missing_writers(self):
+        plan = diff_acls({'a': {"fan@example.com"}, 'b': {"Other@Example.com"}},
+                         {'a': [], 'b': [_permission("other@example.com")]})
+        self.assertEqual(plan.grants, [('a', "fan@example.com")])
+        self.assertEqual(plan.unchanged, 1)
+        self.assertEqual(plan.revocations, [])
+
+    def test_higher_roles_count_as_access(self):
+        plan = diff_acls({'a': {"fan@example.com"}}, {'a': [_permission("fan@example.com", "fileOrganizer")]})
+        self.assertEqual(len(plan), 0)
+
+    def test_readers_are_upgraded(self):
+        plan = diff_acls({'a': {"fan@example.com"}}, {'a': [_permission("fan@example.com", "reader")]})
+        self.assertEqual(plan.grants, [('a', "fan@example.com")])
+
+    def test_revokes_only_removable_writers(self):
+        current = {'a': [_permission("fan@example.com"), _permission("gone@example.com"),
+                         _permission("organiser@example.com"), _permission("owner@example.com", "owner"),
+                         _permission("drive@example.com", inherited=True)]}
+        plan = diff_acls({'a': {"fan@example.com"}}, current, keep={"Organiser@example.com"})
+        self.assertEqual([p['emailAddress'] for _, p in plan.revocations], ["gone@example.com"])
+        self.assertEqual(plan.grants, [])
+
+    def test_uploaders(self):
+        permissions = [_permission("Organiser@example.com"), _permission("reader@example.com", "reader"),
+                       _permission("owner@example.com", "owner"), {'id': "anyone", 'type': "anyone", 'role': "writer"}]
+        self.assertEqual(uploaders(permissions), {"organiser@example.com", "owner@example.com"})
+
+    def test_naive_calls(self):
+        self.assertEqual(naive_calls({'a': {"x", "y"}, 'b': {"z"}}), 3)
+
+
+class TestApplyAclPlan(unittest.TestCase):
+    """Reading and reconciling permissions in batch requests against the fake Drive."""
+
+    def setUp(self):
+        self.drive = FakeDrive(latency=0)
+        _reset(self.drive)
+        ArgParser._governor = RequestGovernor(sleep=lambda s: None)
+        self.folders = [self.drive.add_folder(name=f"fan{i}@example.com") for i in range(3)]
+
+    def test_reconcile(self):
+        ArgParser._share_folder_with_user(self.folders[0], "fan0@example.com")
+        ArgParser._share_folder_with_user(self.folders[1], "stale@example.com")
+        self.drive.emails_sent = 0
+        desired = {folder_id: {f"fan{i}@example.com"} for i, folder_id in enumerate(self.folders)}
+        current = ArgParser._list_permissions(self.folders)
+        self.assertEqual(self.drive.round_trips, 3)
+
+        plan = diff_acls(desired, current)
+        self.assertEqual(len(plan.grants), 2)
+        self.assertEqual(len(plan.revocations), 1)
+        self.assertEqual(ArgParser._apply_acl_plan(plan, notify=False), 0)
+        self.assertEqual(self.drive.emails_sent, 0)
+
+        plan = diff_acls(desired, ArgParser._list_permissions(self.folders))
+        self.assertEqual(len(plan), 0)
+        self.assertEqual(plan.unchanged, 3)
+
+    def test_failed_changes_are_counted(self):
+        plan = diff_acls({folder_id: {"fan@example.com"} for folder_id in self.folders},
+                         ArgParser._list_permissions(self.folders))
+        self.drive.inject_errors(status=404, reason="notFound", endpoint="permissions.create")
+        self.assertEqual(ArgParser._apply_acl_plan(plan), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+from tests.benchmark import run, check, THRESHOLDS
+import unittest
+
+
+class TestBenchmark(unittest.TestCase):
+    """The request thresholds of the benchmark, run at sizes small enough for the test suite."""
+
+    def test_thresholds(self):
+        for nodes in (1000, 10000):
+            results = run(nodes, latency=0, memory=False)
+            self.assertEqual([r['scenario'] for r in results], list(THRESHOLDS.keys()))
+            self.assertEqual(check(results), [])
+
+    def test_check_reports_regressions(self):
+        result = {'scenario': "crawl", 'nodes': 1000, 'round_trips': 14, 'calls': 12}
+        failures = check([result])
+        self.assertEqual(len(failures), 1)
+        self.assertIn("14 round_trips", failures[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.cache import MetadataCache
+from gdrive_sharing_manager.checkpoint import MergeCheckpoints
+from gdrive_sharing_manager.filters import FolderFilter
+from gdrive_sharing_manager.throttle import RequestGovernor
+from gdrive_sharing_manager.merge.merge import Merge
+from tests.benchmark import _reset, build_library
+from tests.fake_drive import FakeDrive
+from argparse import Namespace
+from pathlib import Path
+import tempfile
+import unittest
+
+
+def _names(tree) -> list:
+    # Relative paths of every folder and file of a crawled tree.
+    names = []
+    stack = [((), tree)]
+    while len(stack) > 0:
+        path, node = stack.pop()
+        names.extend("/".join(path + (f['name'],)) for f in node.get('child_files', []))
+        for child in node.get('child_folders', []):
+            names.append("/".join(path + (child['folder_name'],)))
+            stack.append((path + (child['folder_name'],), child))
+    return sorted(names)
+
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.drive = FakeDrive(latency=0)
+        _reset(self.drive)
+        ArgParser._governor = RequestGovernor(sleep=lambda s: None)
+        ArgParser._cache = MetadataCache(Path(self.tmp.name).joinpath("cache.sqlite"))
+        self.library = build_library(self.drive, 300)
+
+    def tearDown(self):
+        ArgParser._cache.close()
+        ArgParser._cache = None
+        self.tmp.cleanup()
+
+    def _crawl(self, folder_id: str, name: str, **kwargs):
+        return ArgParser._get_files_folders_dict([{'id': folder_id, 'name': name}], crawl="auto", **kwargs)
+
+    def test_same_tree_as_crawl(self):
+        cached = self._crawl(self.library, "Library")
+        self.assertEqual(_names(cached), _names(self._crawl(self.library, "Library", use_cache=False)))
+        self.assertEqual(ArgParser._cache.hits, 0)
+
+        self.drive.calls.clear()
+        again = self._crawl(self.library, "Library")
+        self.assertEqual(_names(again), _names(cached))
+        self.assertEqual(ArgParser._cache.misses, ArgParser._cache.hits)
+        # Only the folders are listed again.
+        self.assertEqual(self.drive.calls['files.list'], 1)
+
+    def test_explicit_crawl(self):
+        cached = self._crawl(self.library, "Library")
+        used = (ArgParser._cache.hits, ArgParser._cache.misses)
+        self.drive.calls.clear()
+        crawled = ArgParser._get_files_folders_dict([{'id': self.library, 'name': "Library"}], crawl="level")
+        self.assertEqual(_names(crawled), _names(cached))
+        self.assertEqual((ArgParser._cache.hits, ArgParser._cache.misses), used)
+        # Each level of folders is listed with their files, the cached crawl would only list the folders.
+        self.assertGreater(self.drive.calls['files.list'], 1)
+
+    def test_folder_filter(self):
+        # The cache would list every folder, so only the kept folders are listed without it.
+        crawled = self._crawl(self.library, "Library", folder_filter=FolderFilter(max_depth=1))
+        self.assertTrue(all("/" not in name for name in _names(crawled)))
+        self.assertEqual(ArgParser._cache.hits + ArgParser._cache.misses, 0)
+        self.assertEqual(ArgParser._cache._db.execute("SELECT COUNT(*) FROM items").fetchone()[0], 0)
+
+    def test_new_folders_are_found(self):
+        self._crawl(self.library, "Library")
+        year = self.drive.children_of(self.library, folders_only=True)[0]
+        self.drive.add_folder(name="New", parent_id=year['id'])
+        self.assertIn(f"{year['name']}/New", _names(self._crawl(self.library, "Library")))
+
+    def test_refresh_lists_new_files(self):
+        self._crawl(self.library, "Library")
+        year = self.drive.children_of(self.library, folders_only=True)[0]
+        self.drive.add_file("new.jpg", year['id'])
+        # The folder's modifiedTime didn't change, so the cached listing is used.
+        self.assertNotIn(f"{year['name']}/new.jpg", _names(self._crawl(self.library, "Library")))
+        ArgParser._cache.refresh = True
+        self.assertIn(f"{year['name']}/new.jpg", _names(self._crawl(self.library, "Library")))
+
+    def test_merge_lists_uploads_in_full(self):
+        uploads = self.drive.add_folder(name="fan")
+        show = self.drive.add_folder(name="Show", parent_id=uploads)
+        self.drive.add_file("first.jpg", show)
+        args = Namespace(incremental=False, crawl="level", crawl_batch=50)
+        checkpoints = MergeCheckpoints(Path(self.tmp.name).joinpath("merge_state.json"))
+        folder = {'id': uploads, 'name': "fan"}
+        library = {'id': self.library, 'name': "Library"}
+
+        _, uploaded, _ = Merge._crawl_trees(args, "fan", folder, library, {}, checkpoints)
+        self.assertEqual(_names(uploaded), ["Show", "Show/first.jpg"])
+        self.drive.add_file("second.jpg", show)
+        _, uploaded, _ = Merge._crawl_trees(args, "fan", folder, library, {}, checkpoints)
+        self.assertEqual(_names(uploaded), ["Show", "Show/first.jpg", "Show/second.jpg"])
+
+
+class TestPathCache(unittest.TestCase):
+    """Folders found by name are checked before a later run uses them."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.drive = FakeDrive(latency=0)
+        _reset(self.drive)
+        self.concerts = self.drive.add_folder(name="Concerts")
+        self.year = self.drive.add_folder(name="2026", parent_id=self.concerts)
+        self.uploads = self.drive.add_folder(name="Uploads", parent_id=self.year)
+
+    def tearDown(self):
+        ArgParser._cache.close()
+        ArgParser._cache = None
+        self.tmp.cleanup()
+
+    def _find(self, path: str) -> dict:
+        # Like a new run, which only has the metadata cache.
+        if ArgParser._cache is not None:
+            ArgParser._cache.close()
+        _reset(self.drive)
+        ArgParser._governor = RequestGovernor(sleep=lambda s: None)
+        ArgParser._cache = MetadataCache(Path(self.tmp.name).joinpath("cache.sqlite"))
+        return ArgParser._get_folder_by_path(path)
+
+    def test_only_the_last_folder_is_checked(self):
+        self.assertEqual(self._find("Concerts/2026/Uploads")['id'], self.uploads)
+        self.assertEqual(self.drive.calls['files.list'], 3)
+        self.assertEqual(self._find("Concerts/2026/Uploads")['id'], self.uploads)
+        self.assertEqual(self.drive.calls['files.list'], 0)
+        self.assertEqual(self.drive.calls['files.get'], 1)
+        self.assertEqual(ArgParser._cache.path_hits, 3)
+
+    def test_folder_under_my_drive(self):
+        self._find("Concerts")
+        self.assertEqual(self._find("Concerts")['id'], self.concerts)
+        self.assertEqual(self.drive.calls['files.get'], 1)
+
+    def test_renamed_folder(self):
+        self._find("Concerts/2026/Uploads")
+        self.drive.files().update(fileId=self.uploads, body={'name': "Old uploads"}).execute()
+        new = self.drive.add_folder(name="Uploads", parent_id=self.year)
+        self.assertEqual(self._find("Concerts/2026/Uploads")['id'], new)
+        self.assertEqual(self.drive.calls['files.list'], 1)
+        self.assertEqual(self._find("Concerts/2026/Uploads")['id'], new)
+
+    def test_trashed_folder(self):
+        self._find("Concerts/2026/Uploads")
+        self.drive.files().update(fileId=self.uploads, body={'trashed': True}).execute()
+        self.assertIsNone(self._find("Concerts/2026/Uploads"))
+
+    def test_deleted_folder(self):
+        self._find("Concerts/2026/Uploads")
+        del self.drive.items[self.uploads]
+        self.drive.children[self.year].pop(self.uploads)
+        self.assertIsNone(self._find("Concerts/2026/Uploads"))
+
+    def test_renamed_folder_on_the_way(self):
+        self._find("Concerts/2026/Uploads")
+        self.drive.files().update(fileId=self.year, body={'name': "2025"}).execute()
+        year = self.drive.add_folder(name="2026", parent_id=self.concerts)
+        other = self.drive.add_folder(name="Other", parent_id=year)
+        # Only the last folder is checked, so the cached path still leads to the renamed folder...
+        self.assertEqual(self._find("Concerts/2026/Uploads")['id'], self.uploads)
+        # ...until a lookup through it fails and every folder of the path is checked.
+        self.assertEqual(self._find("Concerts/2026/Other")['id'], other)
+        uploads = self.drive.add_folder(name="Uploads", parent_id=year)
+        self.assertEqual(self._find("Concerts/2026/Uploads")['id'], uploads)
+
+
+if __name__ == '__main__':
+    unittest.main()
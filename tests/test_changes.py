@@ -0,0 +1,99 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.diff import diff_trees
+from gdrive_sharing_manager.tree import FolderNode, FileNode
+from gdrive_sharing_manager.throttle import RequestGovernor
+from tests.benchmark import _reset
+from tests.fake_drive import FakeDrive
+import unittest
+
+
+class TestChangedFiles(unittest.TestCase):
+    """The incremental merge's tree of changed files, built from the changes feed."""
+
+    def setUp(self):
+        self.drive = FakeDrive(latency=0)
+        _reset(self.drive)
+        ArgParser._governor = RequestGovernor(sleep=lambda s: None)
+        self.uploads = self.drive.add_folder(name="fan")
+        self.year = self.drive.add_folder(name="2026", parent_id=self.uploads)
+        self.drive.add_file("old.jpg", self.year)
+        self.elsewhere = self.drive.add_folder(name="Elsewhere")
+        self.token = ArgParser._get_start_page_token()
+
+    def test_only_changes_under_root(self):
+        show = self.drive.add_folder(name="Show", parent_id=self.year)
+        self.drive.add_file("new.jpg", show)
+        self.drive.add_file("top.jpg", self.uploads)
+        self.drive.add_file("other.jpg", self.elsewhere)
+        tree, token = ArgParser._get_changed_files_dict({'id': self.uploads, 'name': "fan"}, self.token)
+
+        self.assertEqual([f['name'] for f in tree['child_files']], ["top.jpg"])
+        year = tree['child_folders'][0]
+        self.assertEqual(year['folder_name'], "2026")
+        self.assertNotIn('child_files', year)
+        self.assertEqual([f['name'] for f in year['child_folders'][0]['child_files']], ["new.jpg"])
+        self.assertEqual(token, str(len(self.drive.change_log)))
+
+    def test_folders_are_listed_once(self):
+        show = self.drive.add_folder(name="Show", parent_id=self.year)
+        for i in range(20):
+            self.drive.add_file(f"new_{i}.jpg", show)
+        self.drive.calls.clear()
+        tree, _ = ArgParser._get_changed_files_dict({'id': self.uploads, 'name': "fan"}, self.token)
+
+        self.assertEqual(len(tree['child_folders'][0]['child_folders'][0]['child_files']), 20)
+        # One folders listing per level of the uploads folder, and no lookups of single folders.
+        self.assertEqual(self.drive.calls['files.list'], 3)
+        self.assertEqual(self.drive.calls['files.get'], 0)
+
+    def test_changes_elsewhere_are_cheap(self):
+        # The copies of the last merge are in the changes feed too.
+        library = self.drive.add_folder(name="Library")
+        for i in range(20):
+            folder = self.drive.add_folder(name=f"{i}", parent_id=library)
+            for j in range(10):
+                self.drive.add_file(f"copy_{i}_{j}.jpg", folder)
+        self.drive.add_file("new.jpg", self.year)
+        self.drive.calls.clear()
+        tree, _ = ArgParser._get_changed_files_dict({'id': self.uploads, 'name': "fan"}, self.token)
+
+        self.assertEqual([f['name'] for f in tree['child_folders'][0]['child_files']], ["new.jpg"])
+        self.assertEqual(self.drive.calls['files.get'], 0)
+        self.assertEqual(self.drive.calls['files.list'], 2)
+
+    def test_no_changes(self):
+        tree, token = ArgParser._get_changed_files_dict({'id': self.uploads, 'name': "fan"}, self.token)
+        self.assertEqual(dict(tree), {'folder_name': "fan", 'folder_id': self.uploads, 'parent_name': "fan"})
+        self.assertEqual(token, self.token)
+
+
+class TestMatchingFolders(unittest.TestCase):
+    """The library folders an incremental merge needs, found by the names of the changed folders."""
+
+    def setUp(self):
+        self.drive = FakeDrive(latency=0)
+        _reset(self.drive)
+        ArgParser._governor = RequestGovernor(sleep=lambda s: None)
+        self.library = self.drive.add_folder(name="Library")
+        self.cafe = self.drive.add_folder(name="Caf\u00e9", parent_id=self.library)
+        self.day = self.drive.add_folder(name="Day 1", parent_id=self.cafe)
+        self.drive.add_folder(name="Other", parent_id=self.library)
+
+    def test_names_are_normalized(self):
+        # A decomposed e with an acute accent and trailing whitespace.
+        uploaded = FolderNode("fan", "uploads")
+        cafe = FolderNode("Cafe\u0301 ", "cafe", "fan")
+        day = FolderNode("Day 1", "day", cafe['folder_name'])
+        day['child_files'] = [FileNode({'id': "f", 'name': "a.jpg", 'mimeType': "image/jpeg"})]
+        cafe['child_folders'] = [day]
+        uploaded['child_folders'] = [cafe]
+
+        matching = ArgParser._get_matching_folders_dict({'id': self.library, 'name': "Library"}, uploaded)
+        self.assertEqual([f['folder_id'] for f in matching['child_folders']], [self.cafe])
+        self.assertEqual(matching['child_folders'][0]['child_folders'][0]['folder_id'], self.day)
+        plan, _ = diff_trees(matching, uploaded)
+        self.assertEqual(plan.folders, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
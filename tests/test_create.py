@@ -0,0 +1,50 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.throttle import RequestGovernor
+from gdrive_sharing_manager.create.create import Create
+from tests.benchmark import _reset
+from tests.fake_drive import FakeDrive
+import unittest
+
+
+class TestCreateByLevel(unittest.TestCase):
+    """The folder skeleton created level by level in batch requests."""
+
+    def setUp(self):
+        self.drive = FakeDrive(latency=0)
+        _reset(self.drive)
+        ArgParser._governor = RequestGovernor(max_retries=0, sleep=lambda s: None)
+        self.library = self.drive.add_folder(name="Library")
+        for i in range(2):
+            year = self.drive.add_folder(name=f"{i}", parent_id=self.library)
+            for j in range(2):
+                self.drive.add_folder(name=f"{i}-{j}", parent_id=year)
+        self.skeleton = ArgParser._get_files_folders_dict([{'id': self.library, 'name': "Library"}],
+                                                          include_files=False)
+        self.uploads = self.drive.add_folder(name="Uploads")
+
+    def test_create(self):
+        self.assertEqual(ArgParser._duplicate_folder_structure_by_level(self.uploads, self.skeleton['child_folders']),
+                         0)
+        self.assertEqual(self.drive.count(self.uploads)['folders'], 6)
+        # One batch per level.
+        self.assertEqual(self.drive.calls['batch'], 2)
+
+    def test_failed_folders_are_counted(self):
+        self.drive.inject_errors(status=500, reason="backendError", endpoint="files.create")
+        missing = ArgParser._duplicate_folder_structure_by_level(self.uploads, self.skeleton['child_folders'])
+        # The failed folder and its two subfolders.
+        self.assertEqual(missing, 3)
+        self.assertEqual(self.drive.count(self.uploads)['folders'], 3)
+
+    def test_failed_folders_fail_the_user(self):
+        self.assertEqual(Create._create_for_user("fan@example.com", {'id': self.uploads}, self.skeleton, "level"),
+                         "ok")
+        self.drive.inject_errors(status=500, reason="backendError", endpoint="files.create", after=2)
+        status = Create._create_for_user("other@example.com", {'id': self.uploads}, self.skeleton, "level")
+        self.assertEqual(status, "3 folders failed")
+        shared = [f['name'] for f in self.drive.children_of(self.uploads) if len(self.drive.acls[f['id']]) > 0]
+        self.assertEqual(shared, ["fan@example.com"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+from gdrive_sharing_manager.diff import diff_trees, index_tree, plan_from_dict, plan_to_dict, _plan_folder, \
+    MergePlan
+import time
+import unittest
+
+
+def _folder(name: str, folder_id: str = None, files: list = (), folders: list = ()) -> dict:
+    return {'folder_name': name, 'folder_id': folder_id or name,
+            'child_files': [{'id': f, 'name': f, 'mimeType': "image/jpeg"} for f in files],
+            'child_folders': list(folders)}
+
+
+def _copies(plan: MergePlan) -> list:
+    return sorted((f['name'], path) for f, path in plan.copies)
+
+
+class TestIndexTree(unittest.TestCase):
+
+    def test_paths(self):
+        root = _folder("Library", folders=[_folder("2026", folders=[_folder("Spring")]), _folder("2025")])
+        index = index_tree(root)
+        self.assertEqual(set(index), {(), ("2026",), ("2026", "Spring"), ("2025",)})
+        self.assertIs(index[()], root)
+        self.assertEqual(index[("2026", "Spring")]['folder_name'], "Spring")
+
+    def test_names_are_normalized(self):
+        # A decomposed e with an acute accent and trailing whitespace.
+        index = index_tree(_folder("Library", folders=[_folder("Cafe\u0301 ", "cafe")]))
+        self.assertEqual(index[("Caf\u00e9",)]['folder_id'], "cafe")
+
+    def test_first_duplicate_wins(self):
+        index = index_tree(_folder("Library", folders=[_folder("2026", "first", folders=[_folder("A")]),
+                                                       _folder("2026", "second", folders=[_folder("B")])]))
+        self.assertEqual(index[("2026",)]['folder_id'], "first")
+        # The subfolders of the second folder are not reachable by path.
+        self.assertIn(("2026", "A"), index)
+        self.assertNotIn(("2026", "B"), index)
+
+
+class TestPlanFolder(unittest.TestCase):
+
+    def test_missing_ancestors_come_first(self):
+        plan = MergePlan()
+        planned = set()
+        _plan_folder(plan, ("a", "b", "c"), ("A", "B", "C"), index_tree(_folder("Library", folders=[_folder("a")])),
+                     planned)
+        self.assertEqual(plan.folders, [(("a", "b"), ("a",), "B"), (("a", "b", "c"), ("a", "b"), "C")])
+        self.assertEqual(planned, {("a", "b"), ("a", "b", "c")})
+
+    def test_planned_folders_are_not_planned_again(self):
+        plan = MergePlan()
+        planned = set()
+        orig_index = index_tree(_folder("Library"))
+        _plan_folder(plan, ("a", "b"), ("a", "b"), orig_index, planned)
+        _plan_folder(plan, ("a", "c"), ("a", "c"), orig_index, planned)
+        _plan_folder(plan, ("a", "b"), ("a", "b"), orig_index, planned)
+        self.assertEqual([path for path, _, _ in plan.folders], [("a",), ("a", "b"), ("a", "c")])
+
+    def test_existing_folder(self):
+        plan = MergePlan()
+        _plan_folder(plan, ("a",), ("a",), index_tree(_folder("Library", folders=[_folder("a")])), set())
+        self.assertEqual(plan.folders, [])
+
+
+class TestDiffTrees(unittest.TestCase):
+
+    def test_missing_ancestors(self):
+        orig = _folder("Library", folders=[_folder("2026")])
+        new_ = _folder("fan", files=["top.jpg"], folders=[
+            _folder("2026", files=["a.jpg"], folders=[_folder("Spring", folders=[_folder("Day 1", files=["b.jpg"])])])])
+        plan, _ = diff_trees(orig, new_)
+        self.assertEqual(plan.folders, [(("2026", "Spring"), ("2026",), "Spring"),
+                                        (("2026", "Spring", "Day 1"), ("2026", "Spring"), "Day 1")])
+        self.assertEqual(_copies(plan), [("a.jpg", ("2026",)), ("b.jpg", ("2026", "Spring", "Day 1")),
+                                         ("top.jpg", ())])
+
+    def test_normalized_names_match(self):
+        orig = _folder("Library", folders=[_folder("Caf\u00e9", "cafe")])
+        new_ = _folder("fan", folders=[_folder("Cafe\u0301 ", files=["a.jpg"])])
+        plan, orig_index = diff_trees(orig, new_)
+        self.assertEqual(plan.folders, [])
+        self.assertEqual(plan_to_dict(plan, orig_index)['copies'][0]['dest_id'], "cafe")
+
+    def test_new_folders_keep_their_names(self):
+        # Created folders are named as uploaded, only their paths are normalized.
+        plan, _ = diff_trees(_folder("Library"), _folder("fan", folders=[_folder("Cafe\u0301", files=["a.jpg"])]))
+        self.assertEqual(plan.folders, [(("Caf\u00e9",), (), "Cafe\u0301")])
+
+    def test_duplicate_names(self):
+        # Uploaded folders with the same path are merged into one, and files go to the first destination folder.
+        orig = _folder("Library", folders=[_folder("2026", "first"), _folder("2026", "second")])
+        new_ = _folder("fan", folders=[_folder("2026", files=["a.jpg"]), _folder("2026", files=["b.jpg"]),
+                                       _folder("New", files=["c.jpg"]), _folder("New", files=["d.jpg"])])
+        plan, orig_index = diff_trees(orig, new_)
+        self.assertEqual(plan.folders, [(("New",), (), "New")])
+        self.assertEqual(_copies(plan), [("a.jpg", ("2026",)), ("b.jpg", ("2026",)), ("c.jpg", ("New",)),
+                                         ("d.jpg", ("New",))])
+        self.assertEqual({c['dest_id'] for c in plan_to_dict(plan, orig_index)['copies']}, {"first", None})
+
+    def test_empty_folder_subtrees(self):
+        new_ = _folder("fan", folders=[_folder("Empty", folders=[_folder("Also empty", folders=[_folder("Deep")])]),
+                                       _folder("Full", folders=[_folder("Empty")])])
+        plan, _ = diff_trees(_folder("Library"), new_)
+        self.assertEqual(len(plan), 0)
+
+    def test_folders_are_skipped(self):
+        new_ = _folder("fan")
+        new_['child_files'].append({'id': "f", 'name': "f", 'mimeType': "application/vnd.google-apps.folder"})
+        self.assertEqual(len(diff_trees(_folder("Library"), new_)[0]), 0)
+
+    def test_reused_index(self):
+        orig = _folder("Library", folders=[_folder("2026")])
+        _, orig_index = diff_trees(orig, _folder("fan"))
+        plan, again = diff_trees(orig, _folder("other", folders=[_folder("2026", files=["a.jpg"])]), orig_index)
+        self.assertIs(again, orig_index)
+        self.assertEqual(_copies(plan), [("a.jpg", ("2026",))])
+
+    def test_plan_round_trip(self):
+        orig = _folder("Library", folders=[_folder("2026", "year")])
+        new_ = _folder("fan", folders=[_folder("2026", files=["a.jpg"], folders=[_folder("New", files=["b.jpg"])])])
+        plan, orig_index = diff_trees(orig, new_)
+        read, read_index = plan_from_dict(plan_to_dict(plan, orig_index))
+        self.assertEqual(read.folders, plan.folders)
+        self.assertEqual(_copies(read), _copies(plan))
+        self.assertEqual(read_index[("2026",)]['folder_id'], "year")
+
+    def test_large_tree(self):
+        # 100 folders of 10 subfolders of 100 files each, half of the subfolders missing from the destination.
+        orig = _folder("Library", folders=[
+            _folder(f"{i}", folders=[_folder(f"{i}-{j}") for j in range(0, 10, 2)]) for i in range(100)])
+        new_ = _folder("fan", folders=[
+            _folder(f"{i}", folders=[_folder(f"{i}-{j}", files=[f"{i}-{j}-{k}.jpg" for k in range(100)])
+                                     for j in range(10)]) for i in range(100)])
+        start = time.perf_counter()
+        plan, _ = diff_trees(orig, new_)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(plan.folders), 500)
+        self.assertEqual(len(plan.copies), 100000)
+        self.assertLess(elapsed, 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+from googleapiclient.errors import HttpError
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.executor import DriveExecutor
+from gdrive_sharing_manager.throttle import RequestGovernor
+from gdrive_sharing_manager.create.create import Create
+from tests.benchmark import _reset
+from tests.fake_drive import FakeDrive
+import unittest
+
+
+class TestDriveExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.drive = FakeDrive(latency=0)
+        _reset(self.drive)
+        ArgParser._governor = RequestGovernor(max_retries=0, sleep=lambda s: None)
+        ArgParser._executor = DriveExecutor(lambda: self.drive, 2)
+        self.library = self.drive.add_folder(name="Library")
+        for i in range(2):
+            year = self.drive.add_folder(name=f"{i}", parent_id=self.library)
+            for j in range(2):
+                self.drive.add_folder(name=f"{i}-{j}", parent_id=year)
+        self.skeleton = ArgParser._get_files_folders_dict([{'id': self.library, 'name': "Library"}],
+                                                          include_files=False)
+        self.uploads = self.drive.add_folder(name="Uploads")
+
+    def tearDown(self):
+        ArgParser._executor.shutdown()
+        ArgParser._executor = None
+
+    def test_wait_returns_failures(self):
+        ArgParser._executor.submit(ArgParser._create_folder, self.uploads, "ok")
+        ArgParser._executor.submit(ArgParser._create_folder, "missing", "not ok")
+        failures = ArgParser._executor.wait()
+        self.assertEqual(len(failures), 1)
+        self.assertIsInstance(failures[0], HttpError)
+        self.assertEqual(ArgParser._executor.wait(), [])
+
+    def test_create_tree(self):
+        ArgParser._duplicate_folder_structure(self.uploads, self.skeleton['child_folders'])
+        self.assertEqual(self.drive.count(self.uploads)['folders'], 6)
+
+    def test_failed_create_fails_the_user(self):
+        # The first folder created is the user's own, the second one of its subfolders.
+        self.drive.inject_errors(status=500, reason="backendError", endpoint="files.create", after=1)
+        with self.assertRaises(HttpError):
+            Create._create_for_user("fan@example.com", {'id': self.uploads}, self.skeleton, "recursive")
+        user_folder = self.drive.children_of(self.uploads)[0]
+        self.assertLess(self.drive.count(user_folder['id'])['folders'], 6)
+        # The incomplete folder is not shared.
+        self.assertEqual(self.drive.acls[user_folder['id']], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
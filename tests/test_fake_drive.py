@@ -0,0 +1,67 @@
+from googleapiclient.errors import HttpError
+from tests.fake_drive import FakeDrive
+import unittest
+
+
+class TestFakeDrive(unittest.TestCase):
+
+    def setUp(self):
+        self.drive = FakeDrive(latency=0)
+        self.folder = self.drive.add_folder(name="Folder")
+        self.sub = self.drive.add_folder(name="Sub", parent_id=self.folder)
+        self.files = [self.drive.add_file(f"IMG_{i}.jpg", self.folder, size=i) for i in range(5)]
+
+    def _list(self, q, **kwargs):
+        return self.drive.files().list(q=q, **kwargs).execute()
+
+    def test_query(self):
+        folder_type = FakeDrive.folder_mimetype
+        response = self._list(f"'{self.folder}' in parents and mimeType='{folder_type}' and trashed=false")
+        self.assertEqual([f['id'] for f in response['files']], [self.sub])
+        response = self._list(f"'{self.folder}' in parents and not mimeType='{folder_type}' and "
+                              f"(name = 'IMG_1.jpg' or name contains '_3')", fields="files(id, name, size)")
+        self.assertEqual(sorted(f['name'] for f in response['files']), ["IMG_1.jpg", "IMG_3.jpg"])
+        self.assertEqual(set(response['files'][0].keys()), {'id', 'name', 'size'})
+
+    def test_pagination(self):
+        names = []
+        page_token = None
+        while True:
+            response = self._list(f"'{self.folder}' in parents", pageSize=2, pageToken=page_token,
+                                  fields="nextPageToken, files(name)")
+            names.extend(f['name'] for f in response['files'])
+            page_token = response.get('nextPageToken')
+            if page_token is None:
+                break
+        self.assertEqual(len(names), 6)
+        self.assertEqual(self.drive.round_trips, 3)
+
+    def test_batch_is_one_round_trip(self):
+        responses = []
+        batch = self.drive.new_batch_http_request()
+        for file_id in self.files:
+            batch.add(self.drive.files().copy(fileId=file_id, body={'parents': [self.sub]}),
+                      callback=lambda request_id, response, exception: responses.append((response, exception)))
+        batch.execute()
+        self.assertEqual(len(responses), 5)
+        self.assertTrue(all(exception is None for _, exception in responses))
+        self.assertEqual(self.drive.round_trips, 1)
+        self.assertEqual(self.drive.calls['files.copy'], 5)
+        self.assertEqual(self.drive.count(self.sub)['files'], 5)
+
+    def test_injected_errors(self):
+        self.drive.inject_errors(status=403, reason="userRateLimitExceeded", endpoint="files.get")
+        with self.assertRaises(HttpError) as raised:
+            self.drive.files().get(fileId=self.folder).execute()
+        self.assertEqual(raised.exception.resp.status, 403)
+        self.assertEqual(self.drive.files().get(fileId=self.folder).execute()['id'], self.folder)
+
+    def test_folder_modified_time_is_kept(self):
+        # Like Drive, adding a file to a folder doesn't change the folder's modifiedTime.
+        before = self.drive.items[self.folder]['modifiedTime']
+        self.drive.add_file("new.jpg", self.folder)
+        self.assertEqual(self.drive.items[self.folder]['modifiedTime'], before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.filters import FileFilter, parse_time, parse_size
+from gdrive_sharing_manager.throttle import RequestGovernor
+from tests.benchmark import _reset
+from tests.fake_drive import FakeDrive
+import unittest
+
+
+def _files(tree) -> list:
+    names = []
+    stack = [tree]
+    while len(stack) > 0:
+        node = stack.pop()
+        names.extend(f['name'] for f in node.get('child_files', []))
+        stack.extend(node.get('child_folders', []))
+    return sorted(names)
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time("2026-10-01T18:00:00+02:00"), "2026-10-01T16:00:00")
+        self.assertEqual(parse_time("2026-10-01T18:00:00Z"), "2026-10-01T18:00:00")
+        with self.assertRaises(ValueError):
+            parse_time("yesterday")
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("1500"), 1500)
+        self.assertEqual(parse_size("2K"), 2048)
+        self.assertEqual(parse_size("1.5MB"), 1572864)
+        self.assertEqual(parse_size("1g"), 1024 ** 3)
+
+
+class TestFileFilter(unittest.TestCase):
+
+    def test_query(self):
+        file_filter = FileFilter("2026-10-01T00:00:00", ["image/*", "video/mp4"])
+        self.assertEqual(file_filter.query(),
+                         "(modifiedTime > '2026-10-01T00:00:00' or createdTime > '2026-10-01T00:00:00') and "
+                         "(mimeType contains 'image/' or mimeType = 'video/mp4')")
+        self.assertIsNone(FileFilter(min_size=10).query())
+
+    def test_matches(self):
+        file_filter = FileFilter("2026-10-01T00:00:00", ["image/*"], min_size=100)
+        new = {'mimeType': "image/jpeg", 'size': "200", 'modifiedTime': "2026-10-02T00:00:00.000Z"}
+        self.assertTrue(file_filter.matches(new))
+        self.assertFalse(file_filter.matches(dict(new, size="50")))
+        self.assertFalse(file_filter.matches(dict(new, mimeType="application/pdf")))
+        self.assertFalse(file_filter.matches(dict(new, modifiedTime="2026-09-30T00:00:00.000Z")))
+        # Uploads keep the modifiedTime of the original, the createdTime tells when they were uploaded.
+        self.assertTrue(file_filter.matches(dict(new, modifiedTime="2020-01-01T00:00:00.000Z",
+                                                 createdTime="2026-10-02T00:00:00.000Z")))
+        # Listed files matched the query already, only their size is checked.
+        self.assertTrue(file_filter.matches(dict(new, mimeType="application/pdf"), listed=True))
+
+
+class TestFilteredCrawl(unittest.TestCase):
+    """The filters applied by the crawls of the fake Drive's uploads."""
+
+    def setUp(self):
+        self.drive = FakeDrive(latency=0)
+        _reset(self.drive)
+        ArgParser._governor = RequestGovernor(sleep=lambda s: None)
+        self.uploads = self.drive.add_folder(name="fan")
+        self.show = self.drive.add_folder(name="Show", parent_id=self.uploads)
+        self.drive.add_file("old.jpg", self.show)
+        self.drive.add_file("old.mp4", self.uploads, mime_type="video/mp4")
+        # The next item is a second later than every file above, and the files below later still.
+        self.since = parse_time(self.drive.items[self.drive.add_folder(name="Later")]['createdTime'])
+        self.drive.add_file("new.jpg", self.show, size=10)
+        self.drive.add_file("big.jpg", self.show, size=5000)
+        self.drive.add_file("new.pdf", self.uploads, mime_type="application/pdf", size=5000)
+
+    def _crawl(self, file_filter: FileFilter, crawl: str) -> list:
+        tree = ArgParser._get_files_folders_dict([{'id': self.uploads, 'name': "fan"}], crawl=crawl,
+                                                 file_filter=file_filter)
+        return _files(tree)
+
+    def test_filters(self):
+        for crawl in ("level", "single", "legacy"):
+            self.assertEqual(self._crawl(FileFilter(self.since), crawl), ["big.jpg", "new.jpg", "new.pdf"])
+            self.assertEqual(self._crawl(FileFilter(self.since, ["image/*"], min_size=1000), crawl), ["big.jpg"])
+            self.assertEqual(self._crawl(FileFilter(mime_types=["video/*"]), crawl), ["old.mp4"])
+
+    def test_only_matching_files_are_listed(self):
+        self._crawl(FileFilter(self.since, ["image/*"]), "level")
+        listed = [f for page in [self.drive.files().list(
+            q=ArgParser._children_query([self.uploads, self.show], file_filter=FileFilter(self.since, ["image/*"])),
+            fields="files(name)").execute()] for f in page['files']]
+        self.assertEqual(sorted(f['name'] for f in listed), ["Show", "big.jpg", "new.jpg"])
+
+    def test_filtered_stream(self):
+        records = list(ArgParser._iter_files_by_path({'id': self.uploads, 'name': "fan"},
+                                                     file_filter=FileFilter(self.since, min_size=1000)))
+        self.assertEqual(sorted((path, f['name']) for path, f in records),
+                         [((), "new.pdf"), (("Show",), "big.jpg")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from gdrive_sharing_manager.create.create import Create
+from gdrive_sharing_manager.main import parse_args
+from pathlib import Path
+from unittest import mock
+import logging
+import sys
+import tempfile
+import unittest
+
+
+class TestConfigDefaults(unittest.TestCase):
+    """Users and folder patterns given on the command line replace the configured ones."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.conf = Path(self.tmp.name).joinpath("config")
+        self.conf.write_text("[Primary]\n"
+                             "user = alice@example.com, bob@example.com\n"
+                             "\n"
+                             "[Create]\n"
+                             "only = 2026/*\n"
+                             "exclude = */Archive, */Old\n")
+        self.users_file = Path(self.tmp.name).joinpath("fans.txt")
+        self.users_file.write_text("carol@example.com\n# dave@example.com\n")
+
+    def tearDown(self):
+        logging.getLogger('gdrive-share').handlers.clear()
+        self.tmp.cleanup()
+
+    def _parse(self, *argv):
+        with mock.patch.object(sys, 'argv', ["gdrive-share", "-c", str(self.conf), "create", "-C", "creds.json",
+                                             *argv]):
+            args, _ = parse_args()
+        return args
+
+    def test_configured_users(self):
+        self.assertEqual(self._parse().users, ["alice@example.com", "bob@example.com"])
+
+    def test_users_replace_configured_users(self):
+        self.assertEqual(self._parse("-u", "carol@example.com").users, ["carol@example.com"])
+        self.assertEqual(self._parse("--users-file", str(self.users_file)).users, ["carol@example.com"])
+        self.assertEqual(self._parse("-u", "erin@example.com", "--users-file", str(self.users_file)).users,
+                         ["erin@example.com", "carol@example.com"])
+
+    def test_configured_patterns(self):
+        folder_filter = Create._get_folder_filter(self._parse())
+        self.assertEqual(folder_filter.only, [("2026", "*")])
+        self.assertEqual(folder_filter.exclude, [("*", "Archive"), ("*", "Old")])
+
+    def test_patterns_replace_configured_patterns(self):
+        folder_filter = Create._get_folder_filter(self._parse("--only", "2025"))
+        self.assertEqual(folder_filter.only, [("2025",)])
+        self.assertEqual(folder_filter.exclude, [("*", "Archive"), ("*", "Old")])
+        folder_filter = Create._get_folder_filter(self._parse("--exclude", "*/Drafts"))
+        self.assertEqual(folder_filter.only, [("2026", "*")])
+        self.assertEqual(folder_filter.exclude, [("*", "Drafts")])
+
+
+if __name__ == '__main__':
+    unittest.main()
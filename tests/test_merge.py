@@ -0,0 +1,83 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.checkpoint import MergeCheckpoints
+from gdrive_sharing_manager.throttle import RequestGovernor
+from gdrive_sharing_manager.merge.merge import Merge
+from tests.benchmark import _reset
+from tests.fake_drive import FakeDrive
+from argparse import Namespace
+from pathlib import Path
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+
+
+class TestStreamedIncrementalMerge(unittest.TestCase):
+    """Once there is a checkpoint, a streamed incremental merge copies the changes like any other merge."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.drive = FakeDrive(latency=0)
+        _reset(self.drive)
+        ArgParser._service_factory = lambda: self.drive
+        ArgParser._governor = RequestGovernor(sleep=lambda s: None)
+        self.source = {'id': self.drive.add_folder(name="Uploads"), 'name': "Uploads"}
+        self.dest = {'id': self.drive.add_folder(name="Library"), 'name': "Library"}
+        self.drive.add_folder(name="2026", parent_id=self.dest['id'])
+        self.uploads = self.drive.add_folder(name="fan@example.com", parent_id=self.source['id'])
+        self.year = self.drive.add_folder(name="2026", parent_id=self.uploads)
+        self.drive.add_file("first.jpg", self.year)
+        self.args = Namespace(creds=Path(self.tmp.name).joinpath("credentials.json"), stream=True, resume=False,
+                              incremental=True, crawl="level", crawl_batch=50, queue_size=100, since=None,
+                              mime=None, min_size=None)
+        self.checkpoints = MergeCheckpoints(Path(self.tmp.name).joinpath("merge_state.json"))
+
+    def tearDown(self):
+        ArgParser._service_factory = None
+        self.tmp.cleanup()
+
+    def _merge(self) -> str:
+        return Merge._merge_user(self.args, "fan@example.com", self.source, self.dest, {}, self.checkpoints)
+
+    def _merged(self) -> list:
+        year = self.drive.children_of(self.dest['id'], folders_only=True)[0]
+        return sorted(f['name'] for f in self.drive.children_of(year['id']))
+
+    def test_second_merge(self):
+        self.assertEqual(self._merge(), "ok")
+        self.assertEqual(self._merged(), ["first.jpg"])
+        # The first merge streamed everything, so there was no journal.
+        self.assertFalse(Path(self.tmp.name).joinpath("journals").exists())
+
+        self.drive.add_file("second.jpg", self.year)
+        self.assertEqual(self._merge(), "ok")
+        self.assertEqual(self._merged(), ["first.jpg", "second.jpg"])
+        self.assertTrue(Path(self.tmp.name).joinpath("journals").exists())
+
+
+class TestWritePlan(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_shared_folders_are_counted_once(self):
+        def entry(user: str) -> dict:
+            return {'user': user, 'folders': [{'path': ["New"], 'name': "New", 'parent_id': "library"},
+                                              {'path': ["New", user], 'name': user, 'parent_id': None}],
+                    'copies': [{'file': {'id': user, 'name': "a.jpg", 'size': "1024"}, 'path': ["New", user],
+                                'dest_id': None}]}
+        path = Path(self.tmp.name).joinpath("plan.json")
+        with contextlib.redirect_stdout(io.StringIO()):
+            Merge._write_plan(path, {'id': "uploads", 'name': "Uploads"}, {'id': "library", 'name': "Library"},
+                              {"fan": entry("fan"), "other": entry("other")})
+        with open(path) as f:
+            summary = json.load(f)['summary']
+        self.assertEqual(summary, {'folders': 3, 'files': 2, 'bytes': 2048})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+from gdrive_sharing_manager.argument_parser import ArgParser
+from gdrive_sharing_manager.throttle import TokenBucket, RequestGovernor
+from tests.benchmark import _reset
+from tests.fake_drive import FakeDrive
+from googleapiclient.errors import HttpError
+import unittest
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps on it."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_burst_then_rate(self):
+        # 100 requests per 100 seconds, with a burst of 2.
+        bucket = TokenBucket(100, capacity=2, clock=self.clock, sleep=self.clock.sleep)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertAlmostEqual(bucket.acquire(), 1.0)
+        self.assertAlmostEqual(self.clock.now, 1.0)
+
+    def test_refills_while_idle(self):
+        bucket = TokenBucket(100, capacity=2, clock=self.clock, sleep=self.clock.sleep)
+        bucket.acquire(2)
+        self.clock.now += 5
+        self.assertEqual(bucket.acquire(2), 0.0)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_large_cost_leaves_debt(self):
+        # A batch costing more than the capacity waits for a full bucket, and the next request pays the rest.
+        bucket = TokenBucket(100, capacity=10, clock=self.clock, sleep=self.clock.sleep)
+        self.assertEqual(bucket.acquire(50), 0.0)
+        self.assertAlmostEqual(bucket.acquire(), 41.0)
+
+
+class TestRequestGovernor(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.governor = RequestGovernor(max_retries=3, base_delay=1.0, max_delay=4.0, sleep=self.clock.sleep,
+                                        jitter=lambda low, high: 0.0)
+
+    def _failing(self, errors: list):
+        # A request that raises the given errors in turn and then succeeds.
+        calls = []
+
+        def request():
+            calls.append(None)
+            if len(errors) > 0:
+                raise errors.pop(0)
+            return "done"
+        return request, calls
+
+    def test_retries_throttling_and_server_errors(self):
+        for status, reason in ((429, "rateLimitExceeded"), (500, "backendError"), (503, ""),
+                               (403, "userRateLimitExceeded"), (403, "rateLimitExceeded")):
+            request, calls = self._failing([FakeDrive.http_error(status, reason)])
+            self.assertEqual(self.governor.call(request, "files.list"), "done")
+            self.assertEqual(len(calls), 2)
+        self.assertEqual(self.governor.events["files.list 429 rateLimitExceeded"], 1)
+        self.assertEqual(self.governor.events["files.list 403 userRateLimitExceeded"], 1)
+
+    def test_other_errors_are_raised(self):
+        for status, reason in ((403, "insufficientFilePermissions"), (404, "notFound"), (400, "invalid")):
+            request, calls = self._failing([FakeDrive.http_error(status, reason)])
+            with self.assertRaises(HttpError):
+                self.governor.call(request, "files.copy")
+            self.assertEqual(len(calls), 1)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_connection_errors_are_retried(self):
+        request, calls = self._failing([ConnectionError("reset"), TimeoutError("timed out")])
+        self.assertEqual(self.governor.call(request, "files.get"), "done")
+        self.assertEqual(len(calls), 3)
+
+    def test_exponential_backoff(self):
+        request, calls = self._failing([FakeDrive.http_error(429, "rateLimitExceeded")] * 4)
+        with self.assertRaises(HttpError):
+            self.governor.call(request, "files.list")
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(self.clock.sleeps, [1.0, 2.0, 4.0])
+        self.assertEqual(self.governor.backoff_time, 7.0)
+
+    def test_jitter(self):
+        governor = RequestGovernor(base_delay=1.0, sleep=self.clock.sleep, jitter=lambda low, high: high)
+        governor.backoff(2)
+        self.assertEqual(self.clock.sleeps, [5.0])
+
+    def test_rate_limit(self):
+        bucket = TokenBucket(100, capacity=1, clock=self.clock, sleep=self.clock.sleep)
+        governor = RequestGovernor(bucket, sleep=self.clock.sleep)
+        for _ in range(3):
+            governor.call(lambda: None, "files.get")
+        self.assertAlmostEqual(governor.rate_limited_time, 2.0)
+
+
+class TestBatchRetry(unittest.TestCase):
+    """Calls of a batch request that were throttled are sent again in a later batch."""
+
+    def setUp(self):
+        self.drive = FakeDrive(latency=0)
+        _reset(self.drive)
+        self.clock = FakeClock()
+        ArgParser._governor = RequestGovernor(max_retries=2, sleep=self.clock.sleep, jitter=lambda low, high: 0.0)
+        self.folder = self.drive.add_folder(name="Folder")
+        self.files = [self.drive.add_file(f"IMG_{i}.jpg", self.folder) for i in range(10)]
+        self.results = {}
+
+    def _requests(self, files: list = None) -> list:
+        def callback_for(file_id: str):
+            def callback(request_id, response, exception):
+                self.assertNotIn(file_id, self.results)
+                self.results[file_id] = exception
+            return callback
+        return [(self.drive.files().copy(fileId=f, body={'parents': [self.folder]}), callback_for(f))
+                for f in files or self.files]
+
+    def test_throttled_calls_are_retried(self):
+        self.drive.inject_errors(status=403, reason="userRateLimitExceeded", count=3, endpoint="files.copy",
+                                 after=4)
+        ArgParser._execute_batch(self._requests(), "files.copy")
+        self.assertEqual(self.results, {f: None for f in self.files})
+        self.assertEqual(self.drive.calls['batch'], 2)
+        self.assertEqual(self.drive.calls['files.copy'], 13)
+        self.assertEqual(self.clock.sleeps, [1.0])
+        self.assertEqual(self.drive.count(self.folder)['files'], 20)
+
+    def test_other_errors_are_reported(self):
+        self.drive.inject_errors(status=404, reason="notFound", endpoint="files.copy")
+        ArgParser._execute_batch(self._requests(), "files.copy")
+        self.assertEqual(self.drive.calls['batch'], 1)
+        self.assertEqual(sum(1 for e in self.results.values() if e is not None), 1)
+
+    def test_retries_run_out(self):
+        self.drive.inject_errors(status=429, reason="rateLimitExceeded", count=3, endpoint="files.copy")
+        ArgParser._execute_batch(self._requests(self.files[:1]), "files.copy")
+        self.assertEqual(self.drive.calls['batch'], 3)
+        self.assertIsInstance(self.results[self.files[0]], HttpError)
+        self.assertEqual(self.clock.sleeps, [1.0, 2.0])
+
+    def test_failed_batch(self):
+        self.drive.inject_errors(status=400, reason="badRequest", endpoint="batch")
+        ArgParser._execute_batch(self._requests(), "files.copy")
+        self.assertEqual(len(self.results), 10)
+        self.assertTrue(all(e is not None for e in self.results.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()